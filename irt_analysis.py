@@ -0,0 +1,163 @@
+#irt_analysis.py
+import numpy as np
+import pandas as pd
+import survey_analysis as sa
+
+# ---------------------------
+# Rasch (1PL) Model
+# ---------------------------
+# Score adjustment used to estimate abilities for all-correct / all-incorrect students.
+EXTREME_SCORE_ADJUSTMENT = 0.3
+MAX_STEP = 1.0
+
+def _trim_extremes(responses, observed):
+    """
+    Return (person_mask, item_mask) of the persons and items with
+    non-extreme scores, dropping extremes repeatedly until stable.
+    """
+    persons = observed.any(axis=1)
+    items = observed.any(axis=0)
+    while True:
+        sub_obs = observed & persons[:, None] & items[None, :]
+        sub_resp = np.where(sub_obs, responses, 0.0)
+        person_score, person_n = sub_resp.sum(axis=1), sub_obs.sum(axis=1)
+        item_score, item_n = sub_resp.sum(axis=0), sub_obs.sum(axis=0)
+        new_persons = persons & (person_score > 0) & (person_score < person_n)
+        new_items = items & (item_score > 0) & (item_score < item_n)
+        if (new_persons == persons).all() and (new_items == items).all():
+            return persons, items
+        persons, items = new_persons, new_items
+
+def _logit(p):
+    p = np.clip(p, 0.01, 0.99)
+    return np.log(p / (1 - p))
+
+def _solve_abilities(scores, observed, difficulty, theta, max_iter, tol):
+    """
+    Newton-Raphson for abilities given fixed item difficulties: solves
+    sum_i P(theta, b_i) = score for every student at once.
+    """
+    for _ in range(max_iter):
+        prob = 1 / (1 + np.exp(difficulty[None, :] - theta[:, None]))
+        expected = np.where(observed, prob, 0.0).sum(axis=1)
+        info = np.where(observed, prob * (1 - prob), 0.0).sum(axis=1)
+        step = np.clip((scores - expected) / np.maximum(info, 1e-10), -MAX_STEP, MAX_STEP)
+        theta = theta + step
+        if np.abs(step).max(initial=0) < tol:
+            break
+    return theta, 1 / np.sqrt(np.maximum(info, 1e-10))
+
+def fit_rasch(responses, max_iter=200, tol=1e-4):
+    """
+    Fit a Rasch (1PL) model by joint maximum likelihood.
+
+    responses is a students x items matrix (or DataFrame) of 1/0 with NaN for
+    missing responses; missing cells are left out of the likelihood. Each
+    iteration updates all abilities and then all difficulties with one
+    vectorized Newton step. Students and items with extreme scores are left
+    out of the calibration; extreme students then get abilities for scores
+    adjusted by EXTREME_SCORE_ADJUSTMENT. Difficulties are centred on 0 and
+    scaled by (k - 1) / k to reduce the JML bias.
+
+    Returns a dict with:
+      - "difficulty", "difficulty_se": per item (NaN for extreme items).
+      - "ability", "ability_se": per student (NaN for students with no responses).
+      - "iterations", "converged".
+    """
+    responses = np.asarray(responses, dtype=float)
+    observed = ~np.isnan(responses)
+    filled = np.where(observed, responses, 0.0)
+    n_persons, n_items = responses.shape
+
+    persons, items = _trim_extremes(responses, observed)
+    x = filled[persons][:, items]
+    obs = observed[persons][:, items]
+    n_person_items = obs.sum(axis=1)
+    n_item_persons = obs.sum(axis=0)
+
+    theta = _logit(x.sum(axis=1) / np.maximum(n_person_items, 1))
+    b = -_logit(x.sum(axis=0) / np.maximum(n_item_persons, 1))
+    b -= b.mean() if b.size else 0
+    converged = False
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        prob = 1 / (1 + np.exp(b[None, :] - theta[:, None]))
+        resid = np.where(obs, x - prob, 0.0)
+        info = np.where(obs, prob * (1 - prob), 0.0)
+        theta_step = np.clip(resid.sum(axis=1) / np.maximum(info.sum(axis=1), 1e-10), -MAX_STEP, MAX_STEP)
+        theta = theta + theta_step
+
+        prob = 1 / (1 + np.exp(b[None, :] - theta[:, None]))
+        resid = np.where(obs, x - prob, 0.0)
+        info = np.where(obs, prob * (1 - prob), 0.0)
+        b_step = np.clip(-resid.sum(axis=0) / np.maximum(info.sum(axis=0), 1e-10), -MAX_STEP, MAX_STEP)
+        b = b + b_step
+        b -= b.mean()
+        if max(np.abs(theta_step).max(initial=0), np.abs(b_step).max(initial=0)) < tol:
+            converged = True
+            break
+
+    difficulty = np.full(n_items, np.nan)
+    difficulty_se = np.full(n_items, np.nan)
+    if items.any():
+        prob = 1 / (1 + np.exp(b[None, :] - theta[:, None]))
+        item_info = np.where(obs, prob * (1 - prob), 0.0).sum(axis=0)
+        n_calibrated = items.sum()
+        difficulty[items] = b * (n_calibrated - 1) / n_calibrated
+        difficulty_se[items] = 1 / np.sqrt(np.maximum(item_info, 1e-10))
+
+    # Abilities for every student with responses, against the calibrated items.
+    answered = observed[:, items]
+    scores = filled[:, items].sum(axis=1)
+    n_answered = answered.sum(axis=1)
+    adjusted = np.clip(scores, EXTREME_SCORE_ADJUSTMENT, n_answered - EXTREME_SCORE_ADJUSTMENT)
+    start = _logit(adjusted / np.maximum(n_answered, 1))
+    ability, ability_se = _solve_abilities(adjusted, answered, difficulty[items], start, max_iter, tol)
+    has_responses = n_answered > 0
+    ability = np.where(has_responses, ability, np.nan)
+    ability_se = np.where(has_responses, ability_se, np.nan)
+
+    return {
+        "difficulty": difficulty,
+        "difficulty_se": difficulty_se,
+        "ability": ability,
+        "ability_se": ability_se,
+        "iterations": iteration,
+        "converged": converged
+    }
+
+def rasch_analysis(df, ids, printText=True):
+    """
+    Calibrate the items in `ids` (e.g. sa.numeracy_ids, sa.eng_reading_item_ids)
+    with a Rasch model.
+
+    Returns a dict with:
+      - "items": DataFrame indexed by item ID with difficulty, se, responses
+        (number answered) and p_value (proportion correct).
+      - "persons": DataFrame aligned with df with ability, se, score and
+        items_answered.
+      - "iterations", "converged": from fit_rasch.
+    """
+    responses = sa.encode_responses(df, ids)
+    fit = fit_rasch(responses)
+    observed = ~np.isnan(responses)
+    answered = observed.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_values = np.nansum(responses, axis=0) / answered
+
+    items = pd.DataFrame({
+        "difficulty": fit["difficulty"],
+        "se": fit["difficulty_se"],
+        "responses": answered,
+        "p_value": p_values
+    }, index=pd.Index(ids, name="item"))
+    persons = pd.DataFrame({
+        "ability": fit["ability"],
+        "se": fit["ability_se"],
+        "score": np.nansum(responses, axis=1),
+        "items_answered": observed.sum(axis=1)
+    }, index=df.index)
+
+    if printText:
+        print("Rasch calibration complete (%d iterations)." % fit["iterations"])
+    return {"items": items, "persons": persons, "iterations": fit["iterations"], "converged": fit["converged"]}
@@ -0,0 +1,107 @@
+#item_analysis.py
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import survey_analysis as sa
+import survey_cache as sc
+
+ITEM_STAT_COLUMNS = ["item", "students", "answered", "missing_rate", "p_value", "point_biserial"]
+
+# ---------------------------
+# Item Statistics
+# ---------------------------
+def item_statistics(df, ids, by=None):
+    """
+    Compute classical item statistics for every item in `ids`, per group.
+
+    For each (group, item): number of students, number who answered,
+    missing rate, p-value (proportion correct among those who answered) and
+    the point-biserial correlation between the item and the rest score
+    (number correct on the other items). `by` is a list of grouping columns
+    such as ["school", "grade"]; None gives one overall row per item.
+
+    All items and groups are computed together: the encoded response matrix
+    is expanded into the sufficient sums (n, sum x, sum r, sum r^2, sum x*r)
+    and reduced per group in one grouped sum.
+    """
+    by = list(by or [])
+    responses = sa.encode_responses(df, ids)
+    observed = ~np.isnan(responses)
+    x = np.where(observed, responses, 0.0)
+    n_items = len(ids)
+
+    # Rest score of every student for every item, only where the item was answered.
+    rest = np.where(observed, x.sum(axis=1, keepdims=True) - x, 0.0)
+    sums = np.hstack([np.ones((len(df), 1)), observed, x, rest, rest**2, x * rest])
+
+    if by:
+        grouped = pd.DataFrame(sums, index=df.index).groupby([df[col] for col in by], observed=True).sum()
+        keys = grouped.index.to_frame(index=False)
+        sums = grouped.to_numpy()
+    else:
+        keys = pd.DataFrame(index=[0])
+        sums = sums.sum(axis=0, keepdims=True)
+
+    students = sums[:, :1]
+    blocks = sums[:, 1:].reshape(len(sums), 5, n_items)
+    answered, sum_x, sum_r, sum_rr, sum_xr = (blocks[:, i] for i in range(5))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_value = sum_x / answered
+        cov = answered * sum_xr - sum_x * sum_r
+        var_x = answered * sum_x - sum_x**2
+        var_r = answered * sum_rr - sum_r**2
+        point_biserial = cov / np.sqrt(var_x * var_r)
+
+    stats = pd.DataFrame({
+        "item": np.tile(ids, len(keys)),
+        "students": np.repeat(students[:, 0], n_items).astype(int),
+        "answered": answered.ravel().astype(int),
+        "missing_rate": (1 - answered / students).ravel(),
+        "p_value": p_value.ravel(),
+        "point_biserial": point_biserial.ravel()
+    })
+    if by:
+        stats = pd.concat([keys.loc[keys.index.repeat(n_items)].reset_index(drop=True), stats], axis=1)
+    return stats
+
+@sc.memoized
+def plot_item_statistics(df, ids, title, width=800):
+    """
+    Create Plotly figures for the item analysis view.
+
+    Returns a dictionary with:
+      - "table": overall item statistics.
+      - "fig_items": p-value per item, coloured by point-biserial correlation.
+      - "fig_schools": heatmap of p-values by school and item.
+      - "fig_grades": heatmap of p-values by grade and item.
+    """
+    overall = item_statistics(df, ids)
+    fig_items = px.bar(
+        overall,
+        x="item",
+        y="p_value",
+        color="point_biserial",
+        color_continuous_scale="RdYlGn",
+        range_color=(-0.2, 0.8),
+        hover_data={"answered": True, "missing_rate": ":.1%", "point_biserial": ":.2f", "p_value": ":.2f"},
+        title=f"{title}: Item Difficulty (p-value) and Discrimination"
+    )
+    fig_items = sa.update_common_layout(fig_items, f"{title}: Item Difficulty (p-value) and Discrimination",
+                                        y_range=(0, 1.05), width=width)
+
+    figures = {"table": overall, "fig_items": fig_items}
+    for key, col, label in [("fig_schools", "school", "School"), ("fig_grades", "grade", "Grade")]:
+        by_group = item_statistics(df, ids, by=[col])
+        grid = by_group.pivot(index=col, columns="item", values="p_value").reindex(columns=ids)
+        fig = px.imshow(
+            grid,
+            color_continuous_scale="RdYlGn",
+            zmin=0,
+            zmax=1,
+            aspect="auto",
+            labels={"x": "Item", "y": label, "color": "p-value"},
+            title=f"{title}: p-value by {label}"
+        )
+        fig.update_layout(template='plotly_white', margin=dict(l=20, r=20, t=60, b=20))
+        figures[key] = fig
+    return figures
@@ -0,0 +1,512 @@
+#offline_servers.py
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import survey_analysis as sa
+import survey_cache as sc
+import survey_store as ss
+import survey_dashboard as sd
+
+INGEST_PORT = 8502
+FOLD_INTERVAL = 5.0      # seconds between folds of pending records into the dataset
+FOLD_BATCH = 5000        # fold early once this many records are pending
+MAX_BODY_BYTES = 64 << 20
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Write-Ahead Log
+# ---------------------------
+class IngestionLog:
+    """
+    Append-only log of accepted submissions, one JSON line per batch with
+    a sequence number. A batch is on disk (fsync) before it is
+    acknowledged, so records survive a crash until they are folded into
+    the dataset; folded batches are then dropped with truncate().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.seq = max((seq for seq, _ in self.replay()), default=0)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, records, device=None):
+        """Write a batch and return its sequence number."""
+        with self.lock:
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "device": device, "received": time.time(), "records": records})
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            return self.seq
+
+    def replay(self):
+        """(seq, records) of every batch in the log, oldest first. A torn last line is skipped."""
+        if not os.path.exists(self.path):
+            return []
+        batches = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                batches.append((entry["seq"], entry["records"]))
+        return batches
+
+    def truncate(self, through_seq):
+        """Drop the batches up to and including `through_seq`, keeping later ones."""
+        with self.lock:
+            self._file.close()
+            with open(self.path, encoding="utf-8") as f:
+                kept = [line for line in f if (_line_seq(line) or 0) > through_seq]
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                f.writelines(kept)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.path + ".tmp", self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self.lock:
+            self._file.close()
+
+def _line_seq(line):
+    try:
+        return json.loads(line)["seq"]
+    except (json.JSONDecodeError, KeyError):
+        return None
+
+# ---------------------------
+# Ingestion
+# ---------------------------
+class Ingestor:
+    """
+    Receives survey records for one CSV dataset. Submissions are deduplicated
+    on anon_id (against the dataset and everything received so far), logged
+    to the write-ahead log and acknowledged; a background thread folds the
+    pending records into the CSV, its columnar copy and its stored rollup
+    (see ss.append_dataset) every FOLD_INTERVAL seconds or FOLD_BATCH
+    records, touching only the new rows.
+    """
+    def __init__(self, filepath, log_path=None, fold_interval=FOLD_INTERVAL, fold_batch=FOLD_BATCH):
+        self.filepath = filepath
+        self.fold_interval = fold_interval
+        self.fold_batch = fold_batch
+        self.lock = threading.Lock()
+        self.fold_lock = threading.Lock()
+        self.stats = {"accepted": 0, "duplicates": 0, "rejected": 0, "folded": 0, "folds": 0}
+
+        if "anon_id" not in pd.read_csv(filepath, nrows=0).columns:
+            raise ValueError(f"{filepath} has no anon_id column to deduplicate submissions on")
+        self.seen = set(pd.read_csv(filepath, usecols=["anon_id"], dtype=str)["anon_id"].dropna())
+        self.log = IngestionLog(log_path or os.path.splitext(filepath)[0] + ".wal")
+
+        # Batches logged but not folded before the last shutdown; records
+        # already in the CSV (folded before a crash) are dropped as duplicates.
+        self.pending = []
+        for seq, records in self.log.replay():
+            records = [record for record in records if record["anon_id"] not in self.seen]
+            self.seen.update(record["anon_id"] for record in records)
+            self.pending.append((seq, records))
+        self.n_pending = sum(len(records) for _, records in self.pending)
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._fold_loop, name="ingest-fold", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the fold thread after folding whatever is pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.fold()
+        self.log.close()
+
+    def submit(self, records, device=None):
+        """
+        Accept a batch of records (dicts keyed by CSV column). Returns counts
+        of accepted, duplicate and rejected (no anon_id) records.
+        """
+        accepted, duplicates, rejected = [], 0, 0
+        with self.lock:
+            for record in records:
+                anon_id = record.get("anon_id") if isinstance(record, dict) else None
+                if anon_id in (None, ""):
+                    rejected += 1
+                elif str(anon_id) in self.seen:
+                    duplicates += 1
+                else:
+                    record["anon_id"] = str(anon_id)
+                    self.seen.add(record["anon_id"])
+                    accepted.append(record)
+            if accepted:
+                # Logged under the lock, so log order matches pending order.
+                self.pending.append((self.log.append(accepted, device), accepted))
+                self.n_pending += len(accepted)
+            self.stats["accepted"] += len(accepted)
+            self.stats["duplicates"] += duplicates
+            self.stats["rejected"] += rejected
+        if self.n_pending >= self.fold_batch:
+            self._wake.set()
+        return {"accepted": len(accepted), "duplicates": duplicates, "rejected": rejected}
+
+    def fold(self):
+        """Fold every pending record into the dataset. Returns the number folded."""
+        with self.fold_lock:
+            with self.lock:
+                batches, self.pending, self.n_pending = self.pending, [], 0
+            records = [record for _, records in batches for record in records]
+            if not records:
+                return 0
+            try:
+                # Ids were checked against the dataset and each other on submit.
+                ss.append_dataset(self.filepath, pd.DataFrame.from_records(records), deduplicated=True)
+            except Exception:
+                # Keep the records pending (they are still in the log) and retry on the next fold.
+                with self.lock:
+                    self.pending[:0] = batches
+                    self.n_pending += len(records)
+                raise
+            self.log.truncate(batches[-1][0])
+            with self.lock:
+                self.stats["folded"] += len(records)
+                self.stats["folds"] += 1
+            return len(records)
+
+    def status(self):
+        with self.lock:
+            return {"dataset": self.filepath, "pending": self.n_pending, "known_ids": len(self.seen), **self.stats}
+
+    def _fold_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.fold_interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                try:
+                    self.fold()
+                except Exception:
+                    logger.exception("Fold into %s failed, will retry", self.filepath)
+
+# ---------------------------
+# HTTP Server
+# ---------------------------
+class IngestionHandler(BaseHTTPRequestHandler):
+    """
+    POST /submissions  body: {"device": ..., "records": [...]} or a bare list of
+                       records, as JSON, optionally gzip-compressed
+                       (Content-Encoding: gzip)
+    POST /fold         fold pending records now (500 with the error if it fails)
+    GET  /status       counters and pending records
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if self.path == "/submissions":
+            try:
+                payload = self._read_json()
+            except ValueError as exc:
+                return self._send(400, {"error": str(exc)})
+            records = payload.get("records") if isinstance(payload, dict) else payload
+            if not isinstance(records, list):
+                return self._send(400, {"error": "Expected a list of records."})
+            device = payload.get("device") if isinstance(payload, dict) else None
+            return self._send(200, self.server.ingestor.submit(records, device))
+        if self.path == "/fold":
+            try:
+                folded = self.server.ingestor.fold()
+            except Exception as exc:  # records stay pending and are retried on the next fold
+                logger.exception("Fold into %s failed", self.server.ingestor.filepath)
+                return self._send(500, {"error": f"Fold failed: {type(exc).__name__}: {exc}"})
+            return self._send(200, {"folded": folded})
+        self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_GET(self):
+        if self.path == "/status":
+            return self._send(200, self.server.ingestor.status())
+        self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            raise ValueError("Submission too large.")
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except OSError as exc:
+                raise ValueError(f"Invalid gzip body: {exc}")
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON: {exc}")
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # one line per request is too chatty at sync bursts
+        pass
+
+class IngestionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, ingestor):
+        super().__init__(address, IngestionHandler)
+        self.ingestor = ingestor
+
+def serve_ingestion(filepath, host="0.0.0.0", port=INGEST_PORT, fold_interval=FOLD_INTERVAL):
+    """Run the ingestion server for a CSV dataset until interrupted."""
+    ingestor = Ingestor(filepath, fold_interval=fold_interval).start()
+    server = IngestionServer((host, port), ingestor)
+    print(f"Ingesting into {filepath} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ingestor.stop()
+
+# ---------------------------
+# Query API
+# ---------------------------
+QUERY_PORT = 8503
+DATA_CHECK_INTERVAL = 1.0    # seconds a dataset's fingerprint is trusted before re-reading it
+RESPONSE_CACHE_SIZE = 4096   # responses kept in memory
+RETRY_AFTER = 2              # seconds a client is asked to wait while a dataset's aggregates are updated
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+class QueryAPI:
+    """
+    Read-only HTTP API over the aggregates stored with each dataset's
+    columnar copy (see ss.stored_aggregate), serving the numbers the
+    dashboard shows without recomputing them from records:
+
+    GET /datasets
+    GET /schools?dataset=NAME
+    GET /competencies?dataset=NAME[&schools=A,B][&dimensions=gender,grade]
+                     [&domains=numeracy][&competencies=foundational_numeracy]
+    GET /rollup?dataset=NAME[&project=P[&district=D[&school=S]]]
+
+    List parameters take comma-separated or repeated values. Responses are
+    JSON with an ETag; a request whose If-None-Match matches gets 304.
+    Response bodies are cached per (dataset fingerprint, path, query), so a
+    repeated query is a dictionary lookup, and new data (e.g. folded by the
+    ingestion server) is picked up within DATA_CHECK_INTERVAL seconds.
+
+    The API never builds or writes anything: a dataset whose aggregates
+    have not been built (see `offline_servers.py build`) answers 404, and
+    one whose aggregates are out of date or being updated answers 503
+    with Retry-After.
+    """
+    def __init__(self, datasets, cache_size=RESPONSE_CACHE_SIZE):
+        self.datasets = dict(datasets)
+        self.cache_size = cache_size
+        self._tables = {}
+        self._loading = {}
+        self._responses = OrderedDict()
+
+    async def tables(self, name):
+        """
+        Aggregates of a dataset, reloaded off the event loop when its data
+        changed. Raises FileNotFoundError when they were never built and
+        returns None while they are out of date.
+        """
+        entry = self._tables.get(name)
+        if entry is not None and time.monotonic() - entry["checked"] < DATA_CHECK_INTERVAL:
+            return entry
+        lock = self._loading.setdefault(name, asyncio.Lock())
+        async with lock:
+            entry = self._tables.get(name)
+            if entry is not None and time.monotonic() - entry["checked"] < DATA_CHECK_INTERVAL:
+                return entry
+            path = self.datasets[name]
+            fingerprint = await asyncio.to_thread(ss.stored_fingerprint, path)
+            if fingerprint is not None and (entry is None or entry["fingerprint"] != fingerprint):
+                tables = await asyncio.to_thread(
+                    lambda: {table: ss.stored_aggregate(path, table, fingerprint) for table in ss.AGGREGATES})
+                entry = None if any(table is None for table in tables.values()) else {"fingerprint": fingerprint, **tables}
+            if fingerprint is None or entry is None:
+                self._tables.pop(name, None)
+                return None
+            entry["checked"] = time.monotonic()
+            self._tables[name] = entry
+            return entry
+
+    async def respond(self, method, target, headers):
+        """(status, headers, body) for one request."""
+        if method not in ("GET", "HEAD"):
+            return self._error(405, f"Method {method} not allowed")
+        url = urlsplit(target)
+        query = {key: [v for value in values for v in value.split(",") if v]
+                 for key, values in parse_qs(url.query).items()}
+        if url.path == "/datasets":
+            return self._json(200, {"datasets": sorted(self.datasets)})
+        if url.path not in ("/schools", "/competencies", "/rollup"):
+            return self._error(404, f"Unknown path {url.path}")
+        name = (query.get("dataset") or [None])[0]
+        if name not in self.datasets:
+            return self._error(400, f"Unknown dataset: {name}")
+        try:
+            entry = await self.tables(name)
+        except FileNotFoundError as exc:
+            return self._error(404, f"No aggregates for dataset {name}: {exc}")
+        if entry is None:
+            status, error_headers, body = self._error(503, f"Aggregates of dataset {name} are being updated")
+            return status, {**error_headers, "Retry-After": str(RETRY_AFTER)}, body
+
+        key = (entry["fingerprint"], url.path, tuple(sorted((k, tuple(sorted(v))) for k, v in query.items())))
+        cached = self._responses.get(key)
+        if cached is None:
+            try:
+                status, body = 200, self._encode({"dataset": name, **self.query(url.path, entry, query)})
+            except ValueError as exc:
+                return self._error(400, str(exc))
+            cached = (f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body)
+            self._responses[key] = cached
+            while len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
+        else:
+            self._responses.move_to_end(key)
+        etag, body = cached
+        response_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            return 304, response_headers, b""
+        return 200, {**response_headers, "Content-Type": "application/json"}, body
+
+    def query(self, path, entry, query):
+        """Answer a query from a dataset's aggregates as a JSON-ready dict."""
+        rollup, breakdowns = entry["rollup"], entry["breakdowns"]
+        if path == "/schools":
+            schools = rollup[rollup["level"] == "school"].drop_duplicates("school")
+            return {"schools": self._records(schools[["school", "project", "district", "total"]])}
+        if path == "/competencies":
+            dimensions = query.get("dimensions")
+            unknown = set(dimensions or []) - set(["overall"] + list(sa.BREAKDOWN_DIMENSIONS))
+            if unknown:
+                raise ValueError(f"Unknown dimensions: {sorted(unknown)}")
+            results = sa.cube_results(breakdowns, query.get("schools"), dimensions,
+                                      query.get("domains"), query.get("competencies"))
+            return {"results": self._records(results)}
+        node = {level: (query.get(level) or [None])[0] for level in sa.ROLLUP_LEVELS}
+        children = sa.rollup_children(rollup, node["project"], node["district"]) if node["school"] is None else rollup[:0]
+        return {"node": self._records(sa.rollup_node(rollup, **node)), "children": self._records(children)}
+
+    @staticmethod
+    def _records(table):
+        return json.loads(table.to_json(orient="records"))
+
+    @staticmethod
+    def _encode(data):
+        return json.dumps(data, separators=(",", ":")).encode()
+
+    def _json(self, status, data):
+        return status, {"Content-Type": "application/json"}, self._encode(data)
+
+    def _error(self, status, message):
+        return self._json(status, {"error": message})
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection (HTTP/1.1 keep-alive)."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        field, value = line.split(":", 1)
+                        headers[field.strip().lower()] = value.strip()
+                if int(headers.get("content-length", 0) or 0):
+                    await reader.readexactly(int(headers["content-length"]))
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except Exception as exc:  # report and keep serving
+                    status, response_headers, body = self._error(500, repr(exc))
+                keep_alive = version.strip() == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                         f"Content-Length: {len(body)}",
+                         f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                lines += [f"{field}: {value}" for field, value in response_headers.items()]
+                writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+async def serve_queries(datasets, host="0.0.0.0", port=QUERY_PORT):
+    """Run the query API for {name: CSV path} datasets until cancelled."""
+    api = QueryAPI(datasets)
+    server = await asyncio.start_server(api.handle, host, port, backlog=1024)
+    print(f"Serving queries for {', '.join(sorted(datasets))} on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local servers for survey data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="receive records synced from field tablets")
+    ingest.add_argument("dataset", help="CSV dataset that synced records are appended to")
+    ingest.add_argument("--host", default="0.0.0.0")
+    ingest.add_argument("--port", type=int, default=INGEST_PORT)
+    ingest.add_argument("--fold-interval", type=float, default=FOLD_INTERVAL)
+    query = commands.add_parser("query", help="answer competency queries over HTTP")
+    query.add_argument("datasets", nargs="+", metavar="NAME=CSV", help="datasets to serve, by name")
+    query.add_argument("--host", default="0.0.0.0")
+    query.add_argument("--port", type=int, default=QUERY_PORT)
+    build = commands.add_parser("build", help="build the columnar copies and aggregates the query API serves")
+    build.add_argument("datasets", nargs="+", metavar="CSV", help="CSV datasets to build")
+    warm = commands.add_parser("warm", help="prepare the dashboard's default views before starting it")
+    warm.add_argument("datasets", nargs="+", metavar="CSV", help="CSV datasets to prepare")
+    warm.add_argument("--results", default=sd.RESULT_STORE_PATH, help="result store the dashboard reads")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.command == "ingest":
+        serve_ingestion(args.dataset, args.host, args.port, args.fold_interval)
+    elif args.command == "build":
+        for path in args.datasets:
+            for name in ss.AGGREGATES:
+                ss.load_aggregate(path, name)
+            print(f"Built aggregates of {path}")
+    elif args.command == "warm":
+        sc.enable_memoization(store=ss.ResultStore(args.results))
+        for path in args.datasets:
+            sd.warm_up(path)
+            print(f"Prepared the dashboard's default view of {path}")
+    else:
+        datasets = dict(item.split("=", 1) for item in args.datasets)
+        try:
+            asyncio.run(serve_queries(datasets, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
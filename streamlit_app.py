@@ -1,6 +1,13 @@
 # streamlit_app.py
+import threading
+import warnings
 import streamlit as st
 import survey_analysis as sa
+import survey_cache as sc
+import item_analysis as ia
+import survey_store as ss
+import survey_jobs as sj
+import survey_dashboard as sd
 import pandas as pd
 import plotly.express as px
 
@@ -34,164 +41,128 @@ DATASET_CONFIG = {
     }
 }
 
+# Analyses and figures are memoized, keyed by the data they are computed from, so
+# sessions viewing the same selection share them (see CACHE WARM-UP). Besides the
+# in-memory cache of each server process, they are kept in a result store on disk
+# that every worker process shares and that survives restarts and deployments.
+MEMO_SIZE = 256
+
+@st.cache_resource
+def result_store():
+    """Disk-backed result store (see ss.ResultStore), opened once per server process."""
+    return ss.ResultStore(sd.RESULT_STORE_PATH)
+
+sc.enable_memoization(MEMO_SIZE, store=result_store())
+
 # -------------------------
 # SCHOOL METADATA (Add location and project info)
 # -------------------------
-SCHOOL_METADATA = {
-    # EAST Project schools
-    "Nepal Rastriya Secondary School": {
-        "address": "Khajura 8",
-        "district": "Surkhet",
-        "project": "EAST"
-    },
-    "Chhabi Basic School": {
-        "address": "Kalagaun 4",
-        "district": "Surkhet",
-        "project": "EAST"
-    },
-    "Janajagrit Basic School": {
-        "address": "Padampur 12",
-        "district": "Surkhet",
-        "project": "EAST"
-    },
-    "Janajagriti Basic School - Pyusey": {
-        "address": "Narayan 3, Pyusey",
-        "district": "Dailekh",
-        "project": "EAST"
-    },
-    "Navadurga Basic School": {
-        "address": "Narayan 5, Chhatikot",
-        "district": "Dailekh",
-        "project": "EAST"
-    },
-    "Raina Devi Basic School": {
-        "address": "Narayan 11, Kanda",
-        "district": "Dailekh",
-        "project": "EAST"
-    },
-    # LLEST Project schools
-    "Ghami Basic Solar School": {
-        "address": "Ghami",
-        "district": "Mustang",
-        "project": "LLEST"
-    },
-    "Siddhartha Kula Basic School": {
-        "address": "Nilung, Tinje, Dolpo",
-        "district": "Dolpo",
-        "project": "LLEST"
-    },
-    "Minnath Adarsha Basic School": {
-        "address": "Tangal",
-        "district": "Lalitpur",
-        "project": "LLEST"
-    },
-    "Janta Basic School": {
-        "address": "Santanagar, Dhangadimai",
-        "district": "Dhangadimai",
-        "project": "LLEST"
-    },
-    "Secondary School": {
-        "address": "Basabitti 22, Janakpurdham",
-        "district": "Janakpurdham",
-        "project": "LLEST"
-    }
-}
+# {school: {"address", "district", "project"}}, from the school dimension table in survey_analysis
+SCHOOL_METADATA = sa.school_metadata()
 
 # -------------------------
-# LOAD DATA (CACHED)
+# LOAD DATA (SHARED ACROSS SESSIONS)
 # -------------------------
+@st.cache_resource
+def load_store(filepath, partitions=None, fingerprint=None):
+    """
+    Load and clean a dataset once per server process. Every session reads the
+    same read-only store instead of unpickling its own copy of the data.
+    Only sd.DASHBOARD_COLUMNS of the school partitions in `partitions` (all when
+    None) are read, from the dataset's columnar copy. `fingerprint` (see
+    dataset_fingerprint) keys the cache on the data itself, so an updated
+    CSV is reloaded.
+    """
+    df = sd.load_frame(filepath, partitions)
+    return ss.SurveyStore(df, name=filepath, copy=False, fingerprint=fingerprint)
+
+def dataset_fingerprint(filepath, partitions=None):
+    """Fingerprint of the dashboard columns of a dataset, read from its columnar copy's metadata."""
+    return ss.dataset_fingerprint(filepath, sd.DASHBOARD_COLUMNS, partitions)
+
 @st.cache_data
-def load_data_cached(filepath):
-    """Load raw data from CSV - this is cached for performance"""
-    return sa.load_data(filepath)
+def load_catalog(filepath, fingerprint=None):
+    """
+    School partitions of a dataset (raw name in 'value') with cleaned school
+    names and row counts, cached per version of the data (see load_store).
+    """
+    catalog = ss.partition_table(filepath)
+    catalog["school"] = catalog["value"]
+    return sd.clean_school_names(catalog)
 
-# -------------------------
-# DATA CLEANING HELPERS (NOT CACHED)
-# -------------------------
-def clean_school_names(df):
-    """Clean and standardize school names to avoid duplicates"""
-    
-    # First, strip whitespace
-    df['school'] = df['school'].str.strip()
-    
-    # Map ALL variations found in the actual data to standard names
-    school_name_mapping = {
-        # Chhabi Basic School variations
-        'Chhabi Basic School- Kalagaun 4 Surkhet': 'Chhabi Basic School',
-        'Chhabi Basic School - Kalagaun 4 Surkhet': 'Chhabi Basic School',
-        
-        # Ghami Basic Solar School variations
-        'Ghami Solar Basic School': 'Ghami Basic Solar School',
-        
-        # Janajagrit Basic School variations (Surkhet)
-        'Janajagrit Basic School - Padampur 12 Surkhet': 'Janajagrit Basic School',
-        'Janajagrit Basic School- Padampur 12 Surkhet': 'Janajagrit Basic School',
-        
-        # Janajagriti Basic School variations (Dailekh - note different spelling)
-        'JANAJAGRITI BASIC SCHOOL, NARAYAN 3, PYUSEY, DAILEKH': 'Janajagriti Basic School - Pyusey',
-        'Janajagriti Basic School, Narayan 3, Pyusey, Dailekh': 'Janajagriti Basic School - Pyusey',
-        
-        # Janta Basic School variations
-        'Janta Aa Vi Santanagar Dhangadimai': 'Janta Basic School',
-        'Janta Basic School, Santanagar, Dhangadimai': 'Janta Basic School',
-        
-        # Minnath Adarsha Basic School variations
-        'Minnath Adarsha Basic School LMC': 'Minnath Adarsha Basic School',
-        
-        # Navadurga Basic School variations
-        'NAVADURGA BASIC SCHOOL, NARAYAN 5, CHHATIKOT, DAILEKH': 'Navadurga Basic School',
-        
-        # Nepal Rastriya Secondary School variations
-        'Nepal Rastriya Secondary School - Khajura 8 Surkhet': 'Nepal Rastriya Secondary School',
-        'Nepal Rastriya Secondary School- Khajura 8 Surkhet': 'Nepal Rastriya Secondary School',
-        'Nepal Rastriya Secondary School-Khajura 8 Surkhet': 'Nepal Rastriya Secondary School',
-        
-        # Raina Devi Basic School variations
-        'RAINA DEVI BASIC SCHOOL, NARAYAN 11, KANDA, DAILEKH': 'Raina Devi Basic School',
-        
-        # Secondary School variations (Janakpurdham)
-        'Ma vi Basabitti janakpurdham - 22': 'Secondary School',
-    }
-    
-    # Apply exact string replacement
-    df['school'] = df['school'].replace(school_name_mapping)
-    
-    return df
+@st.cache_resource
+def load_cube(filepath, fingerprint=None):
+    """
+    Competency counts for every project, district and school of a dataset
+    (see sa.rollup_cube) for drill-down, read once per server process (and
+    version of the data, see load_store) from the rollup stored with the
+    columnar copy, which the ingestion server keeps up to date.
+    """
+    return ss.load_rollup(filepath)
 
-def clean_grade_values(df):
-    """Clean and standardize grade values to avoid duplicates"""
-    if 'grade' in df.columns:
-        # Strip whitespace and convert to string
-        df['grade'] = df['grade'].astype(str).str.strip()
-        
-        # Standardize grade format (remove 'Grade ' prefix if present)
-        df['grade'] = df['grade'].str.replace('Grade ', '', case=False, regex=False)
-        df['grade'] = df['grade'].str.replace('grade ', '', case=False, regex=False)
-        
-        # Remove any extra spaces
-        df['grade'] = df['grade'].str.strip()
-        
-        # Handle common variations
-        grade_mapping = {
-            'class 1': '1',
-            'class 2': '2',
-            'class 3': '3',
-            'class 4': '4',
-            'class 5': '5',
-            'class 6': '6',
-            'class 7': '7',
-            'class 8': '8',
-        }
-        
-        df['grade'] = df['grade'].str.lower().replace(grade_mapping).str.strip()
-    
-    return df
+@st.cache_resource
+def job_queue():
+    """Background job queue (see survey_jobs) shared by every session of this server process."""
+    return sj.JobQueue()
+
+@st.cache_data(max_entries=32)
+def job_result(job_id):
+    """Result of a finished job, read once from the job store (results never change for a job id)."""
+    return job_queue().result(job_id)
+
+def selected_partitions(catalog, schools):
+    """Partitions holding the selected schools, or None when every partition is needed."""
+    if not schools or set(schools) >= set(catalog['school']):
+        return None
+    return tuple(sorted(catalog.loc[catalog['school'].isin(schools), 'value']))
 
 # -------------------------
 # HELPER FUNCTIONS
 # -------------------------
+JOB_POLL_SECONDS = 1.0
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id, label):
+    """Progress bar of a background job, polled without rerunning the page; reruns it once the job ends."""
+    status = job_queue().status(job_id)
+    if status is None or status["state"] in ("done", "failed"):
+        st.rerun(scope="app")
+    st.progress(status["progress"], text=f"⏳ {label}: {status['message']}")
+
+def requested_job(label, button, key, *args, **params):
+    """
+    Result of a background job (JobQueue.submit arguments) started with a
+    button: the button until the job is submitted (again after a failure),
+    then its progress, then its result. Returns None until it has finished.
+    """
+    job_id = job_queue().job_id(*args, **params)
+    status = job_queue().status(job_id)
+    if status is None or status["state"] == "failed":
+        if status is not None:
+            st.error(f"{label} failed: {status['error']}")
+        if st.button(button, key=key):
+            job_queue().submit(*args, **params)
+            st.rerun()
+        return None
+    return finished_job(job_id, label)
+
+def finished_job(job_id, label):
+    """
+    Result of a background job if it has finished; otherwise show its
+    progress (or its error) where this is called and return None.
+    """
+    status = job_queue().status(job_id)
+    if status["state"] == "done":
+        return job_result(job_id)
+    if status["state"] == "failed":
+        st.error(f"{label} failed: {status['error']}")
+    else:
+        job_progress(job_id, label)
+    return None
+
+@st.cache_data
 def get_school_info(df):
-    """Extract and organize school information by project and district"""
+    """Extract and organize school information by project and district (cached per dataset)"""
     schools = df['school'].unique()
     school_info = {}
     
@@ -241,6 +212,38 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# -------------------------
+# CACHE WARM-UP
+# -------------------------
+WARM_UP_THREAD = "cache-warm-up"
+
+def warm_up():
+    """
+    Prepare every dataset in DATASET_CONFIG (see sd.warm_up): its columnar
+    copy, stored aggregates and the default view's analyses and figures,
+    kept in the result store that other server processes and later
+    sessions read. Run ahead of time with `offline_servers.py warm`, this
+    only checks that they are up to date.
+    """
+    for config in DATASET_CONFIG.values():
+        filepath = config["file"]
+        try:
+            sd.warm_up(filepath)
+        except Exception as exc:  # a dataset that cannot be loaded is reported when selected
+            warnings.warn(f"Cache warm-up of {filepath} failed: {exc!r}")
+
+@st.cache_resource
+def start_warm_up():
+    """
+    Run warm_up in a background thread, once per server process and again
+    after the caches are cleared. The thread has no script run context: it
+    outlives the run that started it, so it calls no Streamlit function
+    (the cached loaders' spinners included), only the memoized analyses.
+    """
+    thread = threading.Thread(target=warm_up, name=WARM_UP_THREAD, daemon=True)
+    thread.start()
+    return thread
+
 # -------------------------
 # SIDEBAR DATA SOURCE SELECTION
 # -------------------------
@@ -268,28 +271,28 @@ st.sidebar.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
-# Load the selected dataset (raw data - cached)
-df_raw = load_data_cached(selected_dataset)
-
-# Clean the data (always runs with latest cleaning logic - NOT cached)
-df = clean_school_names(df_raw.copy())
-df = clean_grade_values(df)
+# Partition metadata only: the records are loaded once the school selection is known
+catalog = load_catalog(selected_dataset, dataset_fingerprint(selected_dataset))
+school_counts = catalog.groupby('school')['n_rows'].sum()
 
 # Display record count
-st.sidebar.metric("📝 Total Records", len(df))
+st.sidebar.metric("📝 Total Records", int(catalog['n_rows'].sum()))
 
 # Add cache clear button
 if st.sidebar.button("🔄 Clear Cache & Reload"):
+    result_store().clear()
     st.cache_data.clear()
+    st.cache_resource.clear()
+    sc.clear_memo()
     st.rerun()
 
 # Add debug expander to show unique schools
 with st.sidebar.expander("🔍 Debug: View All Unique Schools", expanded=False):
-    unique_schools = sorted(df['school'].unique())
+    unique_schools = sorted(school_counts.index)
     st.write(f"**Total Unique Schools: {len(unique_schools)}**")
     st.write("**Raw school names from data:**")
     for school in unique_schools:
-        count = len(df[df['school'] == school])
+        count = school_counts[school]
         # Show the exact string with quotes to see any hidden characters
         st.code(f'"{school}" ({count} records)')
     
@@ -306,7 +309,7 @@ st.sidebar.markdown("---")
 st.sidebar.header("🏫 School Selection")
 
 # Get school information organized by project and location
-school_info = get_school_info(df)
+school_info = get_school_info(catalog)
 
 # Selection mode
 selection_mode = st.sidebar.radio(
@@ -318,7 +321,7 @@ selection_mode = st.sidebar.radio(
 selected_schools = []
 
 if selection_mode == "All Schools":
-    selected_schools = df['school'].unique().tolist()
+    selected_schools = catalog['school'].unique().tolist()
     st.sidebar.success(f"✅ All {len(selected_schools)} schools selected")
 else:
     st.sidebar.markdown("**Select schools by project and district:**")
@@ -371,21 +374,114 @@ else:
     else:
         st.sidebar.warning("⚠️ No schools selected")
 
+# -------------------------
+# SIDEBAR DRILL-DOWN
+# -------------------------
+st.sidebar.markdown("---")
+st.sidebar.header("🧭 Drill-down")
+
+# All figures come from the cached project -> district -> school rollup
+cube = load_cube(selected_dataset, dataset_fingerprint(selected_dataset))
+drill_project = st.sidebar.selectbox(
+    "Project:", ["All"] + sorted(sa.rollup_children(cube)["project"].unique()), key="drill_project"
+)
+drill_district = drill_school = None
+if drill_project != "All":
+    drill_district = st.sidebar.selectbox(
+        "District:", ["All"] + sorted(sa.rollup_children(cube, drill_project)["district"].unique()),
+        key="drill_district"
+    )
+    if drill_district != "All":
+        drill_school = st.sidebar.selectbox(
+            "School:", ["All"] + sorted(sa.rollup_children(cube, drill_project, drill_district)["school"].unique()),
+            key="drill_school"
+        )
+node_args = [None if v in (None, "All") else v for v in (drill_project, drill_district, drill_school)]
+node = sa.rollup_node(cube, *node_args)
+foundational = node[node["competency"].str.startswith("foundational")].set_index("domain")
+foundational_rates = sa.result_rates(foundational)
+
+st.sidebar.metric("👥 Students", int(foundational["total"].iloc[0]) if len(foundational) else 0)
+drill_col1, drill_col2, drill_col3 = st.sidebar.columns(3)
+drill_col1.metric("🧮 Num.", f"{foundational_rates.get('numeracy', 0):.0f}%")
+drill_col2.metric("🇬🇧 Eng.", f"{foundational_rates.get('english_reading', 0):.0f}%")
+drill_col3.metric("🇳🇵 Nep.", f"{foundational_rates.get('nepali_reading', 0):.0f}%")
+
+# Foundational rates of the next level down
+children = sa.rollup_children(cube, *node_args[:2]) if node_args[2] is None else cube.iloc[0:0]
+children = children[children["competency"].str.startswith("foundational")]
+if len(children):
+    child_table = children.assign(rate=sa.result_rates(children)).pivot_table(
+        index=children["level"].iloc[0], columns="domain", values="rate", aggfunc="first"
+    ).reindex(columns=sa.ROLLUP_DOMAINS)
+    child_table.columns = ["Num. %", "Eng. %", "Nep. %"]
+    st.sidebar.dataframe(child_table.style.format("{:.0f}"), width='stretch')
+
+# -------------------------
+# SIDEBAR ANALYSIS OPTIONS
+# -------------------------
+st.sidebar.markdown("---")
+st.sidebar.header("⚙️ Analysis Options")
+
+CI_METHODS = {
+    "None": None,
+    "Wilson interval": "wilson",
+    "School bootstrap": "bootstrap"
+}
+ci_label = st.sidebar.selectbox(
+    "📏 Confidence intervals:",
+    list(CI_METHODS.keys()),
+    help="Show 95% confidence intervals as error bars on the Numeracy and Reading tabs"
+)
+ci_method = CI_METHODS[ci_label]
+
+weighting = st.sidebar.radio(
+    "⚖️ Weighting:",
+    ["Unweighted", "Equal weight per school"],
+    help="Weight records so that every school counts equally in the Numeracy and Reading tabs"
+)
+
+
 # -------------------------
 # DATA FILTERING LOGIC
 # -------------------------
-def apply_filters(df):
+# Load the selected dataset (cleaned once per server process and shared read-only),
+# reading only the partitions of the selected schools
+store_partitions = selected_partitions(catalog, selected_schools)
+store = load_store(selected_dataset, store_partitions, dataset_fingerprint(selected_dataset, store_partitions))
+
+def apply_filters(store):
+    """Return the selection bitmap and the matching rows, using the store's bitmap index."""
     if selected_schools:
-        return df[df['school'].isin(selected_schools)]
-    return df
+        selection = store.bitmaps.select(school=selected_schools)
+        if store.bitmaps.count(selection) < len(store):
+            return selection, store.frame().iloc[store.bitmaps.rows(selection)]
+    # Every row: the store's own read-only buffers, whose fingerprints are cached
+    return store.bitmaps.all_rows(), store.frame()
 
-df_filtered = apply_filters(df)
+selection, df_filtered = apply_filters(store)
+job_weighting = "school" if weighting == "Equal weight per school" else None
+analysis_weights = sj.job_weights(df_filtered, job_weighting)
 
 # Show warning if no data after filtering
 if len(df_filtered) == 0:
     st.warning("⚠️ No data available with current filters. Please adjust your selection.")
     st.stop()
 
+# All domains scored in one pass, shared by the numeracy and reading tabs. The school
+# bootstrap rescores every replicate, so it runs as a background job; until it has
+# finished the tabs show the rates without intervals.
+scores = None
+if ci_method == "bootstrap":
+    with st.sidebar:
+        scores = finished_job(
+            job_queue().submit("scores", selected_dataset, store_partitions, selected_schools,
+                               ci=ci_method, weighting=job_weighting),
+            "School bootstrap"
+        )
+if scores is None:
+    scores = sa.score_all(df_filtered, ci=None if ci_method == "bootstrap" else ci_method, weights=analysis_weights)
+
 # -------------------------
 # MAIN CONTENT HEADER
 # -------------------------
@@ -396,10 +492,12 @@ st.markdown("---")
 # -------------------------
 # TABS STRUCTURE
 # -------------------------
-tab_overview, tab_numeracy, tab_reading = st.tabs([
+tab_overview, tab_numeracy, tab_reading, tab_items, tab_crosstab = st.tabs([
     "📊 Overview",
     "🧮 Numeracy Analysis",
-    "📖 Reading Analysis"
+    "📖 Reading Analysis",
+    "🔬 Item Analysis",
+    "🧩 Cross-tab"
 ])
 
 # -------------------------
@@ -413,16 +511,19 @@ with tab_overview:
     with col1:
         st.metric("👥 Students", len(df_filtered))
     with col2:
-        st.metric("🏫 Schools", df_filtered['school'].nunique())
+        st.metric("🏫 Schools", int((store.bitmaps.group_counts('school', selection) > 0).sum()))
+    if 'studentGender' in df_filtered.columns:
+        gender_totals = store.bitmaps.group_counts('studentGender', selection)
+        gender_totals = gender_totals[gender_totals > 0].sort_values(ascending=False)
     with col3:
         if 'studentGender' in df_filtered.columns:
-            female_count = df_filtered['studentGender'].value_counts().get('Female', 0)
+            female_count = int(gender_totals.get('Female', 0))
             st.metric("👧 Female", f"{female_count:,}")
         else:
             st.metric("👧 Female", "N/A")
     with col4:
         if 'studentGender' in df_filtered.columns:
-            male_count = df_filtered['studentGender'].value_counts().get('Male', 0)
+            male_count = int(gender_totals.get('Male', 0))
             st.metric("👦 Male", f"{male_count:,}")
         else:
             st.metric("👦 Male", "N/A")
@@ -441,7 +542,7 @@ with tab_overview:
     
     # Generate demographic figures
     if 'studentGender' in df_filtered.columns:
-        gender_counts = df_filtered['studentGender'].value_counts().reset_index()
+        gender_counts = gender_totals.reset_index()
         gender_counts.columns = ['Gender', 'Count']
         fig_gender = px.pie(
             gender_counts,
@@ -459,10 +560,8 @@ with tab_overview:
         fig_gender = None
     
     if 'grade' in df_filtered.columns:
-        df_filtered['grade'] = pd.Categorical(df_filtered['grade'], 
-                                              categories=sorted(df_filtered['grade'].dropna().unique()), 
-                                              ordered=True)
-        grade_counts = df_filtered['grade'].value_counts().sort_index().reset_index()
+        grade_counts = store.bitmaps.group_counts('grade', selection)
+        grade_counts = grade_counts[grade_counts > 0].reset_index()
         grade_counts.columns = ['Grade', 'Count']
         grade_counts['Percentage'] = (grade_counts['Count'] / len(df_filtered) * 100).round(1)
         grade_counts['Label'] = grade_counts.apply(lambda row: f"{row['Count']} ({row['Percentage']}%)", axis=1)
@@ -485,16 +584,7 @@ with tab_overview:
         fig_grade = None
     
     if 'studentAge' in df_filtered.columns:
-        fig_age = px.histogram(
-            df_filtered,
-            x="studentAge",
-            title="Age Distribution",
-            nbins=15,
-            color_discrete_sequence=px.colors.qualitative.Set3
-        )
-        fig_age.update_traces(
-            hovertemplate='<b>Age: %{x}</b><br>Count: %{y}<extra></extra>'
-        )
+        fig_age = sa.plot_binned_histogram(df_filtered["studentAge"], "Age Distribution", "Age")
     else:
         fig_age = None
     
@@ -519,17 +609,17 @@ with tab_overview:
         # MULTIPLE SCHOOLS VIEW
         st.subheader("⭐ Average Performance Summary")
         
-        # Calculate average performance across selected schools
-        numeracy_analysis_all = sa.numeracy_analysis(df_filtered, sa.numeracy_ids)
-        eng_analysis_all = sa.reading_analysis(df_filtered, sa.long_eng_reading_ids, lang="English")
-        nep_analysis_all = sa.reading_analysis(df_filtered, sa.long_nep_reading_ids, lang="Nepali")
+        # Calculate average performance across selected schools, and per school, in one pass
+        overview_scores = sa.score_all(df_filtered, dimensions={"school": "school"})
+        overall_rates = sa.domain_rates(overview_scores, sa.FOUNDATIONAL_COMPETENCIES).iloc[0]
         
         avg_perf_df = pd.DataFrame({
-            "Competency": ["Numeracy", "English Reading", "Nepali Reading"],
+            "Competency": ["Numeracy", "English Reading", "Nepali Reading", "All Foundational Skills"],
             "Percentage": [
-                numeracy_analysis_all['analysis_five']['percentage_meeting'],
-                eng_analysis_all['analysis_four']['percentage_meeting'],
-                nep_analysis_all['analysis_four']['percentage_meeting']
+                overall_rates["numeracy"],
+                overall_rates["english_reading"],
+                overall_rates["nepali_reading"],
+                overall_rates["composite"]
             ]
         })
         
@@ -557,21 +647,13 @@ with tab_overview:
         # School comparison
         st.subheader("🏆 Competency Comparison Across Schools")
         
-        school_summary = []
-        for school in sorted(df_filtered['school'].unique()):
-            school_df = df_filtered[df_filtered['school'] == school]
-            num_res = sa.numeracy_analysis(school_df, sa.numeracy_ids, printText=False)
-            eng_res = sa.reading_analysis(school_df, sa.long_eng_reading_ids, lang="English", printText=False)
-            nep_res = sa.reading_analysis(school_df, sa.long_nep_reading_ids, lang="Nepali", printText=False)
-            
-            school_summary.append({
-                "School": school,
-                "Numeracy": num_res['analysis_five']['percentage_meeting'],
-                "English Reading": eng_res['analysis_four']['percentage_meeting'],
-                "Nepali Reading": nep_res['analysis_four']['percentage_meeting']
-            })
-        
-        summary_df = pd.DataFrame(school_summary)
+        school_rates = sa.domain_rates(overview_scores, sa.FOUNDATIONAL_COMPETENCIES, "school")
+        summary_df = pd.DataFrame({
+            "School": school_rates.index,
+            "Numeracy": school_rates["numeracy"].to_numpy(),
+            "English Reading": school_rates["english_reading"].to_numpy(),
+            "Nepali Reading": school_rates["nepali_reading"].to_numpy()
+        })
         summary_long = summary_df.melt(id_vars=['School'], var_name='Competency', value_name='Percentage')
         
         fig_comparison = px.bar(
@@ -599,10 +681,11 @@ with tab_overview:
         school_name = df_filtered['school'].unique()[0]
         st.subheader(f"📊 Performance Summary: {school_name}")
         
-        # Run analyses
-        numeracy_res = sa.numeracy_analysis(df_filtered, sa.numeracy_ids, printText=False)
-        eng_res = sa.reading_analysis(df_filtered, sa.long_eng_reading_ids, lang="English", printText=False)
-        nep_res = sa.reading_analysis(df_filtered, sa.long_nep_reading_ids, lang="Nepali", printText=False)
+        # Run analyses (all domains in one pass)
+        overview_scores = sa.score_all(df_filtered)
+        numeracy_res = sa.domain_results(overview_scores, "numeracy")
+        eng_res = sa.domain_results(overview_scores, "english_reading")
+        nep_res = sa.domain_results(overview_scores, "nepali_reading")
         
         # Overall performance metrics with PIE CHARTS
         st.markdown("### 🎯 Overall Competency Achievement")
@@ -611,14 +694,13 @@ with tab_overview:
         
         with perf_col1:
             # Numeracy Pie Chart
-            num_achieved = numeracy_res['analysis_five']['count_meeting']
-            num_total = numeracy_res['analysis_five']['total_students']
+            num_pct, num_achieved, num_total = sa.overall_rate(numeracy_res, "foundational_numeracy")
             num_not_achieved = num_total - num_achieved
             
             fig_num_pie = px.pie(
                 values=[num_achieved, num_not_achieved],
                 names=['Achieved', 'Not Achieved'],
-                title=f"🧮 Foundational Numeracy<br>{numeracy_res['analysis_five']['percentage_meeting']:.1f}%",
+                title=f"🧮 Foundational Numeracy<br>{num_pct:.1f}%",
                 color_discrete_sequence=['#2ecc71', '#e74c3c']
             )
             fig_num_pie.update_traces(textinfo='value+percent')
@@ -626,14 +708,13 @@ with tab_overview:
         
         with perf_col2:
             # English Reading Pie Chart
-            eng_achieved = eng_res['analysis_four']['count_meeting']
-            eng_total = eng_res['analysis_four']['total_students']
+            eng_pct, eng_achieved, eng_total = sa.overall_rate(eng_res, "foundational")
             eng_not_achieved = eng_total - eng_achieved
             
             fig_eng_pie = px.pie(
                 values=[eng_achieved, eng_not_achieved],
                 names=['Achieved', 'Not Achieved'],
-                title=f"📖 English Reading<br>{eng_res['analysis_four']['percentage_meeting']:.1f}%",
+                title=f"📖 English Reading<br>{eng_pct:.1f}%",
                 color_discrete_sequence=['#3498db', '#e67e22']
             )
             fig_eng_pie.update_traces(textinfo='value+percent')
@@ -641,14 +722,13 @@ with tab_overview:
         
         with perf_col3:
             # Nepali Reading Pie Chart
-            nep_achieved = nep_res['analysis_four']['count_meeting']
-            nep_total = nep_res['analysis_four']['total_students']
+            nep_pct, nep_achieved, nep_total = sa.overall_rate(nep_res, "foundational")
             nep_not_achieved = nep_total - nep_achieved
             
             fig_nep_pie = px.pie(
                 values=[nep_achieved, nep_not_achieved],
                 names=['Achieved', 'Not Achieved'],
-                title=f"📖 Nepali Reading<br>{nep_res['analysis_four']['percentage_meeting']:.1f}%",
+                title=f"📖 Nepali Reading<br>{nep_pct:.1f}%",
                 color_discrete_sequence=['#9b59b6', '#e74c3c']
             )
             fig_nep_pie.update_traces(textinfo='value+percent')
@@ -660,16 +740,11 @@ with tab_overview:
         st.subheader("🧮 Numeracy Performance Breakdown")
         
         # Gender breakdown for numeracy
-        num_gender_data = []
-        for gender in ['Male', 'Female']:
-            if gender in numeracy_res['analysis_five']['gender_results']:
-                num_gender_data.append({
-                    'Gender': gender,
-                    'Percentage': numeracy_res['analysis_five']['gender_results'][gender]['percentage']
-                })
+        num_labels = {"foundational_numeracy": "Foundational Numeracy"}
+        num_gender_df = sa.breakdown_rows(numeracy_res, "gender", num_labels).rename(columns={"Group": "Gender"})
+        num_gender_df = num_gender_df[num_gender_df['Gender'].isin(['Male', 'Female'])]
         
-        if num_gender_data:
-            num_gender_df = pd.DataFrame(num_gender_data)
+        if not num_gender_df.empty:
             fig_num_gender = px.bar(
                 num_gender_df,
                 x='Gender',
@@ -685,16 +760,10 @@ with tab_overview:
             fig_num_gender = None
         
         # Age breakdown for numeracy
-        num_age_data = []
-        if 'analysis_age' in numeracy_res and 'foundational_numeracy' in numeracy_res['analysis_age']:
-            for age, data in numeracy_res['analysis_age']['foundational_numeracy'].items():
-                num_age_data.append({
-                    'Age': age,
-                    'Percentage': data['percentage']
-                })
+        num_age_df = sa.breakdown_rows(numeracy_res, "age", num_labels).rename(columns={"Group": "Age"})
         
-        if num_age_data:
-            num_age_df = pd.DataFrame(num_age_data).sort_values('Age')
+        if not num_age_df.empty:
+            num_age_df = num_age_df.sort_values('Age')
             fig_num_age = px.line(
                 num_age_df,
                 x='Age',
@@ -711,16 +780,10 @@ with tab_overview:
             fig_num_age = None
         
         # Grade breakdown for numeracy
-        num_grade_data = []
-        if 'analysis_grade' in numeracy_res and 'foundational_numeracy' in numeracy_res['analysis_grade']:
-            for grade, data in numeracy_res['analysis_grade']['foundational_numeracy'].items():
-                num_grade_data.append({
-                    'Grade': grade,
-                    'Percentage': data['percentage']
-                })
+        num_grade_df = sa.breakdown_rows(numeracy_res, "grade", num_labels).rename(columns={"Group": "Grade"})
         
-        if num_grade_data:
-            num_grade_df = pd.DataFrame(num_grade_data).sort_values('Grade')
+        if not num_grade_df.empty:
+            num_grade_df = num_grade_df.sort_values('Grade')
             fig_num_grade = px.bar(
                 num_grade_df,
                 x='Grade',
@@ -752,16 +815,10 @@ with tab_overview:
         st.subheader("📖 English Reading Performance Breakdown")
         
         # Gender breakdown for English reading
-        eng_gender_data = []
-        if 'analysis_gender' in eng_res and eng_res['analysis_gender']:
-            for gender, metrics in eng_res['analysis_gender'].items():
-                eng_gender_data.append({
-                    'Gender': gender,
-                    'Percentage': metrics['foundational']
-                })
+        eng_labels = {"foundational": "Foundational English Reading"}
+        eng_gender_df = sa.breakdown_rows(eng_res, "gender", eng_labels).rename(columns={"Group": "Gender"})
         
-        if eng_gender_data:
-            eng_gender_df = pd.DataFrame(eng_gender_data)
+        if not eng_gender_df.empty:
             fig_eng_gender = px.bar(
                 eng_gender_df,
                 x='Gender',
@@ -778,16 +835,10 @@ with tab_overview:
             st.info("No gender breakdown data available for English reading")
         
         # Age breakdown for English reading
-        eng_age_data = []
-        if 'analysis_age' in eng_res and 'foundational' in eng_res['analysis_age']:
-            for age, data in eng_res['analysis_age']['foundational'].items():
-                eng_age_data.append({
-                    'Age': age,
-                    'Percentage': data['percentage']
-                })
+        eng_age_df = sa.breakdown_rows(eng_res, "age", eng_labels).rename(columns={"Group": "Age"})
         
-        if eng_age_data:
-            eng_age_df = pd.DataFrame(eng_age_data).sort_values('Age')
+        if not eng_age_df.empty:
+            eng_age_df = eng_age_df.sort_values('Age')
             fig_eng_age = px.line(
                 eng_age_df,
                 x='Age',
@@ -804,16 +855,10 @@ with tab_overview:
             fig_eng_age = None
         
         # Grade breakdown for English reading
-        eng_grade_data = []
-        if 'analysis_grade' in eng_res and 'foundational' in eng_res['analysis_grade']:
-            for grade, data in eng_res['analysis_grade']['foundational'].items():
-                eng_grade_data.append({
-                    'Grade': grade,
-                    'Percentage': data['percentage']
-                })
+        eng_grade_df = sa.breakdown_rows(eng_res, "grade", eng_labels).rename(columns={"Group": "Grade"})
         
-        if eng_grade_data:
-            eng_grade_df = pd.DataFrame(eng_grade_data).sort_values('Grade')
+        if not eng_grade_df.empty:
+            eng_grade_df = eng_grade_df.sort_values('Grade')
             fig_eng_grade = px.bar(
                 eng_grade_df,
                 x='Grade',
@@ -845,16 +890,10 @@ with tab_overview:
         st.subheader("📖 Nepali Reading Performance Breakdown")
         
         # Gender breakdown for Nepali reading
-        nep_gender_data = []
-        if 'analysis_gender' in nep_res and nep_res['analysis_gender']:
-            for gender, metrics in nep_res['analysis_gender'].items():
-                nep_gender_data.append({
-                    'Gender': gender,
-                    'Percentage': metrics['foundational']
-                })
+        nep_labels = {"foundational": "Foundational Nepali Reading"}
+        nep_gender_df = sa.breakdown_rows(nep_res, "gender", nep_labels).rename(columns={"Group": "Gender"})
         
-        if nep_gender_data:
-            nep_gender_df = pd.DataFrame(nep_gender_data)
+        if not nep_gender_df.empty:
             fig_nep_gender = px.bar(
                 nep_gender_df,
                 x='Gender',
@@ -871,16 +910,10 @@ with tab_overview:
             st.info("No gender breakdown data available for Nepali reading")
         
         # Age breakdown for Nepali reading
-        nep_age_data = []
-        if 'analysis_age' in nep_res and 'foundational' in nep_res['analysis_age']:
-            for age, data in nep_res['analysis_age']['foundational'].items():
-                nep_age_data.append({
-                    'Age': age,
-                    'Percentage': data['percentage']
-                })
+        nep_age_df = sa.breakdown_rows(nep_res, "age", nep_labels).rename(columns={"Group": "Age"})
         
-        if nep_age_data:
-            nep_age_df = pd.DataFrame(nep_age_data).sort_values('Age')
+        if not nep_age_df.empty:
+            nep_age_df = nep_age_df.sort_values('Age')
             fig_nep_age = px.line(
                 nep_age_df,
                 x='Age',
@@ -897,16 +930,10 @@ with tab_overview:
             fig_nep_age = None
         
         # Grade breakdown for Nepali reading
-        nep_grade_data = []
-        if 'analysis_grade' in nep_res and 'foundational' in nep_res['analysis_grade']:
-            for grade, data in nep_res['analysis_grade']['foundational'].items():
-                nep_grade_data.append({
-                    'Grade': grade,
-                    'Percentage': data['percentage']
-                })
+        nep_grade_df = sa.breakdown_rows(nep_res, "grade", nep_labels).rename(columns={"Group": "Grade"})
         
-        if nep_grade_data:
-            nep_grade_df = pd.DataFrame(nep_grade_data).sort_values('Grade')
+        if not nep_grade_df.empty:
+            nep_grade_df = nep_grade_df.sort_values('Grade')
             fig_nep_grade = px.bar(
                 nep_grade_df,
                 x='Grade',
@@ -937,8 +964,8 @@ with tab_overview:
 with tab_numeracy:
     st.header("🧮 Numeracy Skills Analysis")
 
-    numeracy_analysis = sa.numeracy_analysis(df_filtered, sa.numeracy_ids)
-    plots = sa.plot_numeracy_results(numeracy_analysis)
+    numeracy_results = sa.domain_results(scores, "numeracy")
+    plots = sa.plot_numeracy_results(numeracy_results)
 
     # Summary metrics
     col1, col2, col3 = st.columns(3)
@@ -948,13 +975,9 @@ with tab_numeracy:
         st.metric("🏫 Schools", df_filtered['school'].nunique())
     with col3:
         # Calculate average completion across all numeracy tasks
-        avg_completion = (
-            numeracy_analysis['analysis_one']['percentage_meeting'] +
-            numeracy_analysis['analysis_two']['percentage_meeting'] +
-            numeracy_analysis['analysis_three']['percentage_meeting'] +
-            numeracy_analysis['analysis_four']['percentage_meeting'] +
-            numeracy_analysis['analysis_five']['percentage_meeting']
-        ) / 5
+        avg_completion = sum(
+            sa.overall_rate(numeracy_results, competency)[0] for competency in sa.NUMERACY_LABELS
+        ) / len(sa.NUMERACY_LABELS)
         st.metric("📈 Avg Completion Rate", f"{avg_completion:.1f}%")
 
     st.markdown("---")
@@ -973,6 +996,14 @@ with tab_numeracy:
         st.subheader("Grade-level Performance")
         st.plotly_chart(plots['fig_grade'], width='stretch', key="num_grade")
 
+    st.download_button(
+        "⬇️ Download numeracy results (CSV)",
+        numeracy_results.to_csv(index=False),
+        file_name="numeracy_results.csv",
+        mime="text/csv",
+        key="num_download"
+    )
+
 # -------------------------
 # READING TAB
 # -------------------------
@@ -1000,8 +1031,8 @@ with tab_reading:
     with tab_eng:
         st.subheader("English Reading Performance")
         
-        eng_res = sa.reading_analysis(df_filtered, sa.long_eng_reading_ids, lang="English")
-        reading_plots_eng = sa.plot_reading_results(eng_res, df_filtered)
+        eng_res = sa.domain_results(scores, "english_reading")
+        reading_plots_eng = sa.plot_reading_results(eng_res)
         
         st.plotly_chart(reading_plots_eng["fig_overall"], width='stretch', key="eng_overall")
         st.plotly_chart(reading_plots_eng["fig_gender"], width='stretch', key="eng_gender")
@@ -1012,12 +1043,38 @@ with tab_reading:
         if reading_plots_eng["fig_grade"]:
             st.plotly_chart(reading_plots_eng["fig_grade"], width='stretch', key="eng_grade")
 
+        eng_cutoff = sa.reading_rubric(df_filtered, sa.long_eng_reading_ids, lang="English")[0]
+        st.plotly_chart(
+            sa.plot_score_distribution(df_filtered, "english_words_read", title="Words Read Correctly by Gender",
+                                       cutoff=eng_cutoff),
+            width='stretch', key="eng_distribution"
+        )
+
+        st.subheader("Threshold Sweep")
+        eng_threshold = st.slider(
+            "Words-correct threshold (% of story)", min_value=50, max_value=100, value=sd.DEFAULT_THRESHOLD, key="eng_threshold"
+        )
+        eng_sweep = sa.reading_threshold_sweep(df_filtered, sa.long_eng_reading_ids, lang="English",
+                                               weights=analysis_weights)
+        st.plotly_chart(sa.plot_threshold_sweep(eng_sweep, threshold=eng_threshold),
+                        width='stretch', key="eng_sweep")
+        eng_at_threshold = sa.plot_reading_results(sa.threshold_results(eng_sweep, eng_threshold))
+        st.plotly_chart(eng_at_threshold["fig_overall"], width='stretch', key="eng_sweep_overall")
+
+        st.download_button(
+            "⬇️ Download English reading results (CSV)",
+            eng_res.to_csv(index=False),
+            file_name="english_reading_results.csv",
+            mime="text/csv",
+            key="eng_download"
+        )
+
     # Nepali Reading Analysis
     with tab_nep:
         st.subheader("Nepali Reading Performance")
         
-        nep_res = sa.reading_analysis(df_filtered, sa.long_nep_reading_ids, lang="Nepali")
-        reading_plots_nep = sa.plot_reading_results(nep_res, df_filtered)
+        nep_res = sa.domain_results(scores, "nepali_reading")
+        reading_plots_nep = sa.plot_reading_results(nep_res)
         
         st.plotly_chart(reading_plots_nep["fig_overall"], width='stretch', key="nep_overall")
         st.plotly_chart(reading_plots_nep["fig_gender"], width='stretch', key="nep_gender")
@@ -1028,8 +1085,176 @@ with tab_reading:
         if reading_plots_nep["fig_grade"]:
             st.plotly_chart(reading_plots_nep["fig_grade"], width='stretch', key="nep_grade")
 
+        nep_cutoff = sa.reading_rubric(df_filtered, sa.long_nep_reading_ids, lang="Nepali")[0]
+        st.plotly_chart(
+            sa.plot_score_distribution(df_filtered, "nepali_words_read", title="Words Read Correctly by Gender",
+                                       cutoff=nep_cutoff),
+            width='stretch', key="nep_distribution"
+        )
+
+        st.subheader("Threshold Sweep")
+        nep_threshold = st.slider(
+            "Words-correct threshold (% of story)", min_value=50, max_value=100, value=sd.DEFAULT_THRESHOLD, key="nep_threshold"
+        )
+        nep_sweep = sa.reading_threshold_sweep(df_filtered, sa.long_nep_reading_ids, lang="Nepali",
+                                               weights=analysis_weights)
+        st.plotly_chart(sa.plot_threshold_sweep(nep_sweep, threshold=nep_threshold),
+                        width='stretch', key="nep_sweep")
+        nep_at_threshold = sa.plot_reading_results(sa.threshold_results(nep_sweep, nep_threshold))
+        st.plotly_chart(nep_at_threshold["fig_overall"], width='stretch', key="nep_sweep_overall")
+
+        st.download_button(
+            "⬇️ Download Nepali reading results (CSV)",
+            nep_res.to_csv(index=False),
+            file_name="nepali_reading_results.csv",
+            mime="text/csv",
+            key="nep_download"
+        )
+
+# -------------------------
+# ITEM ANALYSIS TAB
+# -------------------------
+with tab_items:
+    st.header("🔬 Item Analysis")
+    st.markdown(
+        "Item difficulty (**p-value**: share correct among students who answered), "
+        "discrimination (**point-biserial** correlation with the rest score) and missingness."
+    )
+
+    ITEM_SETS = {
+        "Numeracy": sa.numeracy_ids,
+        "English Reading": sa.eng_reading_item_ids,
+        "Nepali Reading": sa.nep_reading_item_ids
+    }
+    ITEM_JOB_SETS = dict(zip(ITEM_SETS, sj.ITEM_SETS))
+    item_set = st.radio("Item set:", list(ITEM_SETS.keys()), horizontal=True, key="item_set")
+    item_plots = ia.plot_item_statistics(df_filtered, ITEM_SETS[item_set], item_set)
+
+    st.plotly_chart(item_plots["fig_items"], width='stretch', key="item_overall")
+    st.dataframe(
+        item_plots["table"].style.format({
+            "missing_rate": "{:.1%}",
+            "p_value": "{:.2f}",
+            "point_biserial": "{:.2f}"
+        }),
+        width='stretch',
+        hide_index=True
+    )
+
+    item_col1, item_col2 = st.columns(2)
+    with item_col1:
+        st.plotly_chart(item_plots["fig_schools"], width='stretch', key="item_schools")
+    with item_col2:
+        st.plotly_chart(item_plots["fig_grades"], width='stretch', key="item_grades")
+
+    st.markdown("---")
+    st.subheader("📐 Rasch Calibration")
+    st.markdown("Item difficulties on a common logit scale (1PL model), fitted in the background.")
+    rasch = requested_job("Rasch calibration", "▶️ Run Rasch calibration", "rasch_run",
+                          "rasch", selected_dataset, store_partitions, selected_schools)
+    if rasch is not None:
+        rasch_items = rasch["items"][ITEM_JOB_SETS[item_set]].sort_values("difficulty")
+        if not rasch["converged"][ITEM_JOB_SETS[item_set]]:
+            st.warning("The calibration did not converge; difficulties are approximate.")
+        st.dataframe(
+            rasch_items.style.format({"difficulty": "{:.2f}", "se": "{:.2f}", "p_value": "{:.2f}"}),
+            width='stretch'
+        )
+
+# -------------------------
+# CROSS-TAB TAB
+# -------------------------
+with tab_crosstab:
+    st.header("🧩 Cross-tab Pivot View")
+    st.markdown("Competency rates for any combination of student and school attributes.")
+
+    CROSSTAB_DIMENSIONS = {
+        "Gender": "studentGender",
+        "Age": "studentAge",
+        "Grade": "grade",
+        "School": "school",
+        "Project": "project",
+        "District": "district",
+        "Home Language (FL7)": "FL7",
+        "Language (FL9A)": "FL9A"
+    }
+    CROSSTAB_DOMAINS = {
+        "Numeracy": (
+            lambda d: sa.numeracy_conditions(d, sa.numeracy_item_groups(sa.numeracy_ids)), sa.NUMERACY_LABELS
+        ),
+        "English Reading": (
+            lambda d: sa.school_reading_conditions(d, sa.long_eng_reading_ids, lang="English"),
+            sa.READING_LABELS
+        ),
+        "Nepali Reading": (
+            lambda d: sa.school_reading_conditions(d, sa.long_nep_reading_ids, lang="Nepali"),
+            sa.READING_LABELS
+        )
+    }
+
+    xt_col1, xt_col2, xt_col3 = st.columns(3)
+    with xt_col1:
+        xt_domain = st.selectbox("Domain:", list(CROSSTAB_DOMAINS.keys()), key="xt_domain")
+    build_conditions, xt_labels = CROSSTAB_DOMAINS[xt_domain]
+    with xt_col2:
+        xt_competency = st.selectbox(
+            "Competency:", list(xt_labels.keys()), index=len(xt_labels) - 1,
+            format_func=xt_labels.get, key="xt_competency"
+        )
+    with xt_col3:
+        xt_min_cell = st.number_input(
+            "Suppress cells with fewer students than:", min_value=1, value=sa.CROSSTAB_MIN_CELL, key="xt_min_cell"
+        )
+
+    xt_rows = st.multiselect("Rows:", list(CROSSTAB_DIMENSIONS.keys()), default=["Gender"], key="xt_rows")
+    xt_columns = st.multiselect(
+        "Columns:", [d for d in CROSSTAB_DIMENSIONS if d not in xt_rows], default=["Grade"], key="xt_columns"
+    )
+
+    if not xt_rows:
+        st.info("Select at least one row dimension.")
+    else:
+        row_cols = [CROSSTAB_DIMENSIONS[d] for d in xt_rows]
+        column_cols = [CROSSTAB_DIMENSIONS[d] for d in xt_columns]
+        xt_table = sa.crosstab(
+            df_filtered, build_conditions(df_filtered), row_cols + column_cols,
+            metadata=SCHOOL_METADATA, min_cell=xt_min_cell, weights=analysis_weights
+        )
+        xt_pivot = sa.crosstab_pivot(xt_table, xt_competency, row_cols, column_cols)
+        st.dataframe(xt_pivot.style.format("{:.1f}%", na_rep="–"), width='stretch')
+        st.caption(f"Rates in percent. Cells with fewer than {xt_min_cell} students are suppressed (–).")
+        st.download_button(
+            "⬇️ Download cross-tab (CSV)",
+            xt_table.to_csv(index=False),
+            file_name="crosstab_results.csv",
+            mime="text/csv",
+            key="xt_download"
+        )
+
+# -------------------------
+# FULL EXPORT
+# -------------------------
+st.markdown("---")
+st.subheader("📦 Full Results Export")
+st.markdown("All result tables, item statistics and Rasch calibrations for the current selection as a zip of CSV files.")
+archive = requested_job("Preparing export", "📦 Prepare export", "export_run",
+                        "export", selected_dataset, store_partitions, selected_schools, weighting=job_weighting)
+if archive is not None:
+    st.download_button(
+        "⬇️ Download all results (ZIP)",
+        archive,
+        file_name="survey_results.zip",
+        mime="application/zip",
+        key="export_download"
+    )
+
 # -------------------------
 # FOOTER
 # -------------------------
 st.markdown("---")
-st.markdown("*Dashboard for analyzing school survey data across numeracy and reading competencies*")
\ No newline at end of file
+st.markdown("*Dashboard for analyzing school survey data across numeracy and reading competencies*")
+
+# Streamlit runs no app code before the first session connects, so the warm-up starts
+# once the first page has been drawn (leaving it the whole CPU) and prepares every
+# other dataset and later sessions' views in the background.
+start_warm_up()
@@ -1,13 +1,23 @@
 #survey_analysis.py
 import os
+import warnings
+from statistics import NormalDist
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import survey_cache as sc
 
-def load_data(filepath):
+def load_data(filepath, columns=None):
     """
     Load the CSV file into a pandas DataFrame and clean the data.
+    With `columns` (e.g. from column_plan), only those columns plus the
+    BASE_COLUMNS needed for cleaning are read and parsed.
     """
-    df = pd.read_csv(filepath)
+    if columns is None:
+        df = pd.read_csv(filepath)
+    else:
+        wanted = set(columns) | set(BASE_COLUMNS)
+        df = pd.read_csv(filepath, usecols=lambda col: col in wanted)
     df = clean_data(df)
     return df
 
@@ -26,10 +36,23 @@ def clean_data(df):
             df = df.dropna(subset=[col])
     return df
 
+# Spellings of grades found in survey exports, after removing a "Grade " prefix.
+GRADE_ALIASES = {f"class {n}": str(n) for n in range(1, 9)}
+
+def canonical_grades(grades):
+    """
+    Standard label for each grade value ("Grade 4", " grade 4", "Class 4" -> "4").
+    Returns a Series aligned with `grades`.
+    """
+    grades = pd.Series(grades).astype(str).str.strip()
+    grades = grades.str.replace('Grade ', '', case=False, regex=False).str.strip()
+    return grades.str.lower().replace(GRADE_ALIASES).str.strip()
+
 # -------------------------
 # ANALYSIS PARAMETERS
 # -------------------------
 # drop FL27_cleaned5 for Siddhartha Kula Basic School and Ghami Solar Basic Schools because incorrect entries in the survey app
+# (flagged omit_pattern_item in SCHOOL_TABLE)
 numeracy_ids = ["FL23_cleaned1", "FL23_cleaned2", "FL23_cleaned3", "FL23_cleaned4", "FL23_cleaned5", \
                  "FL23_cleaned6", "FL24_cleaned1", "FL24_cleaned2", "FL24_cleaned3", "FL24_cleaned4", "FL24_cleaned5", \
                  "FL25_cleaned1", "FL25_cleaned2", "FL25_cleaned3", "FL25_cleaned4", "FL25_cleaned5", \
@@ -54,41 +77,533 @@ long_nep_reading_ids = [nep_reading_ids[i] for i in [3,4,5,6,7,8]]
 short_nep_reading_ids = [nep_reading_ids[i] for i in [0,1,2]]
 
 #for all schoools, the same English story (with names changed, no change in word count or question type)
-#for Siddhartha Kula Basic School and Ghami Solar Basic School, use story1 ids for Nepali 
+#for Siddhartha Kula Basic School and Ghami Solar Basic School, use story1 ids for Nepali (flagged old_nepali_story in SCHOOL_TABLE)
+
+# Correct/Incorrect reading items (positions 0 and 3 hold words-read counts)
+eng_reading_item_ids = [eng_reading_ids[i] for i in [1, 2, 4, 5, 6, 7, 8]]
+nep_reading_item_ids = [nep_reading_ids[i] for i in [1, 2, 4, 5, 6, 7, 8]]
+
+# -------------------------
+# COLUMN PLAN
+# -------------------------
+# Columns every analysis needs: cleaning keys and breakdown dimensions.
+BASE_COLUMNS = ["school", "grade", "studentAge", "studentGender"]
+
+# Survey columns read by each analysis.
+ANALYSIS_COLUMNS = {
+    "numeracy": numeracy_ids,
+    "english_reading": eng_reading_ids,
+    "nepali_reading": nep_reading_ids,
+    "demographics": ["FL7", "FL9A"]
+}
+
+def column_plan(*analyses, extra=()):
+    """
+    Return the columns needed by the named analyses (keys of
+    ANALYSIS_COLUMNS) plus `extra`, in order and without duplicates.
+    """
+    unknown = [name for name in analyses if name not in ANALYSIS_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown analyses: {unknown}")
+    columns = BASE_COLUMNS + [col for name in analyses for col in ANALYSIS_COLUMNS[name]] + list(extra)
+    return list(dict.fromkeys(columns))
+
+# -------------------------
+# SCHOOL DIMENSION
+# -------------------------
+# One row per school: integer ID, canonical name, location, project, the
+# spellings found in survey exports, and rubric exceptions:
+#   - old_nepali_story: the school read the earlier 48-word Nepali story.
+#   - omit_pattern_item: FL27_cleaned5 is not scored (incorrect entries in the survey app).
+SCHOOL_TABLE = [
+    {"school_id": 1, "name": "Nepal Rastriya Secondary School", "address": "Khajura 8",
+     "district": "Surkhet", "project": "EAST",
+     "aliases": ["Nepal Rastriya Secondary School- Khajura 8 Surkhet",
+                 "Nepal Rastriya Secondary School - Khajura 8 Surkhet",
+                 "Nepal Rastriya Secondary School-Khajura 8 Surkhet"]},
+    {"school_id": 2, "name": "Chhabi Basic School", "address": "Kalagaun 4",
+     "district": "Surkhet", "project": "EAST",
+     "aliases": ["Chhabi Basic School- Kalagaun 4 Surkhet", "Chhabi Basic School - Kalagaun 4 Surkhet"]},
+    {"school_id": 3, "name": "Janajagrit Basic School", "address": "Padampur 12",
+     "district": "Surkhet", "project": "EAST",
+     "aliases": ["Janajagrit Basic School - Padampur 12 Surkhet", "Janajagrit Basic School- Padampur 12 Surkhet"]},
+    {"school_id": 4, "name": "Janajagriti Basic School - Pyusey", "address": "Narayan 3, Pyusey",
+     "district": "Dailekh", "project": "EAST",
+     "aliases": ["JANAJAGRITI BASIC SCHOOL, NARAYAN 3, PYUSEY, DAILEKH",
+                 "Janajagriti Basic School, Narayan 3, Pyusey, Dailekh"]},
+    {"school_id": 5, "name": "Navadurga Basic School", "address": "Narayan 5, Chhatikot",
+     "district": "Dailekh", "project": "EAST",
+     "aliases": ["NAVADURGA BASIC SCHOOL, NARAYAN 5, CHHATIKOT, DAILEKH"]},
+    {"school_id": 6, "name": "Raina Devi Basic School", "address": "Narayan 11, Kanda",
+     "district": "Dailekh", "project": "EAST",
+     "aliases": ["RAINA DEVI BASIC SCHOOL, NARAYAN 11, KANDA, DAILEKH"]},
+    {"school_id": 7, "name": "Ghami Basic Solar School", "address": "Ghami",
+     "district": "Mustang", "project": "LLEST",
+     "aliases": ["Ghami Solar Basic School"],
+     "old_nepali_story": True, "omit_pattern_item": True},
+    {"school_id": 8, "name": "Siddhartha Kula Basic School", "address": "Nilung, Tinje, Dolpo",
+     "district": "Dolpo", "project": "LLEST",
+     "aliases": [],
+     "old_nepali_story": True, "omit_pattern_item": True},
+    {"school_id": 9, "name": "Minnath Adarsha Basic School", "address": "Tangal",
+     "district": "Lalitpur", "project": "LLEST",
+     "aliases": ["Minnath Adarsha Basic School LMC"]},
+    {"school_id": 10, "name": "Janta Basic School", "address": "Santanagar, Dhangadimai",
+     "district": "Dhangadimai", "project": "LLEST",
+     "aliases": ["Janta Aa Vi Santanagar Dhangadimai", "Janta Basic School, Santanagar, Dhangadimai"]},
+    {"school_id": 11, "name": "Secondary School", "address": "Basabitti 22, Janakpurdham",
+     "district": "Janakpurdham", "project": "LLEST",
+     "aliases": ["Ma vi Basabitti janakpurdham - 22"]},
+]
+UNKNOWN_SCHOOL = -1
+SCHOOL_ATTRIBUTES = ["name", "address", "district", "project", "old_nepali_story", "omit_pattern_item"]
+
+def school_dimension():
+    """
+    The school dimension table as a DataFrame indexed by school_id, with
+    SCHOOL_ATTRIBUTES as columns (rubric flags default to False).
+    """
+    table = pd.DataFrame(SCHOOL_TABLE).set_index("school_id")
+    for flag in ["old_nepali_story", "omit_pattern_item"]:
+        table[flag] = table.get(flag, pd.Series(False, index=table.index)).fillna(False).astype(bool)
+    return table[SCHOOL_ATTRIBUTES]
+
+def _school_lookup():
+    """Map every canonical name and alias to its school_id."""
+    lookup = {}
+    for row in SCHOOL_TABLE:
+        for name in [row["name"]] + row["aliases"]:
+            lookup[name] = row["school_id"]
+    return lookup
+
+def school_ids(names):
+    """
+    Integer school_id for each school name (any known spelling, ignoring
+    surrounding whitespace); UNKNOWN_SCHOOL for names not in SCHOOL_TABLE.
+    Each distinct name is looked up once.
+    """
+    codes, uniques = pd.factorize(pd.Series(names).astype(object), use_na_sentinel=True)
+    lookup = _school_lookup()
+    ids = np.array([lookup.get(str(name).strip(), UNKNOWN_SCHOOL) for name in uniques] + [UNKNOWN_SCHOOL],
+                   dtype=np.int16)
+    return ids[codes]
+
+def canonical_school_names(names):
+    """
+    Canonical name for each school name; unknown names are only stripped of
+    surrounding whitespace. Returns a Series aligned with `names`.
+    """
+    names = pd.Series(names)
+    canonical = school_dimension()["name"]
+    ids = school_ids(names)
+    return pd.Series(np.where(ids == UNKNOWN_SCHOOL, names.str.strip(),
+                              canonical.reindex(ids).to_numpy()), index=names.index, dtype=names.dtype)
+
+def school_attribute(df, attribute):
+    """
+    One SCHOOL_ATTRIBUTES value per row of df, joined on school_id (taken
+    from df['school_id'] when present, else resolved from df['school']).
+    Rubric flags are False for unknown schools.
+    """
+    ids = df["school_id"].to_numpy() if "school_id" in df.columns else school_ids(df["school"])
+    values = school_dimension()[attribute]
+    default = False if values.dtype == bool else None
+    return values.reindex(ids, fill_value=default).to_numpy()
+
+def school_flag(school, flag):
+    """Rubric flag of a school given by any known name; False for unknown schools."""
+    school_id = school_ids([school])[0]
+    return school_id != UNKNOWN_SCHOOL and bool(school_dimension().at[school_id, flag])
+
+def school_metadata():
+    """{canonical name: {"address", "district", "project"}} for display and crosstabs."""
+    table = school_dimension()
+    return {row["name"]: {"address": row["address"], "district": row["district"], "project": row["project"]}
+            for _, row in table.iterrows()}
+
+# -------------------------
+# RESPONSE ENCODING
+# -------------------------
+def encode_responses(df, ids):
+    """
+    Encode item responses as a float matrix (students x items): 1.0 for
+    'Correct', 0.0 for any other answer (e.g. 'Incorrect', 'No response')
+    and NaN where the item was not administered.
+    """
+    answers = df[ids]
+    return np.where(answers.isna(), np.nan, (answers == 'Correct').to_numpy(dtype=float))
+
+# Bits set in every byte value, for popcounts on numpy without bitwise_count (< 2.0).
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def popcount(words):
+    """Number of set bits in each row of a (students x words) uint64 matrix."""
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return _BYTE_POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+class ResponseBits:
+    """
+    Student x item responses packed into per-student bitsets of uint64 words:
+    one bit per item set when the answer is 'Correct', plus a second bitset
+    marking the items that were administered (not NaN).
+
+    A 25-item test fits in one word per student, so an "all items correct"
+    competency is a single AND-and-compare against the group's mask and
+    partial credit is a popcount.
+    """
+    def __init__(self, df, ids):
+        self.ids = list(ids)
+        self.index = df.index
+        self._position = {qID: i for i, qID in enumerate(self.ids)}
+        answers = df[self.ids]
+        self.correct = self._pack((answers == 'Correct').to_numpy())
+        self.answered = self._pack(answers.notna().to_numpy())
+
+    def _pack(self, bits):
+        packed_bytes = np.packbits(bits, axis=1, bitorder='little')
+        n_words = max(-(-packed_bytes.shape[1] // 8), 1)
+        packed = np.zeros((len(bits), n_words * 8), dtype=np.uint8)
+        packed[:, :packed_bytes.shape[1]] = packed_bytes
+        return packed.view('<u8').astype(np.uint64)
+
+    def mask(self, ids):
+        """Bitset (one row of words) with the bits of `ids` set."""
+        selected = np.zeros((1, len(self.ids)), dtype=bool)
+        selected[0, [self._position[qID] for qID in ids]] = True
+        return self._pack(selected)[0]
+
+    def all_correct(self, ids):
+        """Boolean array marking the students who answered every item in `ids` correctly."""
+        mask = self.mask(ids)
+        return ((self.correct & mask) == mask).all(axis=1)
+
+    def correct_count(self, ids):
+        """Number of items in `ids` each student answered correctly."""
+        return popcount(self.correct & self.mask(ids))
+
+    def answered_count(self, ids):
+        """Number of items in `ids` administered to each student."""
+        return popcount(self.answered & self.mask(ids))
+
+    def proportion_correct(self, ids):
+        """Share of the administered items in `ids` answered correctly (NaN when none were)."""
+        answered = self.answered_count(ids)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(answered > 0, self.correct_count(ids) / answered, np.nan)
+
+# -------------------------
+# RESULT TABLE
+# -------------------------
+# Breakdown dimensions reported by the analyses, mapped to their source columns.
+BREAKDOWN_DIMENSIONS = {"gender": "studentGender", "age": "studentAge", "grade": "grade"}
+RESULT_COLUMNS = ["dimension", "group", "competency", "count", "total"]
+
+NUMERACY_LABELS = {
+    "number_reading": "Number Reading",
+    "number_discrimination": "Number Discrimination",
+    "addition": "Addition",
+    "pattern_recognition": "Pattern Recognition",
+    "foundational_numeracy": "Foundational Numeracy"
+}
+READING_LABELS = {
+    "read_words": "Reading (Words)",
+    "literal": "Literal Comprehension",
+    "inferential": "Inferential Comprehension",
+    "foundational": "Foundational Reading"
+}
+
+def resolve_weights(df, weights):
+    """
+    Return sampling weights aligned with df as a float array.
+
+    weights may be a column name, a Series aligned with df, or a dict keyed
+    by school name or by (school, grade) tuples. Records without a weight
+    get weight 0 and drop out of the weighted estimates.
+    """
+    if isinstance(weights, str):
+        w = df[weights]
+    elif isinstance(weights, pd.Series):
+        w = weights.reindex(df.index)
+    elif isinstance(weights, dict):
+        lookup = pd.Series(weights, dtype=float)
+        if isinstance(lookup.index, pd.MultiIndex):
+            w = lookup.reindex(pd.MultiIndex.from_arrays([df['school'], df['grade']]))
+        else:
+            w = df['school'].map(lookup)
+    else:
+        w = weights
+    w = pd.to_numeric(pd.Series(np.asarray(w)), errors="coerce").fillna(0).to_numpy(dtype=float)
+    if len(w) != len(df):
+        raise ValueError("Sampling weights must have one value per record.")
+    if (w < 0).any():
+        raise ValueError("Sampling weights must be non-negative.")
+    return w
+
+def equal_school_weights(df):
+    """
+    Weights giving every school the same total weight, so averages across
+    schools are not dominated by the schools with the most students surveyed.
+    """
+    return 1.0 / df.groupby('school')['school'].transform('size')
+
+def _cluster_sums(df, values, dimensions, cluster_col="school"):
+    """
+    Sum the columns of `values` (an n x v array) per cluster and breakdown group.
+
+    Yields (dimension, groups, sums) with sums shaped (n_clusters, n_groups, v),
+    starting with the "overall" breakdown. Clusters are schools, or students
+    when fewer than two schools are present.
+    """
+    n_rows = len(df)
+    if cluster_col in df.columns and df[cluster_col].nunique() > 1:
+        clusters, _ = pd.factorize(df[cluster_col])
+    else:
+        clusters = np.arange(n_rows)
+    n_clusters = max(int(clusters.max()) + 1, 1) if n_rows else 1
+
+    breakdowns = [("overall", None)] + [(d, c) for d, c in dimensions.items() if c in df.columns]
+    for dimension, col in breakdowns:
+        if col is None:
+            codes, groups = np.zeros(n_rows, dtype=np.intp), ["All"]
+        else:
+            codes, groups = pd.factorize(df[col], sort=True)
+        valid = codes >= 0
+        cells = clusters[valid] * len(groups) + codes[valid]
+        sums = pd.DataFrame(values[valid]).groupby(cells).sum()
+        sums = sums.reindex(range(n_clusters * len(groups)), fill_value=0).to_numpy(dtype=float)
+        yield dimension, list(groups), sums.reshape(n_clusters, len(groups), values.shape[1])
+
+def results_frame(df, conditions, dimensions=None, ci=None, weights=None, cluster_col="school"):
+    """
+    Build the long-format result table for a set of competency conditions.
+
+    `conditions` maps competency names to boolean Series aligned with df.
+    Returns one row per (dimension, group, competency) holding the number of
+    students meeting the competency and the group total. Overall figures are
+    reported under dimension "overall", group "All".
+
+    weights (see resolve_weights) adds weighted_count, weighted_total and a
+    design-based standard error `se` (in percent) with schools as clusters.
+    ci adds ci_lower/ci_upper columns (in percent): "wilson" for Wilson score
+    intervals or "bootstrap" for a cluster bootstrap by school.
+    All of these come from the same grouped pass over the records.
+    """
+    if dimensions is None:
+        dimensions = BREAKDOWN_DIMENSIONS
+    if ci not in (None, "wilson", "bootstrap"):
+        raise ValueError(f"Unknown confidence interval method: {ci}")
+    met = pd.DataFrame(conditions, index=df.index)
+    competencies = list(met.columns)
+    n_comp = len(competencies)
+    met = met.to_numpy(dtype=float)
+    w = np.ones(len(df)) if weights is None else resolve_weights(df, weights)
+
+    # Value columns: met, weighted met, records, weight, squared weight.
+    values = np.column_stack([met, met * w[:, None], np.ones(len(df)), w, w**2])
+    weighted = slice(n_comp, 2 * n_comp)
+    records, weight, weight_sq = 2 * n_comp, 2 * n_comp + 1, 2 * n_comp + 2
+
+    frames, count_blocks, total_blocks = [], [], []
+    for dimension, groups, sums in _cluster_sums(df, values, dimensions, cluster_col):
+        totals = sums.sum(axis=0)
+        frame = pd.DataFrame({
+            "dimension": dimension,
+            "group": np.repeat(np.array(groups, dtype=object), n_comp),
+            "competency": np.tile(competencies, len(groups)),
+            "count": totals[:, :n_comp].ravel().round().astype(int),
+            "total": np.repeat(totals[:, records], n_comp).round().astype(int)
+        })
+        if weights is not None:
+            frame["weighted_count"] = totals[:, weighted].ravel()
+            frame["weighted_total"] = np.repeat(totals[:, weight], n_comp)
+            frame["se"] = linearized_se(sums[:, :, weighted], sums[:, :, weight]).ravel()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                frame["effective_total"] = np.repeat(totals[:, weight]**2 / totals[:, weight_sq], n_comp)
+            count_blocks.append(sums[:, :, weighted].reshape(len(sums), -1))
+            total_blocks.append(np.repeat(sums[:, :, weight], n_comp, axis=1))
+        else:
+            count_blocks.append(sums[:, :, :n_comp].reshape(len(sums), -1))
+            total_blocks.append(np.repeat(sums[:, :, records], n_comp, axis=1))
+        frames.append(frame)
+    results = pd.concat(frames, ignore_index=True)
+
+    if ci == "wilson":
+        if weights is None:
+            results["ci_lower"], results["ci_upper"] = wilson_interval(results["count"], results["total"])
+        else:
+            # Wilson interval on the Kish effective sample size.
+            n_eff = results.pop("effective_total")
+            rate = results["weighted_count"] / results["weighted_total"]
+            results["ci_lower"], results["ci_upper"] = wilson_interval(rate * n_eff, n_eff)
+    elif ci == "bootstrap":
+        results["ci_lower"], results["ci_upper"] = bootstrap_intervals(
+            np.hstack(count_blocks), np.hstack(total_blocks))
+    return results.drop(columns="effective_total", errors="ignore")
+
+def result_rates(results):
+    """
+    Percentage for every row of a result table, using the weighted columns
+    when present. Groups with no students get 0.
+    """
+    if "weighted_total" in results.columns:
+        count, total = results["weighted_count"], results["weighted_total"]
+    else:
+        count, total = results["count"], results["total"]
+    return (count / total.where(total > 0)).fillna(0) * 100
+
+def overall_rate(results, competency):
+    """
+    Return (percentage, count, total) for the overall row of a competency.
+    The percentage is weighted when the table carries weighted columns.
+    """
+    rows = results[(results["dimension"] == "overall") & (results["competency"] == competency)]
+    row = rows.iloc[0]
+    return float(result_rates(rows).iloc[0]), int(row["count"]), int(row["total"])
+
+# ---------------------------
+# Confidence Intervals
+# ---------------------------
+BOOTSTRAP_REPLICATES = 2000
+
+def wilson_interval(count, total, confidence=0.95):
+    """
+    Wilson score interval for count/total, returned as (lower, upper)
+    arrays in percent. Groups with no students get NaN bounds.
+    """
+    count = np.asarray(count, dtype=float)
+    total = np.asarray(total, dtype=float)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = count / total
+        denom = 1 + z**2 / total
+        centre = (p + z**2 / (2 * total)) / denom
+        half_width = z * np.sqrt(p * (1 - p) / total + z**2 / (4 * total**2)) / denom
+    return (centre - half_width) * 100, (centre + half_width) * 100
+
+def linearized_se(cluster_counts, cluster_totals):
+    """
+    Design-based standard error (in percent) of the ratio estimator
+    sum(counts) / sum(totals), by Taylor linearization with clusters drawn
+    with replacement.
+
+    cluster_counts has shape (n_clusters, n_groups, n_competencies) and
+    cluster_totals (n_clusters, n_groups). Groups observed in fewer than two
+    clusters get NaN.
+    """
+    totals = cluster_totals.sum(axis=0)
+    n_clusters = (cluster_totals > 0).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = cluster_counts.sum(axis=0) / totals[:, None]
+        residuals = cluster_counts - rate[None] * cluster_totals[:, :, None]
+        factor = np.where(n_clusters > 1, n_clusters / (n_clusters - 1), np.nan)
+        variance = factor[:, None] * (residuals**2).sum(axis=0) / totals[:, None]**2
+    return np.sqrt(variance) * 100
+
+def bootstrap_intervals(cluster_counts, cluster_totals, n_boot=BOOTSTRAP_REPLICATES, confidence=0.95, seed=None):
+    """
+    Cluster bootstrap percentile intervals (in percent) for the rates
+    cluster_counts.sum(0) / cluster_totals.sum(0), both shaped (n_clusters, n_cells).
+
+    Clusters are resampled with replacement as an (n_boot, n_clusters) index
+    matrix; replicate rates for every cell then come from one matrix product
+    with the per-cluster tables. Cells empty in every replicate get NaN.
+    """
+    n_clusters = cluster_counts.shape[0]
+    rng = np.random.default_rng(seed)
+    # Resample clusters in chunks so the weight matrix stays small.
+    chunk = max(1, min(n_boot, 4_000_000 // n_clusters))
+    rates = np.empty((n_boot, cluster_counts.shape[1]))
+    for start in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - start)
+        picks = rng.integers(0, n_clusters, size=(size, n_clusters))
+        picks += (np.arange(size) * n_clusters)[:, None]
+        resampled = np.bincount(picks.ravel(), minlength=size * n_clusters).reshape(size, n_clusters)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates[start:start + size] = (resampled @ cluster_counts) / (resampled @ cluster_totals)
+
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = np.nanpercentile(rates, [tail, 100 - tail], axis=0) * 100
+    return lower, upper
 
 # ---------------------------
 # Numeracy Analysis Functions
 # ---------------------------
-def numeracy_analysis(df, ids, school=None, printText=True):
+def numeracy_item_groups(ids, school=None):
+    """
+    Return the question IDs making up each numeracy competency.
+    """
+    groups = {
+        "number_reading": [ids[i] for i in [0, 1, 2, 3, 4, 5]],
+        "number_discrimination": [ids[i] for i in [6, 7, 8, 9, 10]],
+        "addition": [ids[i] for i in [11, 12, 13, 14, 15]],
+        "pattern_recognition": [ids[i] for i in [18, 19, 20, 21]] #not included "FL27_cleaned5"
+    }
+    # Include "FL27_cleaned5" unless the school is flagged omit_pattern_item in SCHOOL_TABLE
+    if school is None or not school_flag(school, "omit_pattern_item"):
+        groups["pattern_recognition"].append("FL27_cleaned5")
+    return groups
+
+def numeracy_conditions(df, item_groups, bits=None):
+    """
+    Return a dict of boolean Series, one per numeracy competency, marking the
+    students who answered every question of the group correctly.
+    Students of schools flagged omit_pattern_item are scored without FL27_cleaned5.
+    `bits` reuses a ResponseBits encoding of df covering the items.
+    """
+    if bits is None:
+        bits = ResponseBits(df, list(dict.fromkeys(q for qIDs in item_groups.values() for q in qIDs)))
+    conditions = {name: pd.Series(bits.all_correct(qIDs), index=df.index) for name, qIDs in item_groups.items()}
+    pattern_ids = item_groups.get("pattern_recognition", [])
+    if "FL27_cleaned5" in pattern_ids:
+        omitted = school_attribute(df, "omit_pattern_item")
+        if omitted.any():
+            reduced = bits.all_correct([q for q in pattern_ids if q != "FL27_cleaned5"])
+            conditions["pattern_recognition"] = pd.Series(
+                np.where(omitted, reduced, conditions["pattern_recognition"]), index=df.index)
+    conditions["foundational_numeracy"] = (
+        conditions["number_reading"] & conditions["number_discrimination"] &
+        conditions["addition"] & conditions["pattern_recognition"]
+    )
+    return conditions
+
+@sc.memoized
+def numeracy_analysis(df, ids, school=None, printText=True, as_frame=False, ci=None, weights=None):
     """
     Perform numeracy analysis on the provided DataFrame.
     Returns breakdowns by overall performance, gender, age, and grade.
+    With as_frame=True the breakdowns are returned as a long-format result
+    table (see results_frame) instead of nested dicts; ci ("wilson" or
+    "bootstrap") then adds a confidence interval to every rate and weights
+    (see resolve_weights) adds weighted estimates with standard errors.
     """
     if school is not None and school.lower() != "all":
         df = df[df['school'] == school]
     
     if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.get_level_values(0)
+        df = df.set_axis(df.columns.get_level_values(0), axis=1)
     
     total_students = df.shape[0]
     genders = df['studentGender'].unique()
     
-    # Define groups of question IDs
-    number_reading_qIDs = [ids[i] for i in [0, 1, 2, 3, 4, 5]]
-    number_discrim_qIDs = [ids[i] for i in [6, 7, 8, 9, 10]]
-    addition_qIDs = [ids[i] for i in [11, 12, 13, 14, 15]]
-    pattern_recog_qIDs = [ids[i] for i in [18, 19, 20, 21]] #not included "FL27_cleaned5"
-
-    # If school is not "Ghami Solar Basic School" or "Siddhartha Kula Basic School", include "FL27_cleaned5"
-    if school not in ["Ghami Solar Basic School", "Siddhartha Kula Basic School"]:
-        pattern_recog_qIDs.append("FL27_cleaned5")
-            
-    # Conditions for correct responses
-    condition_reading = (df[number_reading_qIDs] == 'Correct').all(axis=1)
-    condition_discrimination = (df[number_discrim_qIDs] == 'Correct').all(axis=1)
-    condition_addition = (df[addition_qIDs] == 'Correct').all(axis=1)
-    condition_pattern = (df[pattern_recog_qIDs] == 'Correct').all(axis=1)
-    condition_all = condition_reading & condition_discrimination & condition_addition & condition_pattern
+    # Define groups of question IDs and the conditions for correct responses
+    item_groups = numeracy_item_groups(ids, school)
+    conditions = numeracy_conditions(df, item_groups)
+
+    if as_frame:
+        if printText:
+            print("Numeracy analysis complete.")
+        return results_frame(df, conditions, ci=ci, weights=weights)
+
+    number_reading_qIDs = item_groups["number_reading"]
+    condition_reading = conditions["number_reading"]
+    condition_discrimination = conditions["number_discrimination"]
+    condition_addition = conditions["addition"]
+    condition_pattern = conditions["pattern_recognition"]
+    condition_all = conditions["foundational_numeracy"]
 
     def calculate_percentage_and_gender_results(condition):
         df_meeting = df[condition]
@@ -180,34 +695,58 @@ def numeracy_analysis(df, ids, school=None, printText=True):
 # ---------------------------
 # Reading Analysis Functions
 # ---------------------------
-def reading_analysis(df, ids, total_words_read=None, lang="English", school=None, printText=True):
+def reading_comprehension_ids(ids, lang="English", newNepaliStory=True):
     """
-    Perform reading analysis on the provided DataFrame.
-    Returns breakdowns by overall performance, gender, age, and grade.
-    
-    Parameters:
-      - df: DataFrame containing survey records.
-      - ids: List of question IDs for the reading task.
-      - total_words_read: Optional override for the total number of words.
-      - lang: "English" or "Nepali"
-      - school: Filter by school (if provided)
-      - printText: Whether to print a completion message.
+    Return the (literal, inferential) comprehension question IDs of a story.
+    The first ID (index 0) holds the number of words read and is not included.
     """
-    # # Filter by school if provided
-    # if school is not None and school.lower() != "all":
-    #     df = df[df['school'] == school]
+    if lang == "Nepali" and newNepaliStory:
+        # For Nepali new story, use one additional literal comprehension question and only one inferential question.
+        return [ids[i] for i in [1, 2, 3, 4]], [ids[5]]
+    # For English and the Nepali old story, use three literal questions and two inferential questions.
+    return [ids[i] for i in [1, 2, 3]], [ids[i] for i in [4, 5]]
+
+def reading_conditions(df, qID, required_correct_words, lit_comp_qIDs, inf_comp_qIDs, bits=None):
+    """
+    Return a dict of boolean Series, one per reading competency.
+    Students without a words-read count never meet a competency.
+    `bits` reuses a ResponseBits encoding of df covering the comprehension items.
+    """
+    words_read = pd.to_numeric(df[qID], errors='coerce')
+    condition_reading_story = words_read >= required_correct_words
+    if bits is None:
+        lit_correct = (df[lit_comp_qIDs] == 'Correct').all(axis=1)
+        inf_correct = (df[inf_comp_qIDs].astype(str) == 'Correct').all(axis=1)
+    else:
+        lit_correct = pd.Series(bits.all_correct(lit_comp_qIDs), index=df.index)
+        inf_correct = pd.Series(bits.all_correct(inf_comp_qIDs), index=df.index)
+    condition_lit_comp = condition_reading_story & lit_correct
+    condition_inf_comp = condition_reading_story & inf_correct
+    # Overall reading condition: words read plus both comprehension parts.
+    return {
+        "read_words": condition_reading_story,
+        "literal": condition_lit_comp,
+        "inferential": condition_inf_comp,
+        "foundational": condition_reading_story & condition_lit_comp & condition_inf_comp
+    }
 
+def reading_story(df, total_words_read=None, lang="English", school=None):
+    """
+    Return (total_words, newNepaliStory) for a reading task.
+    The story version follows `school`, or the school in df when it holds only one.
+    """
     # Auto-detect school if not provided and only one unique school exists
     if school is None:
         unique_schools = df['school'].unique()
         if len(unique_schools) == 1:
             school = unique_schools[0]
     
-    # Determine if using the new Nepali story (for all schools except Ghami Solar Basic School and Siddhartha Kula Basic School)
-    newNepaliStory = True
-    if school in ["Ghami Solar Basic School", "Siddhartha Kula Basic School"]:
-        newNepaliStory = False
+    # Use the new Nepali story unless the school is flagged old_nepali_story in SCHOOL_TABLE
+    newNepaliStory = school is None or not school_flag(school, "old_nepali_story")
+    return story_total_words(total_words_read, lang, newNepaliStory), newNepaliStory
 
+def story_total_words(total_words_read=None, lang="English", newNepaliStory=True):
+    """Number of words in a story, or total_words_read when given."""
     # Set total_words: override if total_words_read provided; otherwise, use defaults.
     if total_words_read is not None:
         total_words = total_words_read
@@ -219,70 +758,95 @@ def reading_analysis(df, ids, total_words_read=None, lang="English", school=None
                 total_words = 60
             else:
                 total_words = 48
+    return total_words
+
+def story_rows(df, lang="English", school=None):
+    """
+    Split the rows of df by the story they were scored on. Returns a list of
+    (newNepaliStory, boolean row mask) pairs, skipping versions with no rows.
+    With `school` given every row follows that school; otherwise each row
+    follows its own school's old_nepali_story flag (Nepali only).
+    """
+    if school is not None or lang != "Nepali":
+        return [(reading_story(df, lang=lang, school=school)[1], np.ones(len(df), dtype=bool))]
+    old = school_attribute(df, "old_nepali_story").astype(bool)
+    return [(newNepaliStory, rows) for newNepaliStory, rows in [(True, ~old), (False, old)] if rows.any()]
+
+def school_reading_conditions(df, ids, total_words_read=None, lang="English", school=None, bits=None):
+    """
+    reading_conditions with every row scored on its school's story: its
+    words-read cutoff (90% of the story) and comprehension questions.
+    """
+    conditions = None
+    for newNepaliStory, rows in story_rows(df, lang, school):
+        required_correct_words = int(0.9 * story_total_words(total_words_read, lang, newNepaliStory))
+        lit_ids, inf_ids = reading_comprehension_ids(ids, lang, newNepaliStory)
+        story = reading_conditions(df, ids[0], required_correct_words, lit_ids, inf_ids, bits)
+        if conditions is None:
+            conditions = story
+        else:
+            conditions = {name: pd.Series(np.where(rows, story[name], met), index=df.index)
+                          for name, met in conditions.items()}
+    if conditions is None:
+        return reading_conditions(df, ids[0], 0, *reading_comprehension_ids(ids, lang), bits=bits)
+    return conditions
+
+def reading_rubric(df, ids, total_words_read=None, lang="English", school=None):
+    """
+    Return (required_correct_words, lit_comp_qIDs, inf_comp_qIDs) for a reading task.
+    The story version follows `school`, or the school in df when it holds only one.
+    """
+    total_words, newNepaliStory = reading_story(df, total_words_read, lang, school)
+    required_correct_words = int(0.9 * total_words)  # 90% threshold
+    lit_comp_qIDs, inf_comp_qIDs = reading_comprehension_ids(ids, lang, newNepaliStory)
+    return required_correct_words, lit_comp_qIDs, inf_comp_qIDs
+
+@sc.memoized
+def reading_analysis(df, ids, total_words_read=None, lang="English", school=None, printText=True,
+                     as_frame=False, ci=None, weights=None):
+    """
+    Perform reading analysis on the provided DataFrame.
+    Returns breakdowns by overall performance, gender, age, and grade.
+    
+    Parameters:
+      - df: DataFrame containing survey records.
+      - ids: List of question IDs for the reading task.
+      - total_words_read: Optional override for the total number of words.
+      - lang: "English" or "Nepali"
+      - school: Filter by school (if provided)
+      - printText: Whether to print a completion message.
+      - as_frame: Return a long-format result table (see results_frame) instead of nested dicts.
+      - ci: With as_frame, add confidence intervals to every rate ("wilson" or "bootstrap").
+      - weights: With as_frame, sampling weights for weighted estimates (see resolve_weights).
+    """
+    # # Filter by school if provided
+    # if school is not None and school.lower() != "all":
+    #     df = df[df['school'] == school]
 
     if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.get_level_values(0)
+        df = df.set_axis(df.columns.get_level_values(0), axis=1)
     
     total_students = df.shape[0]
     genders = df['studentGender'].unique()
     
-    required_correct_words = int(0.9 * total_words)  # 90% threshold
-
     # The first ID (index 0) is assumed to hold the number of words read correctly.
     qID = ids[0]
-    df.loc[:, qID] = pd.to_numeric(df[qID], errors='coerce')
+
+    if as_frame:
+        conditions = school_reading_conditions(df, ids, total_words_read, lang, school)
+        if printText:
+            print("Reading analysis (lang=%s) complete." % lang)
+        return results_frame(df, conditions, ci=ci, weights=weights)
+
+    df = df.assign(**{qID: pd.to_numeric(df[qID], errors='coerce')})
     df = df.dropna(subset=[qID])
     
-    # Define comprehension question groups based on language and story version.
-    if lang == "English":
-        # For English, use three literal questions and two inferential questions.
-        lit_comp_qIDs = [ids[i] for i in [0, 1, 2, 3]]
-        inf_comp_qIDs = [ids[i] for i in [0, 4, 5]]
-        condition_lit_comp = (
-            (df[qID] >= required_correct_words) &
-            (df[lit_comp_qIDs[1]] == 'Correct') &
-            (df[lit_comp_qIDs[2]] == 'Correct') &
-            (df[lit_comp_qIDs[3]] == 'Correct')
-        )
-        condition_inf_comp = (
-            (df[qID] >= required_correct_words) &
-            (df[inf_comp_qIDs[1]].astype(str) == 'Correct') &
-            (df[inf_comp_qIDs[2]].astype(str) == 'Correct')
-        )
-    elif lang == "Nepali" and not newNepaliStory:
-        # For Nepali old story, mimic the English structure.
-        lit_comp_qIDs = [ids[i] for i in [0, 1, 2, 3]]
-        inf_comp_qIDs = [ids[i] for i in [0, 4, 5]]
-        condition_lit_comp = (
-            (df[qID] >= required_correct_words) &
-            (df[lit_comp_qIDs[1]] == 'Correct') &
-            (df[lit_comp_qIDs[2]] == 'Correct') &
-            (df[lit_comp_qIDs[3]] == 'Correct')
-        )
-        condition_inf_comp = (
-            (df[qID] >= required_correct_words) &
-            (df[inf_comp_qIDs[1]].astype(str) == 'Correct') &
-            (df[inf_comp_qIDs[2]].astype(str) == 'Correct')
-        )
-    elif lang == "Nepali" and newNepaliStory:
-        # For Nepali new story, use one additional literal comprehension question and only one inferential question.
-        lit_comp_qIDs = [ids[i] for i in [0, 1, 2, 3, 4]]
-        inf_comp_qIDs = [ids[i] for i in [0, 5]]
-        condition_lit_comp = (
-            (df[qID] >= required_correct_words) &
-            (df[lit_comp_qIDs[1]] == 'Correct') &
-            (df[lit_comp_qIDs[2]] == 'Correct') &
-            (df[lit_comp_qIDs[3]] == 'Correct') &
-            (df[lit_comp_qIDs[4]] == 'Correct')
-        )
-        condition_inf_comp = (
-            (df[qID] >= required_correct_words) &
-            (df[inf_comp_qIDs[1]].astype(str) == 'Correct')
-        )
-    
-    # Overall reading condition: words read plus both comprehension parts.
-    condition_reading_story = df[qID] >= required_correct_words
-    condition_all = condition_reading_story & condition_lit_comp & condition_inf_comp
+    # Every row is scored on its school's story, as with as_frame=True.
+    conditions = school_reading_conditions(df, ids, total_words_read, lang, school)
+    condition_reading_story = conditions["read_words"]
+    condition_lit_comp = conditions["literal"]
+    condition_inf_comp = conditions["inferential"]
+    condition_all = conditions["foundational"]
     
     # Helper: Calculate percentages by a grouping column.
     def calculate_percentage_by_group(condition, group_by_col):
@@ -301,10 +865,9 @@ def reading_analysis(df, ids, total_words_read=None, lang="English", school=None
         percentage_meeting = (count_meeting / total_students) * 100 if total_students else 0
         gender_results = {}
         for gender in genders:
-            df_gender = df[df['studentGender'] == gender]
-            total_gender = df_gender.shape[0]
-            gender_condition = df_gender[qID] >= required_correct_words
-            count_gender = df_gender[gender_condition].shape[0]
+            is_gender = df['studentGender'] == gender
+            total_gender = int(is_gender.sum())
+            count_gender = int((is_gender & condition_reading_story).sum())
             percentage_gender = (count_gender / total_gender) * 100 if total_gender else 0
             gender_results[gender] = {
                 "total_students": total_gender,
@@ -347,27 +910,11 @@ def reading_analysis(df, ids, total_words_read=None, lang="English", school=None
     def analysis_gender():
         results = {}
         for gender in genders:
-            sub_df = df[df['studentGender'] == gender]
-            total_gender = sub_df.shape[0]
+            is_gender = df['studentGender'] == gender
+            total_gender = is_gender.sum()
             if total_gender > 0:
-                results[gender] = {
-                    "read_words": (sub_df[qID] >= required_correct_words).sum() / total_gender * 100,
-                    "literal": (((sub_df[qID] >= required_correct_words) & 
-                                 (sub_df[lit_comp_qIDs[1]] == 'Correct') & 
-                                 (sub_df[lit_comp_qIDs[2]] == 'Correct') & 
-                                 (sub_df[lit_comp_qIDs[3]] == 'Correct')).sum() / total_gender * 100),
-                    "inferential": (((sub_df[qID] >= required_correct_words) & 
-                                     (sub_df[inf_comp_qIDs[1]].astype(str) == 'Correct') & 
-                                     (sub_df[inf_comp_qIDs[2]].astype(str) == 'Correct') if len(inf_comp_qIDs) > 2 
-                                     else (sub_df[inf_comp_qIDs[1]].astype(str) == 'Correct')).sum() / total_gender * 100),
-                    "foundational": (((sub_df[qID] >= required_correct_words) & 
-                                      (sub_df[lit_comp_qIDs[1]] == 'Correct') & 
-                                      (sub_df[lit_comp_qIDs[2]] == 'Correct') & 
-                                      (sub_df[lit_comp_qIDs[3]] == 'Correct') &
-                                      ((sub_df[inf_comp_qIDs[1]].astype(str) == 'Correct') & 
-                                       (sub_df[inf_comp_qIDs[2]].astype(str) == 'Correct') if len(inf_comp_qIDs) > 2 
-                                       else (sub_df[inf_comp_qIDs[1]].astype(str) == 'Correct'))).sum() / total_gender * 100)
-                }
+                results[gender] = {name: (is_gender & condition).sum() / total_gender * 100
+                                   for name, condition in conditions.items()}
         return results
     
     def analysis_grade():
@@ -393,6 +940,265 @@ def reading_analysis(df, ids, total_words_read=None, lang="English", school=None
     
     return analysis_results
 
+SWEEP_THRESHOLDS = np.arange(50, 101)  # percent of the story's words
+
+@sc.memoized
+def reading_threshold_sweep(df, ids, total_words_read=None, lang="English", school=None,
+                            thresholds=SWEEP_THRESHOLDS, dimensions=None, weights=None):
+    """
+    Reading competency rates for every words-correct threshold at once.
+
+    Instead of re-running reading_analysis per cutoff, each student gets the
+    number of cutoffs their words-read count meets, each breakdown group's
+    students are counted once per (cutoffs met, comprehension outcome) and a
+    reverse cumulative sum gives the number meeting any given cutoff. Every
+    student is scored on their school's story (see school_reading_conditions).
+
+    Parameters:
+      - thresholds: Cutoffs in percent of the story's words (default 50-100).
+      - dimensions, weights: As for results_frame.
+
+    Returns a long-format table with one row per (dimension, group, threshold,
+    competency) and columns threshold, required_words, count, total (plus
+    weighted_count/weighted_total with weights); see threshold_results.
+    """
+    if dimensions is None:
+        dimensions = BREAKDOWN_DIMENSIONS
+    thresholds = np.unique(np.asarray(thresholds))
+    n_levels = len(thresholds) + 1
+
+    # Each student's level is the number of thresholds met on their school's
+    # story (see story_rows); students without a usable count meet none.
+    words = pd.to_numeric(df[ids[0]], errors='coerce').to_numpy(dtype=float)
+    level = np.zeros(len(df), dtype=np.intp)
+    lit_ok = np.zeros(len(df), dtype=bool)
+    inf_ok = np.zeros(len(df), dtype=bool)
+    required_by_story = []
+    for newNepaliStory, rows in story_rows(df, lang, school):
+        total_words = story_total_words(total_words_read, lang, newNepaliStory)
+        required = np.floor(thresholds * total_words / 100 + 1e-9).astype(int)
+        required_by_story.append(required)
+        lit_ids, inf_ids = reading_comprehension_ids(ids, lang, newNepaliStory)
+        story_words = np.where(np.isnan(words[rows]), -np.inf, words[rows])
+        level[rows] = np.searchsorted(required, story_words, side='right')
+        lit_ok[rows] = (df.loc[rows, lit_ids] == 'Correct').all(axis=1).to_numpy()
+        inf_ok[rows] = (df.loc[rows, inf_ids].astype(str) == 'Correct').all(axis=1).to_numpy()
+    # Words required per threshold; blank when rows were scored on different stories.
+    required_words = pd.array(required_by_story[0] if len(required_by_story) == 1 else
+                              [pd.NA] * len(thresholds), dtype="Int64")
+    outcomes = {
+        "read_words": np.ones(len(df), dtype=bool),
+        "literal": lit_ok,
+        "inferential": inf_ok,
+        "foundational": lit_ok & inf_ok
+    }
+    w = np.ones(len(df)) if weights is None else resolve_weights(df, weights)
+
+    frames = []
+    breakdowns = [("overall", None)] + [(d, c) for d, c in dimensions.items() if c in df.columns]
+    for dimension, col in breakdowns:
+        if col is None:
+            codes, groups = np.zeros(len(df), dtype=np.intp), ["All"]
+        else:
+            codes, groups = pd.factorize(df[col], sort=True)
+        valid = codes >= 0
+        n_groups = len(groups)
+        cells = codes[valid] * n_levels + level[valid]
+        size = n_groups * n_levels
+        totals = np.bincount(codes[valid], minlength=n_groups)
+        weight_totals = np.bincount(codes[valid], weights=w[valid], minlength=n_groups)
+        counts = {"count": [], "weighted_count": []}
+        for ok in outcomes.values():
+            keep = ok[valid]
+            for name, cell_weights in [("count", None), ("weighted_count", w[valid][keep])]:
+                hist = np.bincount(cells[keep], weights=cell_weights, minlength=size).reshape(n_groups, n_levels)
+                # at_least[g, k] = students in group g meeting at least k thresholds.
+                at_least = np.cumsum(hist[:, ::-1], axis=1)[:, ::-1]
+                counts[name].append(at_least[:, 1:])
+        # Rows ordered by group, then competency, then threshold (as in results_frame).
+        n_rows = len(outcomes) * len(thresholds)
+        frame = pd.DataFrame({
+            "dimension": dimension,
+            "group": np.repeat(np.array(groups, dtype=object), n_rows),
+            "threshold": np.tile(thresholds, n_groups * len(outcomes)),
+            "required_words": required_words[np.tile(np.arange(len(thresholds)), n_groups * len(outcomes))],
+            "competency": np.tile(np.repeat(list(outcomes), len(thresholds)), n_groups),
+            "count": np.stack(counts["count"], axis=1).ravel().round().astype(int),
+            "total": np.repeat(totals, n_rows)
+        })
+        if weights is not None:
+            frame["weighted_count"] = np.stack(counts["weighted_count"], axis=1).ravel()
+            frame["weighted_total"] = np.repeat(weight_totals, n_rows)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def threshold_results(sweep, threshold):
+    """
+    Rows of a threshold sweep for one cutoff, as a result table that the
+    plotting functions accept (see plot_reading_results).
+    """
+    rows = sweep[sweep["threshold"] == threshold]
+    if rows.empty:
+        raise ValueError(f"Threshold {threshold} is not part of the sweep.")
+    return rows.drop(columns=["threshold", "required_words"]).reset_index(drop=True)
+
+# ---------------------------
+# Fused Scoring
+# ---------------------------
+COMPOSITE_LABELS = {"all_foundational": "All Foundational Skills"}
+
+# Domains scored by score_all, with the labels of their competencies.
+SCORE_DOMAINS = {
+    "numeracy": NUMERACY_LABELS,
+    "english_reading": READING_LABELS,
+    "nepali_reading": READING_LABELS,
+    "composite": COMPOSITE_LABELS
+}
+# Headline competency of each domain.
+FOUNDATIONAL_COMPETENCIES = {
+    "numeracy": "foundational_numeracy",
+    "english_reading": "foundational",
+    "nepali_reading": "foundational",
+    "composite": "all_foundational"
+}
+
+def fused_conditions(df, numeracy_ids=numeracy_ids, eng_ids=long_eng_reading_ids, nep_ids=long_nep_reading_ids,
+                     school=None):
+    """
+    Competency conditions of every domain in SCORE_DOMAINS, as a dict of
+    domain -> {competency: boolean Series}. All items are packed into one
+    ResponseBits encoding shared by the domains; the composite
+    "all_foundational" marks students foundational in numeracy and in both
+    reading languages.
+    """
+    item_groups = numeracy_item_groups(numeracy_ids, school)
+    items = [q for qIDs in item_groups.values() for q in qIDs] + list(eng_ids[1:]) + list(nep_ids[1:])
+    bits = ResponseBits(df, list(dict.fromkeys(items)))
+    conditions = {
+        "numeracy": numeracy_conditions(df, item_groups, bits),
+        "english_reading": school_reading_conditions(df, eng_ids, lang="English", school=school, bits=bits),
+        "nepali_reading": school_reading_conditions(df, nep_ids, lang="Nepali", school=school, bits=bits)
+    }
+    conditions["composite"] = {"all_foundational": (
+        conditions["numeracy"]["foundational_numeracy"] &
+        conditions["english_reading"]["foundational"] &
+        conditions["nepali_reading"]["foundational"]
+    )}
+    return conditions
+
+@sc.memoized
+def score_all(df, numeracy_ids=numeracy_ids, eng_ids=long_eng_reading_ids, nep_ids=long_nep_reading_ids,
+              school=None, dimensions=None, ci=None, weights=None):
+    """
+    Score numeracy, English reading, Nepali reading and the all-foundational
+    composite in one pass: the responses are encoded once (fused_conditions)
+    and every competency of every domain is summed in a single results_frame
+    call, so the breakdown groups are factorized once for all domains.
+
+    Returns a result table with a leading `domain` column; domain_results
+    splits out the table numeracy_analysis or reading_analysis would return.
+    `school` fixes the rubric (as in numeracy_item_groups and reading_story);
+    otherwise each row is scored on its own school's rubric.
+    """
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.set_axis(df.columns.get_level_values(0), axis=1)
+    conditions = {
+        f"{domain}:{competency}": met
+        for domain, domain_conditions in fused_conditions(df, numeracy_ids, eng_ids, nep_ids, school).items()
+        for competency, met in domain_conditions.items()
+    }
+    results = results_frame(df, conditions, dimensions=dimensions, ci=ci, weights=weights)
+    domain_competency = results["competency"].str.split(":", n=1, expand=True)
+    results["competency"] = domain_competency[1]
+    results.insert(0, "domain", domain_competency[0])
+    return results
+
+def domain_results(scores, domain):
+    """Rows of a score_all table for one domain, without the domain column."""
+    if domain not in SCORE_DOMAINS:
+        raise ValueError(f"Unknown domain: {domain}")
+    rows = scores[scores["domain"] == domain]
+    return rows.drop(columns="domain").reset_index(drop=True)
+
+def domain_rates(scores, competencies, dimension="overall"):
+    """
+    Percentages of one competency per domain (e.g. {"numeracy":
+    "foundational_numeracy", ...}) for every group of a breakdown
+    dimension, as a DataFrame with one row per group and one column per domain.
+    """
+    rows = scores[scores["dimension"] == dimension]
+    rows = rows[rows["competency"] == rows["domain"].map(competencies)]
+    return rows.assign(rate=result_rates(rows)).pivot(index="group", columns="domain", values="rate")[
+        list(competencies)]
+
+def breakdown_cube(df, dimensions=None):
+    """
+    Competency counts of every domain (see fused_conditions) per school and
+    breakdown group: one row per (school, dimension, group, domain,
+    competency) with count and total. Counts add up across schools, so the
+    result table for any set of schools is a sum over this cube (see
+    cube_results) and the cube of new records can be merged in (see
+    merge_breakdowns).
+    """
+    if dimensions is None:
+        dimensions = BREAKDOWN_DIMENSIONS
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.set_axis(df.columns.get_level_values(0), axis=1)
+    conditions = {
+        f"{domain}:{competency}": met
+        for domain, domain_conditions in fused_conditions(df).items()
+        for competency, met in domain_conditions.items()
+    }
+    names = list(conditions)
+    values = pd.DataFrame(conditions, index=df.index).astype(float)
+    values["total"] = 1.0
+
+    frames = []
+    for dimension, col in [("overall", None)] + [(d, c) for d, c in dimensions.items() if c in df.columns]:
+        group = pd.Series("All", index=df.index) if col is None else df[col]
+        sums = values.groupby([df["school"].rename("school"), group.rename("group")], sort=True).sum()
+        frame = sums.index.to_frame(index=False).loc[np.repeat(np.arange(len(sums)), len(names))]
+        frame = frame.reset_index(drop=True)
+        frame.insert(1, "dimension", dimension)
+        domain_competency = pd.Series(np.tile(names, len(sums))).str.split(":", n=1, expand=True)
+        frame["domain"], frame["competency"] = domain_competency[0], domain_competency[1]
+        frame["count"] = sums[names].to_numpy().ravel().round().astype(int)
+        frame["total"] = np.repeat(sums["total"].to_numpy(), len(names)).round().astype(int)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def merge_breakdowns(*cubes):
+    """Breakdown cube of the union of disjoint sets of records, from their cubes alone."""
+    cube = pd.concat(cubes, ignore_index=True)
+    keys = ["school", "dimension", "group", "domain", "competency"]
+    return cube.groupby(keys, sort=False)[["count", "total"]].sum().reset_index()
+
+def cube_results(cube, schools=None, dimensions=None, domains=None, competencies=None):
+    """
+    Result table (as score_all would return for the records of `schools`,
+    all when None) summed from a breakdown cube, optionally limited to some
+    dimensions, domains and competencies, with a percentage column.
+    """
+    rows = cube
+    for col, accepted in [("school", schools), ("dimension", dimensions),
+                          ("domain", domains), ("competency", competencies)]:
+        if accepted is not None:
+            rows = rows[rows[col].isin(list(accepted))]
+    if rows.empty:
+        return pd.DataFrame(columns=["dimension", "group", "domain", "competency", "count", "total", "percentage"])
+    keys = ["dimension", "group", "domain", "competency"]
+    results = rows.groupby(keys, sort=False)[["count", "total"]].sum().reset_index()
+    # Dimensions and competencies keep their cube order, groups are sorted.
+    names = results["domain"] + ":" + results["competency"]
+    order = pd.DataFrame({
+        "dimension": pd.factorize(results["dimension"])[0],
+        "group": results["group"],
+        "competency": pd.factorize(names)[0]
+    })
+    results = results.loc[order.sort_values(list(order.columns), kind="stable").index].reset_index(drop=True)
+    results["percentage"] = result_rates(results)
+    return results
+
 def update_common_layout(fig, title, y_range=(0, 120), width=600):
     """
     Update the layout for a Plotly figure with consistent styling,
@@ -430,47 +1236,77 @@ def update_bar_traces(fig):
     )
     return fig
 
+def breakdown_rows(results, dimension, labels):
+    """
+    Select one breakdown of a result table as a plotting frame with
+    Task, Group, Percentage and Count columns, ordered by task. A
+    percentage column in the table is used as it is.
+    """
+    rows = results[(results["dimension"] == dimension) & results["competency"].isin(list(labels))]
+    plot_df = pd.DataFrame({
+        "Task": pd.Categorical(rows["competency"].map(labels), categories=list(labels.values()), ordered=True),
+        "Group": rows["group"],
+        "Percentage": rows["percentage"] if "percentage" in rows.columns else result_rates(rows),
+        "Count": rows["count"]
+    })
+    if "ci_lower" in rows.columns:
+        plot_df["CI Plus"] = rows["ci_upper"] - plot_df["Percentage"]
+        plot_df["CI Minus"] = plot_df["Percentage"] - rows["ci_lower"]
+    return plot_df.sort_values("Task", kind="stable").reset_index(drop=True)
+
+def legacy_reading_frame(analysis_results, df):
+    """
+    Result table (with a percentage column) from the nested dicts of
+    reading_analysis(..., as_frame=False). The dicts hold only percentages
+    per gender, so those counts are estimated from the group totals in df.
+    """
+    rows = []
+    for key, competency in zip(["analysis_one", "analysis_two", "analysis_three", "analysis_four"], READING_LABELS):
+        result = analysis_results[key]
+        rows.append(("overall", "All", competency, result["count_meeting"], result["total_students"],
+                     result["percentage_meeting"]))
+    gender_totals = df["studentGender"].value_counts()
+    for gender, metrics in analysis_results.get("analysis_gender", {}).items():
+        total = int(gender_totals.get(gender, 0))
+        for competency in READING_LABELS:
+            rows.append(("gender", gender, competency, round(metrics[competency] * total / 100), total,
+                         metrics[competency]))
+    for dimension in ["age", "grade"]:
+        for competency, groups in analysis_results.get(f"analysis_{dimension}", {}).items():
+            for group, data in groups.items():
+                rows.append((dimension, group, competency, data["count"], data["total"], data["percentage"]))
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS + ["percentage"])
+
+def _require_results_frame(analysis_results):
+    if not isinstance(analysis_results, pd.DataFrame):
+        raise TypeError("Expected a result table; call the analysis with as_frame=True.")
+
+def _error_bars(plot_df):
+    """Error bar arguments for px.bar when the plotting frame carries CIs."""
+    if "CI Plus" in plot_df.columns:
+        return {"error_y": "CI Plus", "error_y_minus": "CI Minus"}
+    return {}
+
+@sc.memoized
 def plot_numeracy_results(analysis_results):
     """
     Create Plotly figures for numeracy analysis results with improved styling,
     enhanced tooltips, internal legends, and text annotations that display both
     percentage and count values.
+
+    analysis_results is the result table returned by
+    numeracy_analysis(..., as_frame=True).
     """
-    # Define task labels corresponding to each analysis result.
-    task_labels = [
-        'Number Reading',
-        'Number Discrimination',
-        'Addition',
-        'Pattern Recognition',
-        'Foundational Numeracy'
-    ]
+    _require_results_frame(analysis_results)
     
     # -------------------------
     # Overall Analysis Plot
     # -------------------------
-    overall_data = [
-        analysis_results['analysis_one']['percentage_meeting'],
-        analysis_results['analysis_two']['percentage_meeting'],
-        analysis_results['analysis_three']['percentage_meeting'],
-        analysis_results['analysis_four']['percentage_meeting'],
-        analysis_results['analysis_five']['percentage_meeting']
-    ]
-    overall_counts = [
-        analysis_results['analysis_one']['count_meeting'],
-        analysis_results['analysis_two']['count_meeting'],
-        analysis_results['analysis_three']['count_meeting'],
-        analysis_results['analysis_four']['count_meeting'],
-        analysis_results['analysis_five']['count_meeting']
-    ]
-    
-    overall_df = pd.DataFrame({
-        'Task': task_labels,
-        'Percentage': overall_data,
-        'Count': overall_counts
-    })
+    overall_df = breakdown_rows(analysis_results, "overall", NUMERACY_LABELS)
     
     fig_overall = px.bar(
         overall_df, 
+        **_error_bars(overall_df),
         x='Task', 
         y='Percentage', 
         text='Percentage',
@@ -485,27 +1321,11 @@ def plot_numeracy_results(analysis_results):
     # -------------------------
     # Gender Analysis Plot
     # -------------------------
-    male_percentages = []
-    female_percentages = []
-    male_counts = []
-    female_counts = []
-    for key in ['analysis_one', 'analysis_two', 'analysis_three', 'analysis_four', 'analysis_five']:
-        male_data = analysis_results[key]['gender_results'].get('Male', {})
-        female_data = analysis_results[key]['gender_results'].get('Female', {})
-        male_percentages.append(male_data.get('percentage', 0))
-        female_percentages.append(female_data.get('percentage', 0))
-        male_counts.append(male_data.get('count', 0))
-        female_counts.append(female_data.get('count', 0))
-    
-    gender_df = pd.DataFrame({
-        'Task': task_labels * 2,
-        'Percentage': male_percentages + female_percentages,
-        'Count': male_counts + female_counts,
-        'Gender': ['Male'] * 5 + ['Female'] * 5
-    })
+    gender_df = breakdown_rows(analysis_results, "gender", NUMERACY_LABELS).rename(columns={"Group": "Gender"})
     
     fig_gender = px.bar(
         gender_df, 
+        **_error_bars(gender_df),
         x='Task', 
         y='Percentage', 
         color='Gender',
@@ -522,27 +1342,9 @@ def plot_numeracy_results(analysis_results):
     # -------------------------
     # Age Analysis Plot
     # -------------------------
-    age_analysis = analysis_results.get('analysis_age', {})
-    age_data = {'Age': [], 'Percentage': [], 'Task': [], 'Count': []}
-    mapping = {
-        'Number Reading': 'number_reading',
-        'Number Discrimination': 'number_discrimination',
-        'Addition': 'addition',
-        'Pattern Recognition': 'pattern_recognition',
-        'Foundational Numeracy': 'foundational_numeracy'
-    }
-    for task in task_labels:
-        task_key = mapping.get(task)
-        if task_key in age_analysis:
-            for age_group, data in age_analysis[task_key].items():
-                age_data['Age'].append(age_group)
-                age_data['Percentage'].append(data.get('percentage', 0))
-                age_data['Task'].append(task)
-                # Use the correct field name for count.
-                age_data['Count'].append(data.get('count_meeting', 0))
+    age_df = breakdown_rows(analysis_results, "age", NUMERACY_LABELS).rename(columns={"Group": "Age"})
     age_fig = None
-    if age_data['Age']:
-        age_df = pd.DataFrame(age_data)
+    if not age_df.empty:
         # Pass the count as custom data.
         age_fig = px.line(
             age_df, 
@@ -567,22 +1369,12 @@ def plot_numeracy_results(analysis_results):
     # -------------------------
     # Grade Analysis Plot
     # -------------------------
-    grade_analysis = analysis_results.get('analysis_grade', {})
-    grade_data = {'Task': [], 'Percentage': [], 'Grade': [], 'Count': []}
-    for task in task_labels:
-        task_key = mapping.get(task)
-        if task_key in grade_analysis:
-            for grade_group, data in grade_analysis[task_key].items():
-                grade_data['Task'].append(task)
-                grade_data['Percentage'].append(data.get('percentage', 0))
-                grade_data['Grade'].append(grade_group)
-                # Correct count field
-                grade_data['Count'].append(data.get('count_meeting', 0))
+    grade_df = breakdown_rows(analysis_results, "grade", NUMERACY_LABELS).rename(columns={"Group": "Grade"})
     grade_fig = None
-    if grade_data['Task']:
-        grade_df = pd.DataFrame(grade_data)
+    if not grade_df.empty:
         grade_fig = px.bar(
             grade_df, 
+            **_error_bars(grade_df),
             x='Task', 
             y='Percentage', 
             color='Grade',
@@ -603,15 +1395,18 @@ def plot_numeracy_results(analysis_results):
         "fig_grade": grade_fig
     }
 
-def plot_reading_results(analysis_results, df, width=600):
+@sc.memoized
+def plot_reading_results(analysis_results, df=None, width=600):
     """
     Create Plotly figures for reading analysis results with improved styling,
     enhanced tooltips, internal legends, and text annotations that display both
     percentage and count values.
     
     Parameters:
-      - analysis_results: Dictionary returned by reading_analysis.
-      - df: The DataFrame used for analysis (used to compute group totals for gender and grade breakdowns).
+      - analysis_results: Result table returned by reading_analysis(..., as_frame=True),
+        or the dictionary returned by reading_analysis.
+      - df: The DataFrame used for analysis; needed with the dictionary, to compute
+        group totals for the gender breakdown (see legacy_reading_frame).
       - width: Fixed width for the plots (default 600).
       
     Returns a dictionary with the following keys:
@@ -620,36 +1415,19 @@ def plot_reading_results(analysis_results, df, width=600):
       - "fig_age": Breakdown by age.
       - "fig_grade": Breakdown by grade.
     """
-    # Define task labels
-    tasks = [
-        "Reading (Words)",
-        "Literal Comprehension",
-        "Inferential Comprehension",
-        "Foundational Reading"
-    ]
+    if isinstance(analysis_results, dict):
+        if df is None:
+            raise TypeError("plot_reading_results needs df to plot the dictionary from reading_analysis.")
+        analysis_results = legacy_reading_frame(analysis_results, df)
+    _require_results_frame(analysis_results)
     
     # -------------------------
     # Overall Reading Performance
     # -------------------------
-    overall_percentages = [
-        analysis_results['analysis_one']['percentage_meeting'],
-        analysis_results['analysis_two']['percentage_meeting'],
-        analysis_results['analysis_three']['percentage_meeting'],
-        analysis_results['analysis_four']['percentage_meeting']
-    ]
-    overall_counts = [
-        analysis_results['analysis_one']['count_meeting'],
-        analysis_results['analysis_two']['count_meeting'],
-        analysis_results['analysis_three']['count_meeting'],
-        analysis_results['analysis_four']['count_meeting']
-    ]
-    overall_df = pd.DataFrame({
-        "Task": tasks,
-        "Percentage": overall_percentages,
-        "Count": overall_counts
-    })
+    overall_df = breakdown_rows(analysis_results, "overall", READING_LABELS)
     fig_overall = px.bar(
         overall_df,
+        **_error_bars(overall_df),
         x="Task",
         y="Percentage",
         text="Percentage",
@@ -669,25 +1447,10 @@ def plot_reading_results(analysis_results, df, width=600):
     # -------------------------
     # Gender Breakdown
     # -------------------------
-    # Compute totals for each gender from the dataframe
-    gender_totals = df['studentGender'].value_counts().to_dict()
-    gender_rows = []
-    for gender, metrics in analysis_results["analysis_gender"].items():
-        total_gender = gender_totals.get(gender, 0)
-        for key, label in zip(
-            ["read_words", "literal", "inferential", "foundational"],
-            ["Reading (Words)", "Literal Comprehension", "Inferential Comprehension", "Foundational Reading"]
-        ):
-            count = round(metrics[key] * total_gender / 100)
-            gender_rows.append({
-                "Gender": gender,
-                "Task": label,
-                "Percentage": metrics[key],
-                "Count": count
-            })
-    gender_df = pd.DataFrame(gender_rows)
+    gender_df = breakdown_rows(analysis_results, "gender", READING_LABELS).rename(columns={"Group": "Gender"})
     fig_gender = px.bar(
         gender_df,
+        **_error_bars(gender_df),
         x="Task",
         y="Percentage",
         color="Gender",
@@ -708,23 +1471,9 @@ def plot_reading_results(analysis_results, df, width=600):
     # -------------------------
     # Age Breakdown
     # -------------------------
-    age_rows = []
-    if "analysis_age" in analysis_results:
-        for task_key, label in zip(
-            ["read_words", "literal", "inferential", "foundational"],
-            ["Reading (Words)", "Literal Comprehension", "Inferential Comprehension", "Foundational Reading"]
-        ):
-            if task_key in analysis_results["analysis_age"]:
-                for age_group, data in analysis_results["analysis_age"][task_key].items():
-                    age_rows.append({
-                        "Age": age_group,
-                        "Task": label,
-                        "Percentage": data["percentage"],
-                        "Count": data["count"]
-                    })
+    age_df = breakdown_rows(analysis_results, "age", READING_LABELS).rename(columns={"Group": "Age"})
     fig_age = None
-    if age_rows:
-        age_df = pd.DataFrame(age_rows)
+    if not age_df.empty:
         fig_age = px.line(
             age_df,
             x="Age",
@@ -748,28 +1497,12 @@ def plot_reading_results(analysis_results, df, width=600):
     # -------------------------
     # Grade Breakdown
     # -------------------------
-    grade_totals = df['grade'].value_counts().to_dict()
-    grade_rows = []
-    if "analysis_grade" in analysis_results:
-        for task_key, label in zip(
-            ["read_words", "literal", "inferential", "foundational"],
-            ["Reading (Words)", "Literal Comprehension", "Inferential Comprehension", "Foundational Reading"]
-        ):
-            if task_key in analysis_results["analysis_grade"]:
-                for grade_group, data in analysis_results["analysis_grade"][task_key].items():
-                    total_grade = grade_totals.get(grade_group, 0)
-                    count = round(data["percentage"] * total_grade / 100)
-                    grade_rows.append({
-                        "Grade": grade_group,
-                        "Task": label,
-                        "Percentage": data["percentage"],
-                        "Count": count
-                    })
+    grade_df = breakdown_rows(analysis_results, "grade", READING_LABELS).rename(columns={"Group": "Grade"})
     fig_grade = None
-    if grade_rows:
-        grade_df = pd.DataFrame(grade_rows)
+    if not grade_df.empty:
         fig_grade = px.bar(
             grade_df,
+            **_error_bars(grade_df),
             x="Task",
             y="Percentage",
             color="Grade",
@@ -795,6 +1528,37 @@ def plot_reading_results(analysis_results, df, width=600):
     }
 
 
+@sc.memoized
+def plot_threshold_sweep(sweep, competency="foundational", dimension="gender", threshold=None, width=600):
+    """
+    Line chart of a reading competency rate against the words-correct cutoff,
+    one line per group of `dimension` ("overall" for a single line).
+    `threshold` marks the currently selected cutoff.
+    """
+    rows = sweep[(sweep["competency"] == competency) & (sweep["dimension"] == dimension)]
+    plot_df = pd.DataFrame({
+        "Threshold": rows["threshold"],
+        "Words Required": rows["required_words"],
+        "Group": rows["group"].astype(str),
+        "Percentage": result_rates(rows),
+        "Count": rows["count"]
+    })
+    title = f"{READING_LABELS.get(competency, competency)} Rate by Words-Correct Threshold"
+    fig = px.line(
+        plot_df,
+        x="Threshold",
+        y="Percentage",
+        color="Group",
+        hover_data={"Words Required": True, "Count": True, "Percentage": ":.1f"},
+        color_discrete_sequence=px.colors.qualitative.Set1,
+        title=title
+    )
+    fig = update_common_layout(fig, title, y_range=(0, 105), width=width)
+    fig.update_layout(xaxis_title="Threshold (% of words read correctly)")
+    if threshold is not None:
+        fig.add_vline(x=threshold, line_dash="dash", line_color="black")
+    return fig
+
 def plot_overview_summary(df, numeracy_ids, eng_reading_ids, nep_reading_ids, width=800):
     """Generates key visual summaries for the surveyed schools based on the filtered data.
 
@@ -812,26 +1576,22 @@ def plot_overview_summary(df, numeracy_ids, eng_reading_ids, nep_reading_ids, wi
     total_students = len(df)
     total_schools = df['school'].nunique()
     
-    # Aggregated school performance data
-    school_summary = []
-    
-    for school in sorted(df['school'].unique()):
-        school_df = df[df['school'] == school]
-        numeracy_res = numeracy_analysis(school_df, numeracy_ids)
-        eng_res = reading_analysis(school_df, eng_reading_ids, lang="English")
-        nep_res = reading_analysis(school_df, nep_reading_ids, lang="Nepali")
-
-        school_summary.append({
-            "School": school,
-            "Numeracy (%)": numeracy_res['analysis_five']['percentage_meeting'],
-            "Numeracy (Count)": numeracy_res['analysis_five']['count_meeting'],
-            "English Reading (%)": eng_res['analysis_four']['percentage_meeting'],
-            "English Reading (Count)": eng_res['analysis_four']['count_meeting'],
-            "Nepali Reading (%)": nep_res['analysis_four']['percentage_meeting'],
-            "Nepali Reading (Count)": nep_res['analysis_four']['count_meeting']
-        })
-    
-    summary_df = pd.DataFrame(school_summary)
+    # Aggregated school performance data, all schools and domains in one pass
+    scores = score_all(df, numeracy_ids, eng_reading_ids, nep_reading_ids, dimensions={"school": "school"})
+    headline = {domain: FOUNDATIONAL_COMPETENCIES[domain] for domain in ["numeracy", "english_reading", "nepali_reading"]}
+    rates = domain_rates(scores, headline, "school")
+    school_rows = scores[(scores["dimension"] == "school") & (scores["competency"] == scores["domain"].map(headline))]
+    counts = school_rows.pivot(index="group", columns="domain", values="count").loc[rates.index]
+
+    summary_df = pd.DataFrame({
+        "School": rates.index,
+        "Numeracy (%)": rates["numeracy"].to_numpy(),
+        "Numeracy (Count)": counts["numeracy"].to_numpy(),
+        "English Reading (%)": rates["english_reading"].to_numpy(),
+        "English Reading (Count)": counts["english_reading"].to_numpy(),
+        "Nepali Reading (%)": rates["nepali_reading"].to_numpy(),
+        "Nepali Reading (Count)": counts["nepali_reading"].to_numpy()
+    })
     
     # School performance comparison bar chart (showing both percentage and count)
     fig_summary = px.bar(
@@ -898,10 +1658,10 @@ def plot_overview_summary(df, numeracy_ids, eng_reading_ids, nep_reading_ids, wi
     )
 
     # Ensure 'grade' column is treated as categorical and sorted
-    df['grade'] = pd.Categorical(df['grade'], categories=sorted(df['grade'].dropna().unique()), ordered=True)
+    grades = pd.Categorical(df['grade'], categories=sorted(df['grade'].dropna().unique()), ordered=True)
 
     # Compute grade distribution correctly
-    grade_counts = df['grade'].value_counts().sort_index().reset_index()
+    grade_counts = pd.Series(grades).value_counts().sort_index().reset_index()
     grade_counts.columns = ['Grade', 'Count']
     grade_counts['Percentage'] = (grade_counts['Count'] / total_students * 100).round(1)
     grade_counts['Label'] = grade_counts.apply(lambda row: f"{row['Count']} ({row['Percentage']}%)", axis=1)
@@ -932,16 +1692,7 @@ def plot_overview_summary(df, numeracy_ids, eng_reading_ids, nep_reading_ids, wi
     
 
     # Age distribution histogram
-    fig_age = px.histogram(
-        df,
-        x="studentAge",
-        title="Age Distribution of Students",
-        nbins=15,
-        color_discrete_sequence=px.colors.qualitative.Set3
-    )
-    fig_age.update_traces(
-        hovertemplate='<b>Age: %{x}</b><br>Count: %{y}<extra></extra>'
-    )
+    fig_age = plot_binned_histogram(df["studentAge"], "Age Distribution of Students", "Age")
 
     return {
         "total_students": total_students,
@@ -953,6 +1704,426 @@ def plot_overview_summary(df, numeracy_ids, eng_reading_ids, nep_reading_ids, wi
         "fig_age": fig_age
     }
 
+# ---------------------------
+# Score Distributions
+# ---------------------------
+# Continuous scores: words read correctly in each long story, as (column, lo, hi, bins).
+SCORE_SKETCH_BINS = {
+    "english_words_read": ("FL19_cleaned", 0, 100, 100),
+    "nepali_words_read": ("FL21O_cleaned", 0, 100, 100)
+}
+DISTRIBUTION_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+class QuantileSketch:
+    """
+    Mergeable fixed-bin quantile sketch for bounded scores.
+
+    Values are counted into `bins` equal-width bins over [lo, hi) (values
+    outside are clipped to the end bins), so memory is constant however many
+    values are added, sketches built on separate partitions or datasets merge
+    by adding counts, and quantiles are accurate to one bin width.
+    """
+    def __init__(self, lo=0, hi=100, bins=100, counts=None):
+        self.lo = lo
+        self.hi = hi
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @property
+    def width(self):
+        return (self.hi - self.lo) / self.bins
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def edges(self):
+        return self.lo + np.arange(self.bins + 1) * self.width
+
+    def bin_index(self, values):
+        """Bin of every value, clipped to the sketch range."""
+        return np.clip(np.floor((np.asarray(values, dtype=float) - self.lo) / self.width), 0, self.bins - 1).astype(np.intp)
+
+    def update(self, values):
+        """Add values (NaN are ignored) and return the sketch."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.counts += np.bincount(self.bin_index(values), minlength=self.bins)
+        return self
+
+    def merge(self, other):
+        """Return a new sketch holding the values of both sketches."""
+        if (self.lo, self.hi, self.bins) != (other.lo, other.hi, other.bins):
+            raise ValueError("Cannot merge sketches with different bins.")
+        return QuantileSketch(self.lo, self.hi, self.bins, self.counts + other.counts)
+
+    def quantile(self, q):
+        """
+        Quantiles for q in [0, 1], interpolating linearly within bins.
+        Returns NaN for an empty sketch.
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        total = self.count
+        if total == 0:
+            return np.full(q.shape, np.nan)
+        cumulative = np.cumsum(self.counts)
+        target = q * total
+        idx = np.clip(np.searchsorted(cumulative, target, side="left"), 0, self.bins - 1)
+        below = cumulative[idx] - self.counts[idx]
+        fraction = np.clip((target - below) / np.maximum(self.counts[idx], 1), 0, 1)
+        return self.lo + (idx + fraction) * self.width
+
+    def to_dict(self):
+        return {"lo": self.lo, "hi": self.hi, "bins": self.bins, "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["lo"], data["hi"], data["bins"], data["counts"])
+
+def _group_codes(df, by):
+    """Return (codes, keys) numbering the groups of df by the columns in `by`."""
+    if not by:
+        return np.zeros(len(df), dtype=np.intp), [()]
+    grouped = df.groupby([df[col] for col in by], observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    keys = [key if isinstance(key, tuple) else (key,) for key in grouped.groups.keys()]
+    return codes, sorted(keys)
+
+def grouped_sketches(df, col, by=None, lo=0, hi=100, bins=100):
+    """
+    Build one QuantileSketch of df[col] per group of the columns in `by`, all
+    from a single 2-D bincount over (group, bin). Returns {group key tuple: sketch}.
+    """
+    by = list(by or [])
+    codes, keys = _group_codes(df, by)
+    template = QuantileSketch(lo, hi, bins)
+    values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(values) & (codes >= 0)
+    cells = codes[valid] * bins + template.bin_index(values[valid])
+    hist = np.bincount(cells, minlength=len(keys) * bins).reshape(len(keys), bins)
+    return {key: QuantileSketch(lo, hi, bins, hist[i]) for i, key in enumerate(keys)}
+
+def subscore_items(numeracy_ids, eng_ids=None, nep_ids=None):
+    """
+    Return the items making up each sub-score: the numeracy competency groups
+    plus the English and Nepali comprehension questions.
+    """
+    groups = numeracy_item_groups(numeracy_ids)
+    if eng_ids is not None:
+        groups["english_comprehension"] = list(eng_ids[1:])
+    if nep_ids is not None:
+        groups["nepali_comprehension"] = list(nep_ids[1:])
+    return groups
+
+@sc.memoized
+def score_distributions(df, by=("school", "grade", "studentGender"), quantiles=DISTRIBUTION_QUANTILES):
+    """
+    Distributional summaries of the continuous scores per group.
+
+    Returns a dictionary with:
+      - "quantiles": one row per (group, score) with n, mean and the requested
+        quantiles of words read correctly (see SCORE_SKETCH_BINS).
+      - "subscores": one row per group with the mean proportion correct in
+        each numeracy competency group and reading comprehension set.
+      - "sketches": {score: {group key: QuantileSketch}}, mergeable across
+        partitions and datasets.
+    """
+    by = [col for col in by if col in df.columns]
+    sketches, rows = {}, []
+    for score, (col, lo, hi, bins) in SCORE_SKETCH_BINS.items():
+        if col not in df.columns:
+            continue
+        sketches[score] = grouped_sketches(df, col, by, lo, hi, bins)
+        values = pd.to_numeric(df[col], errors='coerce')
+        means = values.groupby([df[c] for c in by], observed=True).mean() if by else pd.Series({(): values.mean()})
+        for key, sketch in sketches[score].items():
+            row = dict(zip(by, key))
+            row.update({"score": score, "n": sketch.count,
+                        "mean": means.get(key[0] if len(key) == 1 else key, np.nan)})
+            row.update({f"q{int(round(q * 100))}": value for q, value in zip(quantiles, sketch.quantile(quantiles))})
+            rows.append(row)
+
+    items = subscore_items(numeracy_ids, long_eng_reading_ids, long_nep_reading_ids)
+    # Students with none of a group's items administered have no sub-score.
+    bits = ResponseBits(df, list(dict.fromkeys(q for ids in items.values() for q in ids)))
+    subscores = pd.DataFrame({name: bits.proportion_correct(ids) for name, ids in items.items()}, index=df.index)
+    subscores = subscores.groupby([df[c] for c in by], observed=True).mean().reset_index() if by \
+        else subscores.mean().to_frame().T
+
+    return {"quantiles": pd.DataFrame(rows), "subscores": subscores, "sketches": sketches}
+
+def histogram_bins(values, width=1):
+    """
+    Count values into bins of `width` centred on its multiples (so integer
+    ages fall one per bar). Returns a DataFrame with one row per bin from
+    the lowest to the highest value: centre, start, end and count.
+    NaN values are ignored.
+    """
+    values = pd.to_numeric(pd.Series(values), errors='coerce').dropna().to_numpy(dtype=float)
+    if len(values) == 0:
+        return pd.DataFrame({"centre": [], "start": [], "end": [], "count": []})
+    index = np.round(values / width).astype(np.int64)
+    first = index.min()
+    counts = np.bincount(index - first)
+    centre = (first + np.arange(len(counts))) * width
+    return pd.DataFrame({"centre": centre, "start": centre - width / 2, "end": centre + width / 2, "count": counts})
+
+@sc.memoized
+def plot_binned_histogram(values, title, x_label, width=1, color_sequence=None):
+    """
+    Histogram figure built from histogram_bins, so the figure carries one
+    point per bin instead of every raw value.
+    """
+    bins = histogram_bins(values, width)
+    fig = px.bar(
+        bins,
+        x="centre",
+        y="count",
+        title=title,
+        labels={"centre": x_label, "count": "Count"},
+        color_discrete_sequence=color_sequence or px.colors.qualitative.Set3
+    )
+    fig.update_traces(
+        width=width,
+        hovertemplate=f'<b>{x_label}: %{{x}}</b><br>Count: %{{y}}<extra></extra>'
+    )
+    fig.update_layout(bargap=0.05)
+    return fig
+
+@sc.memoized
+def plot_score_distribution(df, score, by="studentGender", title=None, cutoff=None, width=600):
+    """
+    Bar chart of a continuous score's distribution per group, drawn from the
+    pre-binned sketch counts. `cutoff` adds a vertical line (e.g. the words
+    needed for the fluency threshold).
+    """
+    col, lo, hi, bins = SCORE_SKETCH_BINS[score]
+    sketches = grouped_sketches(df, col, [by], lo, hi, bins)
+    edges = QuantileSketch(lo, hi, bins).edges[:-1]
+    hist_df = pd.concat([
+        pd.DataFrame({"Score": edges, "Students": sketch.counts, "Group": key[0]})
+        for key, sketch in sketches.items()
+    ], ignore_index=True)
+    hist_df = hist_df[hist_df["Students"] > 0]
+    title = title or f"Distribution of {score.replace('_', ' ').title()}"
+    fig = px.bar(
+        hist_df,
+        x="Score",
+        y="Students",
+        color="Group",
+        barmode="overlay",
+        opacity=0.7,
+        color_discrete_sequence=px.colors.qualitative.Set1,
+        title=title
+    )
+    fig = update_common_layout(fig, title, y_range=None, width=width)
+    fig.update_layout(yaxis=dict(tickformat="d"), bargap=0)
+    if cutoff is not None:
+        fig.add_vline(x=cutoff, line_dash="dash", line_color="black")
+    return fig
+
+# ---------------------------
+# Cross-tabulation
+# ---------------------------
+CROSSTAB_MIN_CELL = 5  # cells with fewer students are suppressed
+
+def school_attributes(df, metadata=None, attributes=("project", "district")):
+    """
+    Return a DataFrame (aligned with df) of school-level attributes looked up
+    from `metadata` ({school: {attribute: value}}), or joined from the school
+    dimension table on school_id when metadata is None; unknown schools get "Unknown".
+    """
+    if metadata is None:
+        return pd.DataFrame({attr: pd.Series(school_attribute(df, attr), index=df.index).fillna("Unknown")
+                             for attr in attributes})
+    schools = df['school'].drop_duplicates()
+    lookup = pd.DataFrame(
+        [[metadata.get(school, {}).get(attr, "Unknown") for attr in attributes] for school in schools],
+        index=schools, columns=list(attributes)
+    )
+    return lookup.reindex(df['school']).set_axis(df.index)
+
+@sc.memoized
+def crosstab(df, conditions, by, metadata=None, min_cell=CROSSTAB_MIN_CELL, weights=None):
+    """
+    Competency rates for every combination of the columns in `by`.
+
+    `by` may name any columns of df (e.g. "studentGender", "FL7", "FL9A") and
+    school attributes such as "project" or "district", taken from `metadata`
+    ({school: {attribute: value}}) or else the school dimension table. All
+    cells come from a single grouped sum;
+    missing values form their own "Missing" group.
+
+    Returns one row per (cell, competency) with count, total (plus
+    weighted_count/weighted_total with weights), percentage and suppressed.
+    Cells with fewer than `min_cell` students are suppressed: their count and
+    percentage are blanked.
+    """
+    by = list(by)
+    missing = [col for col in by if col not in df.columns]
+    keys = df[[col for col in by if col in df.columns]]
+    if missing:
+        if metadata is None and not set(missing) <= set(SCHOOL_ATTRIBUTES):
+            raise KeyError(f"Unknown crosstab columns: {missing}")
+        keys = keys.join(school_attributes(df, metadata, missing))
+    keys = keys[by].astype(object).where(keys[by].notna(), "Missing")
+
+    met = pd.DataFrame(conditions, index=df.index)
+    competencies = list(met.columns)
+    w = np.ones(len(df)) if weights is None else resolve_weights(df, weights)
+    values = pd.DataFrame(np.column_stack([met.to_numpy(dtype=float), met.to_numpy(dtype=float) * w[:, None],
+                                           np.ones(len(df)), w]), index=df.index)
+    sums = values.groupby([keys[col] for col in by], sort=True).sum()
+
+    n_comp = len(competencies)
+    cells = sums.index.to_frame(index=False)
+    table = cells.loc[cells.index.repeat(n_comp)].reset_index(drop=True)
+    table["competency"] = np.tile(competencies, len(cells))
+    table["count"] = sums.iloc[:, :n_comp].to_numpy().ravel().round().astype(int)
+    table["total"] = np.repeat(sums.iloc[:, 2 * n_comp].to_numpy(), n_comp).round().astype(int)
+    if weights is not None:
+        table["weighted_count"] = sums.iloc[:, n_comp:2 * n_comp].to_numpy().ravel()
+        table["weighted_total"] = np.repeat(sums.iloc[:, 2 * n_comp + 1].to_numpy(), n_comp)
+    table["percentage"] = result_rates(table)
+    table["suppressed"] = table["total"] < min_cell
+    table["count"] = table["count"].astype("Int64").mask(table["suppressed"])
+    table["percentage"] = table["percentage"].mask(table["suppressed"])
+    if weights is not None:
+        table["weighted_count"] = table["weighted_count"].mask(table["suppressed"])
+    return table
+
+def crosstab_pivot(table, competency, rows, columns=None):
+    """
+    Pivot a crosstab table into a percentage grid for one competency, with
+    `rows` as the index and `columns` (optional) across; together they must be
+    the `by` columns the table was built with. Suppressed cells are NaN.
+    """
+    rows, columns = list(rows), list(columns or [])
+    subset = table[table["competency"] == competency].set_index(rows + columns)["percentage"]
+    return subset.unstack(columns) if columns else subset.to_frame()
+
+# ---------------------------
+# Hierarchical Rollups
+# ---------------------------
+ROLLUP_LEVELS = ["project", "district", "school"]
+ROLLUP_DOMAINS = ["numeracy", "english_reading", "nepali_reading"]
+
+def competency_rollup(df, conditions, weights=None):
+    """
+    Competency counts at every level of the project -> district -> school
+    hierarchy, plus the overall total.
+
+    Rows are summed once per school; districts and projects (from the school
+    dimension table, "Unknown" for schools not in it) are then summed from
+    the school totals, never from rows. Returns one row per (node,
+    competency) with columns level ("overall", "project", "district" or
+    "school"), project, district, school, competency, count and total (plus
+    weighted_count/weighted_total with weights). Columns below a node's
+    level are None.
+    """
+    met = pd.DataFrame(conditions, index=df.index)
+    competencies = list(met.columns)
+    n_comp = len(competencies)
+    w = np.ones(len(df)) if weights is None else resolve_weights(df, weights)
+    codes, schools = pd.factorize(df["school"], sort=True)
+    values = np.column_stack([met.to_numpy(dtype=float), met.to_numpy(dtype=float) * w[:, None],
+                              np.ones(len(df)), w])
+    valid = codes >= 0
+    sums = pd.DataFrame(values[valid]).groupby(codes[valid]).sum().reindex(range(len(schools)), fill_value=0)
+
+    # One row per school with its place in the hierarchy.
+    ids = school_ids(schools)
+    dimension = school_dimension()
+    sums.index = pd.MultiIndex.from_arrays([
+        dimension["project"].reindex(ids).fillna("Unknown").to_numpy(),
+        dimension["district"].reindex(ids).fillna("Unknown").to_numpy(),
+        np.asarray(schools, dtype=object)
+    ], names=ROLLUP_LEVELS)
+
+    levels = [("overall", sums.sum().to_frame().T.set_index(pd.Index([0])))]
+    for depth, level in enumerate(ROLLUP_LEVELS, start=1):
+        levels.append((level, sums.groupby(level=ROLLUP_LEVELS[:depth], sort=True).sum()))
+
+    frames = []
+    for level, level_sums in levels:
+        nodes = pd.DataFrame({col: None for col in ROLLUP_LEVELS}, index=range(len(level_sums)), dtype=object)
+        if level != "overall":
+            keys = level_sums.index.to_frame(index=False)
+            nodes[list(keys.columns)] = keys.to_numpy()
+        frame = nodes.loc[nodes.index.repeat(n_comp)].reset_index(drop=True)
+        frame.insert(0, "level", level)
+        frame["competency"] = np.tile(competencies, len(level_sums))
+        frame["count"] = level_sums.iloc[:, :n_comp].to_numpy().ravel().round().astype(int)
+        frame["total"] = np.repeat(level_sums.iloc[:, 2 * n_comp].to_numpy(), n_comp).round().astype(int)
+        if weights is not None:
+            frame["weighted_count"] = level_sums.iloc[:, n_comp:2 * n_comp].to_numpy().ravel()
+            frame["weighted_total"] = np.repeat(level_sums.iloc[:, 2 * n_comp + 1].to_numpy(), n_comp)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+@sc.memoized
+def rollup_cube(df, weights=None):
+    """
+    competency_rollup for every domain at once: numeracy and English and
+    Nepali reading (each student scored on their school's story), with a
+    `domain` column naming the domain (see ROLLUP_DOMAINS).
+    """
+    domain_conditions = {
+        "numeracy": numeracy_conditions(df, numeracy_item_groups(numeracy_ids)),
+        "english_reading": school_reading_conditions(df, long_eng_reading_ids, lang="English"),
+        "nepali_reading": school_reading_conditions(df, long_nep_reading_ids, lang="Nepali")
+    }
+    conditions = {f"{domain}:{name}": met for domain, named in domain_conditions.items() for name, met in named.items()}
+    cube = competency_rollup(df, conditions, weights)
+    cube.insert(1, "domain", cube["competency"].str.split(":").str[0])
+    cube["competency"] = cube["competency"].str.split(":").str[1]
+    return cube
+
+def merge_rollups(*cubes):
+    """
+    Rollup of the union of disjoint sets of records (e.g. a stored cube and
+    the cube of newly received records), from their rollups alone: counts
+    and totals add up at every node, so no record is scored twice. Rows
+    come back in rollup_cube order.
+    """
+    cube = pd.concat(cubes, ignore_index=True)
+    names = cube["domain"] + ":" + cube["competency"]
+    competency_order = {name: i for i, name in enumerate(dict.fromkeys(names))}
+    keys = ["level", "domain"] + ROLLUP_LEVELS + ["competency"]
+    merged = cube.groupby(keys, dropna=False, sort=False).sum(numeric_only=True).reset_index()
+    merged[ROLLUP_LEVELS] = merged[ROLLUP_LEVELS].astype(object).where(merged[ROLLUP_LEVELS].notna(), None)
+    order = pd.DataFrame({
+        "level": merged["level"].map({level: i for i, level in enumerate(["overall"] + ROLLUP_LEVELS)}),
+        **{level: merged[level].fillna("") for level in ROLLUP_LEVELS},
+        "competency": (merged["domain"] + ":" + merged["competency"]).map(competency_order)
+    })
+    merged = merged.loc[order.sort_values(list(order.columns), kind="stable").index].reset_index(drop=True)
+    return merged.astype(cubes[0].dtypes.to_dict())
+
+def rollup_children(cube, project=None, district=None):
+    """
+    Rows of a rollup for the children of a node: the projects (no arguments),
+    the districts of `project`, or the schools of `district` in `project`.
+    """
+    if project is None:
+        return cube[cube["level"] == "project"]
+    if district is None:
+        return cube[(cube["level"] == "district") & (cube["project"] == project)]
+    return cube[(cube["level"] == "school") & (cube["project"] == project) & (cube["district"] == district)]
+
+def rollup_node(cube, project=None, district=None, school=None):
+    """Rows of a rollup for one node (the overall total when no arguments are given)."""
+    if project is None:
+        return cube[cube["level"] == "overall"]
+    level = "school" if school is not None else "district" if district is not None else "project"
+    rows = cube[(cube["level"] == level) & (cube["project"] == project)]
+    if district is not None:
+        rows = rows[rows["district"] == district]
+    if school is not None:
+        rows = rows[rows["school"] == school]
+    return rows
+
 # ---------------------------
 # Formatted Results Functions
 # ---------------------------
@@ -994,38 +2165,164 @@ def get_formatted_reading_results(results, lang):
     lines.append("-" * 40)
     return "\n".join(lines)
 
+# ---------------------------
+# Gender Parity
+# ---------------------------
+# Summary populations, as predicates on a frame of (school, grade, studentAge) cell keys.
+PARITY_SUBGROUPS = {
+    "overall": lambda cells: cells['studentAge'].between(7, 14),
+    "grade": lambda cells: cells['grade'].isin(['2', '3', 2, 3])
+}
+PARITY_BREAKDOWNS = ["school", "grade"]
+# Added to the (effective) counts for the interval of a GPI when either rate is zero.
+PARITY_CONTINUITY = 0.5
+
+def _student_variance(rate, total, weight_sq, met_weight_sq, records):
+    """
+    Linearized variance of a weighted rate with students as clusters (the
+    fallback of _cluster_sums when there is a single school), from the sums
+    over students of w, w**2 and w**2 * met: with met in {0, 1}, the squared
+    residuals (w * (met - rate))**2 add up to
+    met_weight_sq * (1 - 2 * rate) + rate**2 * weight_sq.
+    """
+    factor = records / (records - 1) if records > 1 else np.nan
+    return factor * (met_weight_sq * (1 - 2 * rate) + rate**2 * weight_sq) / total**2
+
+def gender_parity(df, conditions, subgroups=None, breakdowns=None, weights=None, confidence=0.95):
+    """
+    Compute the gender parity index (female rate / male rate) with confidence
+    intervals for every competency and subgroup.
+
+    Records are aggregated once into (school, grade, age, gender) cells; every
+    subgroup is then a sum over cells, so the records are scanned once and
+    never copied. Subgroups are the PARITY_SUBGROUPS populations plus one per
+    value of each column in `breakdowns` (named e.g. "grade=3").
+
+    Returns a table with one row per (subgroup, competency) holding the overall
+    rate, its standard error, the female and male rates, the GPI and its
+    interval. Errors are linearized with schools as clusters, or with students
+    as clusters when a subgroup covers a single school, and the interval is
+    taken on log(GPI). Where either rate is zero, log(GPI) has no finite
+    variance, so the interval comes instead from the effective counts with
+    PARITY_CONTINUITY added to each (the Haldane-Anscombe correction); the
+    GPI itself stays 0, or NaN when the male rate is zero.
+    """
+    if subgroups is None:
+        subgroups = PARITY_SUBGROUPS
+    if breakdowns is None:
+        breakdowns = PARITY_BREAKDOWNS
+    competencies = list(conditions)
+    n_comp = len(competencies)
+    met = pd.DataFrame(conditions, index=df.index).to_numpy(dtype=float)
+    w = np.ones(len(df)) if weights is None else resolve_weights(df, weights)
+
+    # One grouped pass: weighted met, weight, squared weight, record counts and
+    # met times squared weight per cell.
+    keys = [col for col in ['school', 'grade', 'studentAge', 'studentGender'] if col in df.columns]
+    values = pd.DataFrame(np.column_stack([met * w[:, None], w, w**2, np.ones(len(df)), met * (w**2)[:, None]]),
+                          index=df.index)
+    cells = values.groupby([df[col] for col in keys], observed=True).sum().reset_index()
+    cell_values = cells.drop(columns=keys).to_numpy()
+
+    masks = {name: np.asarray(predicate(cells), dtype=bool) for name, predicate in subgroups.items()}
+    for col in breakdowns:
+        if col in cells.columns:
+            for value in sorted(cells[col].unique()):
+                masks[f"{col}={value}"] = (cells[col] == value).to_numpy()
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    is_female = (cells['studentGender'] == 'Female').to_numpy()
+    is_male = (cells['studentGender'] == 'Male').to_numpy()
+    rows = []
+    for name, mask in masks.items():
+        clusters, _ = pd.factorize(cells.loc[mask, 'school'])
+        n_clusters = clusters.max() + 1 if len(clusters) else 0
+
+        def population(selected):
+            sums = np.zeros((max(n_clusters, 1), cell_values.shape[1]))
+            np.add.at(sums, clusters[selected[mask]], cell_values[mask & selected])
+            return (sums[:, :n_comp], sums[:, n_comp], sums[:, n_comp + 1].sum(), sums[:, n_comp + 2].sum(),
+                    sums[:, n_comp + 3:].sum(axis=0))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            counts, totals, weight_sq, records, met_sq = population(np.ones(len(cells), dtype=bool))
+            rate = counts.sum(axis=0) / totals.sum()
+            if n_clusters > 1:
+                se = linearized_se(counts[:, None, :], totals[:, None])[0] / 100
+            else:
+                se = np.sqrt(_student_variance(rate, totals.sum(), weight_sq, met_sq, records))
+
+            f_counts, f_totals, f_weight_sq, f_records, f_met_sq = population(is_female)
+            m_counts, m_totals, m_weight_sq, m_records, m_met_sq = population(is_male)
+            f_rate = f_counts.sum(axis=0) / f_totals.sum()
+            m_rate = m_counts.sum(axis=0) / m_totals.sum()
+            gpi = np.where(m_rate > 0, f_rate / m_rate, np.nan)
+            if n_clusters > 1:
+                # Linearized variance of log(GPI) with schools as clusters.
+                u = ((f_counts - f_rate * f_totals[:, None]) / (f_totals.sum() * f_rate) -
+                     (m_counts - m_rate * m_totals[:, None]) / (m_totals.sum() * m_rate))
+                log_var = n_clusters / (n_clusters - 1) * (u**2).sum(axis=0)
+            else:
+                log_var = (_student_variance(f_rate, f_totals.sum(), f_weight_sq, f_met_sq, f_records) / f_rate**2 +
+                           _student_variance(m_rate, m_totals.sum(), m_weight_sq, m_met_sq, m_records) / m_rate**2)
+            log_gpi = np.log(gpi)
+
+            # Zero rates: log interval of the continuity-corrected ratio of effective counts.
+            zero = (f_rate == 0) | (m_rate == 0)
+            if zero.any():
+                f_n, m_n = f_totals.sum()**2 / f_weight_sq, m_totals.sum()**2 / m_weight_sq
+                f_x, m_x = f_rate * f_n + PARITY_CONTINUITY, m_rate * m_n + PARITY_CONTINUITY
+                f_n, m_n = f_n + PARITY_CONTINUITY, m_n + PARITY_CONTINUITY
+                log_gpi = np.where(zero, np.log((f_x / f_n) / (m_x / m_n)), log_gpi)
+                log_var = np.where(zero, 1 / f_x - 1 / f_n + 1 / m_x - 1 / m_n, log_var)
+            half_width = z * np.sqrt(log_var)
+            ci_lower, ci_upper = np.exp(log_gpi - half_width), np.exp(log_gpi + half_width)
+
+        rows.append(pd.DataFrame({
+            "subgroup": name,
+            "competency": competencies,
+            "total": int(round(records)),
+            "rate": rate * 100,
+            "se": se * 100,
+            "female_rate": f_rate * 100,
+            "male_rate": m_rate * 100,
+            "gpi": gpi,
+            "ci_lower": ci_lower,
+            "ci_upper": ci_upper
+        }))
+    return pd.concat(rows, ignore_index=True)
+
 # ---------------------------
 # New Summary Function
 # ---------------------------
-def foundational_skills_summary(df, reading_ids, numeracy_ids, total_words_read, language="English"):
+def foundational_skills_summary(df, reading_ids, numeracy_ids, total_words_read, language="English", weights=None):
     """
     Compute summary metrics for foundational reading and numeracy skills.
     Metrics are computed for children aged 7-14 and for those attending grade 2/3.
-    Also computes gender parity indices for reading.
+    Also computes gender parity indices, with confidence intervals, for every
+    reading and numeracy competency and subgroup (see gender_parity).
+    With weights (see resolve_weights) the percentages are weighted and the
+    summary also carries their standard errors under "*_se" keys.
     Returns a dictionary with the results.
     """
-    # Overall analysis for age 7-14
-    df_overall = df[(df['studentAge'] >= 7) & (df['studentAge'] <= 14)]
-    reading_res = reading_analysis(df_overall.copy(), reading_ids, total_words_read, lang=language, printText=False)
-    numeracy_res = numeracy_analysis(df_overall.copy(), numeracy_ids, printText=False)
-    
-    summary = {
-       "total_records_overall": df_overall.shape[0],
-       "reading_foundational_overall": reading_res['analysis_four']['percentage_meeting'],
-       "numeracy_foundational_overall": numeracy_res['analysis_five']['percentage_meeting'],
-       "reading_gender_parity_overall": reading_res['analysis_one']['gender_results'], 
-       "numeracy_gender_parity_overall": numeracy_res['analysis_one']['gender_results']
-    }
-    
-    # Analysis for children attending grade 2/3
-    if 'grade' in df.columns:
-        df_grade = df[df['grade'].isin(['2', '3', 2, 3])]
-        reading_res_grade = reading_analysis(df_grade.copy(), reading_ids, total_words_read, lang=language, printText=False)
-        numeracy_res_grade = numeracy_analysis(df_grade.copy(), numeracy_ids, printText=False)
-        summary["total_records_grade_2_3"] = df_grade.shape[0]
-        summary["reading_foundational_grade"] = reading_res_grade['analysis_four']['percentage_meeting']
-        summary["numeracy_foundational_grade"] = numeracy_res_grade['analysis_five']['percentage_meeting']
-        summary["reading_gender_parity_grade"] = reading_res_grade['analysis_one']['gender_results']
-        summary["numeracy_gender_parity_grade"] = numeracy_res_grade['analysis_one']['gender_results']
+    reading = school_reading_conditions(df, reading_ids, total_words_read, language)
+    conditions = {f"reading_{name}": condition for name, condition in reading.items()}
+    conditions.update(numeracy_conditions(df, numeracy_item_groups(numeracy_ids)))
+    parity = gender_parity(df, conditions, weights=weights)
+
+    summary = {"gender_parity": parity}
+    for subgroup, label in [("overall", "overall"), ("grade", "grade_2_3")]:
+        if subgroup == "grade" and 'grade' not in df.columns:
+            continue
+        rows = parity[parity["subgroup"] == subgroup].set_index("competency")
+        summary[f"total_records_{label}"] = int(rows["total"].iloc[0]) if len(rows) else 0
+        for key, competency in [("reading", "reading_foundational"), ("numeracy", "foundational_numeracy")]:
+            row = rows.loc[competency]
+            summary[f"{key}_foundational_{subgroup}"] = float(row["rate"])
+            summary[f"{key}_gender_parity_{subgroup}"] = {
+                "gpi": float(row["gpi"]), "ci_lower": float(row["ci_lower"]), "ci_upper": float(row["ci_upper"])
+            }
+            if weights is not None:
+                summary[f"{key}_foundational_{subgroup}_se"] = float(row["se"])
     
     return summary
@@ -0,0 +1,318 @@
+#survey_cache.py
+import functools
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # fingerprint string columns through pandas hashing instead
+    pa = None
+
+# -------------------------
+# FINGERPRINTS
+# -------------------------
+FINGERPRINT_CHUNK_ROWS = 1 << 16  # rows hashed per update
+FINGERPRINT_CACHE_SIZE = 4096     # immutable buffers whose digest is remembered
+
+# Digests of immutable column buffers (read-only numpy arrays, Arrow arrays)
+# and Index objects, keyed by address or object identity. Each entry keeps a
+# reference to its buffer so neither can be reused while cached.
+_DIGESTS = OrderedDict()
+_DIGESTS_LOCK = threading.Lock()
+
+def _buffer_key(values):
+    """
+    Cache key of an immutable column or index buffer, or (None, None) when
+    the data could still change in place.
+    """
+    if isinstance(values, pd.Index):
+        return ("index", id(values)), values
+    if isinstance(values.dtype, np.dtype):
+        array = values.to_numpy()
+        root = array
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+        if root.flags.writeable:
+            return None, None
+        return ("numpy", array.__array_interface__["data"][0], array.shape, array.strides, array.dtype.str), root
+    if pa is not None and hasattr(values.array, "__arrow_array__"):
+        # Arrow arrays are immutable: the array object identifies its contents.
+        chunked = values.array.__arrow_array__()
+        return ("arrow", str(values.dtype), id(chunked)), chunked
+    return None, None
+
+def _value_chunks(values):
+    """
+    Yield the contents of a column or index as byte buffers, one per chunk of
+    FINGERPRINT_CHUNK_ROWS rows, in a layout-independent form: numeric
+    buffers as they are, strings as (lengths, bytes, null mask).
+    """
+    n = len(values)
+    step = FINGERPRINT_CHUNK_ROWS
+    chunked = values.array.__arrow_array__() if pa is not None and hasattr(values.array, "__arrow_array__") else None
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM":
+        array = values.to_numpy()
+        for start in range(0, n, step):
+            yield np.ascontiguousarray(array[start:start + step]).tobytes()
+    elif chunked is not None and (pa.types.is_string(chunked.type) or pa.types.is_large_string(chunked.type)):
+        strings = chunked.cast(pa.large_string()).combine_chunks()
+        offsets = np.frombuffer(strings.buffers()[1], dtype=np.int64)[strings.offset:strings.offset + n + 1]
+        data = strings.buffers()[2]
+        nulls = strings.is_null().to_numpy(zero_copy_only=False)
+        for start in range(0, n, step):
+            stop = min(start + step, n)
+            lo, hi = int(offsets[start]), int(offsets[stop])
+            yield np.diff(offsets[start:stop + 1]).astype(np.int32).tobytes()
+            yield memoryview(data)[lo:hi] if data is not None else b""
+            yield nulls[start:stop].tobytes()
+    else:
+        series = values.to_series(index=np.arange(n)) if isinstance(values, pd.Index) else values
+        for start in range(0, n, step):
+            yield pd.util.hash_pandas_object(series.iloc[start:start + step], index=False).to_numpy().tobytes()
+
+def column_fingerprint(values):
+    """
+    Hex digest of one column (Series) or Index: its dtype, length and
+    values, hashed chunk by chunk straight from the column buffers. Digests
+    of immutable buffers (e.g. the read-only columns of a SurveyStore) are
+    cached, so fingerprinting them again costs a dictionary lookup.
+    """
+    key, buffer = _buffer_key(values)
+    if key is not None:
+        with _DIGESTS_LOCK:
+            entry = _DIGESTS.get(key)
+            if entry is not None:
+                _DIGESTS.move_to_end(key)
+                return entry[0]
+    digest = hashlib.blake2b(repr((str(values.dtype), len(values))).encode(), digest_size=16)
+    for chunk in _value_chunks(values):
+        digest.update(chunk)
+    fingerprint = digest.hexdigest()
+    if key is not None:
+        remember_fingerprint(values, fingerprint, key, buffer)
+    return fingerprint
+
+def remember_fingerprint(values, fingerprint, key=None, buffer=None):
+    """
+    Record a known fingerprint for an immutable column or Index (e.g. one
+    stored with a columnar dataset), so it is never hashed. Ignored for
+    data that could change in place.
+    """
+    if key is None:
+        key, buffer = _buffer_key(values)
+        if key is None:
+            return
+    with _DIGESTS_LOCK:
+        _DIGESTS[key] = (fingerprint, buffer)
+        _DIGESTS.move_to_end(key)
+        while len(_DIGESTS) > FINGERPRINT_CACHE_SIZE:
+            _DIGESTS.popitem(last=False)
+
+def frame_fingerprint(df):
+    """
+    Hex digest identifying the contents of a DataFrame or Series: its
+    labels, dtypes and every value, combined from per-column fingerprints
+    (see column_fingerprint). Equal data gives equal fingerprints
+    regardless of object identity.
+    """
+    frame = df.to_frame() if isinstance(df, pd.Series) else df
+    digest = hashlib.blake2b(repr(list(frame.columns)).encode(), digest_size=16)
+    digest.update(column_fingerprint(frame.index).encode())
+    for col in range(frame.shape[1]):
+        digest.update(column_fingerprint(frame.iloc[:, col]).encode())
+    return digest.hexdigest()
+
+# -------------------------
+# MEMOIZATION
+# -------------------------
+MEMO_MAXSIZE = 128  # results kept by the memo cache
+# Modules every memoized function depends on: their source is part of stored keys.
+SOURCE_MODULES = ("survey_analysis",)
+
+def _memo_key(value, frames=None):
+    """
+    Hashable stand-in for a call argument: fingerprints for frames and
+    arrays, nested tuples for containers. The fingerprints of DataFrames
+    are added to `frames` when given. Raises TypeError when a value
+    cannot be keyed.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        fingerprint = frame_fingerprint(value)
+        if frames is not None and isinstance(value, pd.DataFrame):
+            frames.add(fingerprint)
+        return ("frame", fingerprint)
+    if isinstance(value, np.ndarray):
+        values = np.ascontiguousarray(value)
+        if values.dtype == object:
+            return ("array", tuple(_memo_key(v, frames) for v in values.ravel()), values.shape)
+        return ("array", str(values.dtype), values.shape, hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest())
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_memo_key(v, frames) for v in value))
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted(((repr(k), _memo_key(v, frames)) for k, v in value.items()), key=lambda kv: kv[0])))
+    if isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted(repr(v) for v in value)))
+    hash(value)
+    return value
+
+@functools.lru_cache(maxsize=None)
+def _source_version(module):
+    """
+    Digest of the source of `module` and of SOURCE_MODULES, so results
+    stored by other versions of the analysis code are not reused.
+    """
+    paths = {getattr(sys.modules.get(name), "__file__", None) for name in (module,) + SOURCE_MODULES}
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(path for path in paths if path):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def _stored_key(func, key):
+    """Key of a memo entry in a persistent store: stable across processes and restarts."""
+    text = repr((func.__module__, _source_version(func.__module__), key))
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+def _shared(value):
+    """
+    Form of a result that can be handed to every caller without copying
+    its data: frames as copy-on-write views, arrays as read-only views,
+    containers rebuilt around shared values. Anything else (figures, for
+    one) is shared as it is, so callers must not modify it.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, dict):
+        return type(value)((k, _shared(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_shared(v) for v in value]
+    if type(value) is tuple:
+        return tuple(_shared(v) for v in value)
+    return value
+
+_MISSING = object()
+
+class MemoCache:
+    """
+    Size-bounded LRU cache of analysis results keyed by the function, a
+    fingerprint of the input data and the remaining call arguments.
+    Off until enable_memoization() is called. With a `store` (see
+    survey_store.ResultStore), results missing from memory are looked up
+    there before being computed, and computed results are added to it.
+    """
+    def __init__(self, maxsize=MEMO_MAXSIZE):
+        self.enabled = False
+        self.maxsize = maxsize
+        self.store = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stored_hits = 0
+        # Guards the entries (not the computations), so threads such as a
+        # warm-up thread and script runs can share the cache.
+        self._lock = threading.RLock()
+
+    def call(self, func, args, kwargs):
+        frames = set()
+        try:
+            key = (func.__qualname__, _memo_key(args, frames), _memo_key(kwargs, frames))
+        except TypeError:  # an argument that cannot be keyed: compute without caching
+            return func(*args, **kwargs)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            else:
+                self.misses += 1
+        if entry is None:
+            store = self.store
+            result = _MISSING if store is None else store.get(_stored_key(func, key), _MISSING)
+            if result is _MISSING:
+                result = func(*args, **kwargs)
+                if store is not None:
+                    store.put(_stored_key(func, key), result)
+            else:
+                with self._lock:
+                    self.stored_hits += 1
+            entry = (result, frames)
+            with self._lock:
+                self.entries[key] = entry
+                self.trim()
+        # Callers share the cached data: frames copy themselves when changed,
+        # arrays are read-only and figures must not be modified in place.
+        return _shared(entry[0])
+
+    def trim(self):
+        with self._lock:
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self, df=None):
+        """Drop every entry, or only those computed from the data in df."""
+        with self._lock:
+            if df is None:
+                self.entries.clear()
+                return
+            fingerprint = frame_fingerprint(df)
+            for key in [key for key, (_, frames) in self.entries.items() if fingerprint in frames]:
+                del self.entries[key]
+
+_MEMO = MemoCache()
+
+def memoized(func):
+    """Decorator routing calls of an analysis function through the memo cache when enabled."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _MEMO.enabled:
+            return func(*args, **kwargs)
+        return _MEMO.call(func, args, kwargs)
+    return wrapper
+
+def enable_memoization(maxsize=MEMO_MAXSIZE, store=None):
+    """
+    Cache the results of the memoized analyses (numeracy_analysis,
+    reading_analysis, score_all, ...) and figures (plot_reading_results,
+    ...) so repeated calls on the same data and arguments return
+    immediately. Holds up to `maxsize` results, evicting the least
+    recently used. Cached results are shared between callers rather than
+    copied: frames and arrays cannot be changed through them, but the
+    figures returned must not be modified in place.
+
+    `store` (e.g. survey_store.ResultStore) keeps results on disk as well,
+    shared with other processes and kept across restarts. Stored results
+    are keyed by the source of the analysis code too, so a changed
+    analysis is computed afresh.
+    """
+    _MEMO.enabled = True
+    _MEMO.maxsize = maxsize
+    _MEMO.store = store
+    _MEMO.trim()
+
+def disable_memoization():
+    """Stop caching and drop every cached result (results on disk are kept)."""
+    _MEMO.enabled = False
+    _MEMO.store = None
+    _MEMO.clear()
+
+def clear_memo(df=None):
+    """
+    Invalidate cached results in memory: all of them, or only those
+    computed from the data in df. Editing a DataFrame changes its
+    fingerprint, so results for the old contents are never returned;
+    clearing frees their memory.
+    """
+    _MEMO.clear(df)
+
+def memo_info():
+    """Cache statistics: enabled, hits, misses (and how many of them the store answered), size and maxsize."""
+    return {"enabled": _MEMO.enabled, "hits": _MEMO.hits, "misses": _MEMO.misses,
+            "stored_hits": _MEMO.stored_hits, "size": len(_MEMO.entries), "maxsize": _MEMO.maxsize}
@@ -0,0 +1,79 @@
+#survey_dashboard.py
+import os
+import survey_analysis as sa
+import survey_store as ss
+import item_analysis as ia
+
+# Columns read by the dashboard's analyses; other columns stay on disk in the columnar copy.
+DASHBOARD_COLUMNS = sa.column_plan("numeracy", "english_reading", "nepali_reading", "demographics")
+# Result store (see ss.ResultStore) shared by the dashboard's server processes and `offline_servers.py warm`.
+RESULT_STORE_PATH = os.path.join(".results", "results.sqlite")
+DEFAULT_THRESHOLD = 90  # words-correct threshold the reading sweeps open at
+
+# -------------------------
+# DATA CLEANING HELPERS
+# -------------------------
+def clean_school_names(df):
+    """Clean and standardize school names to avoid duplicates"""
+
+    # Map every known spelling (ignoring surrounding whitespace) to its canonical
+    # name and integer ID in the school dimension table (sa.SCHOOL_TABLE)
+    df['school'] = sa.canonical_school_names(df['school'])
+    df['school_id'] = sa.school_ids(df['school'])
+
+    return df
+
+def clean_grade_values(df):
+    """Clean and standardize grade values to avoid duplicates"""
+    if 'grade' in df.columns:
+        # Strip whitespace, drop any 'Grade ' prefix and map variations such as 'Class 4' (sa.GRADE_ALIASES)
+        df['grade'] = sa.canonical_grades(df['grade'])
+
+    return df
+
+def load_frame(filepath, partitions=None):
+    """
+    DASHBOARD_COLUMNS of a dataset, cleaned, from the school partitions in
+    `partitions` (all when None) of its columnar copy (built if missing or stale).
+    """
+    return clean_grade_values(clean_school_names(ss.load_columnar(filepath, DASHBOARD_COLUMNS, partitions)))
+
+# -------------------------
+# CACHE WARM-UP
+# -------------------------
+def warm_up_view(df):
+    """
+    Compute the analyses and figures of a dataset's default view (all
+    schools, no intervals, unweighted, first item set and cross-tab) with
+    the same calls the dashboard makes, so it finds them memoized.
+    """
+    scores = sa.score_all(df, ci=None, weights=None)
+    sa.score_all(df, dimensions={"school": "school"})
+    sa.plot_binned_histogram(df["studentAge"], "Age Distribution", "Age")
+    sa.plot_numeracy_results(sa.domain_results(scores, "numeracy"))
+    for domain, ids, lang, score in [
+        ("english_reading", sa.long_eng_reading_ids, "English", "english_words_read"),
+        ("nepali_reading", sa.long_nep_reading_ids, "Nepali", "nepali_words_read")
+    ]:
+        sa.plot_reading_results(sa.domain_results(scores, domain))
+        cutoff = sa.reading_rubric(df, ids, lang=lang)[0]
+        sa.plot_score_distribution(df, score, title="Words Read Correctly by Gender", cutoff=cutoff)
+        sweep = sa.reading_threshold_sweep(df, ids, lang=lang, weights=None)
+        sa.plot_threshold_sweep(sweep, threshold=DEFAULT_THRESHOLD)
+        sa.plot_reading_results(sa.threshold_results(sweep, DEFAULT_THRESHOLD))
+    ia.plot_item_statistics(df, sa.numeracy_ids, "Numeracy")
+    sa.crosstab(
+        df, sa.numeracy_conditions(df, sa.numeracy_item_groups(sa.numeracy_ids)), ["studentGender", "grade"],
+        metadata=sa.school_metadata(), min_cell=sa.CROSSTAB_MIN_CELL, weights=None
+    )
+
+def warm_up(filepath):
+    """
+    Prepare everything the dashboard reads for a dataset that lives on
+    disk: its columnar copy, its stored aggregates (see ss.AGGREGATES) and,
+    with memoization enabled on a result store (see sc.enable_memoization),
+    the default view's analyses and figures.
+    """
+    for name in ss.AGGREGATES:
+        ss.load_aggregate(filepath, name)
+    warm_up_view(load_frame(filepath))
@@ -0,0 +1,292 @@
+#survey_jobs.py
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import survey_analysis as sa
+import survey_store as ss
+import item_analysis as ia
+import irt_analysis as irt
+
+JOB_DIRECTORY = ".jobs"
+JOB_KEEP_SECONDS = 7 * 24 * 3600  # finished and failed jobs are removed once this old
+JOB_STORE_BYTES = 256 << 20       # finished jobs kept before the oldest are removed
+JOB_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+# Columns a job reads from the dataset's columnar copy (the dashboard's columns).
+JOB_COLUMNS = sa.column_plan("numeracy", "english_reading", "nepali_reading", "demographics")
+ITEM_SETS = {
+    "numeracy": sa.numeracy_ids,
+    "english_reading": sa.eng_reading_item_ids,
+    "nepali_reading": sa.nep_reading_item_ids
+}
+
+# ---------------------------
+# Jobs
+# ---------------------------
+def job_records(filepath, partitions=None, schools=None):
+    """Records a job runs on: the dashboard's columns and cleaning, limited to `schools` when given."""
+    df = ss.load_columnar(filepath, JOB_COLUMNS, partitions)
+    df = df.assign(school=sa.canonical_school_names(df["school"]), grade=sa.canonical_grades(df["grade"]))
+    if schools:
+        df = df[df["school"].isin(list(schools))]
+    return df
+
+def job_weights(df, weighting):
+    """Weights for a weighting option: None, or "school" for equal weight per school."""
+    if weighting is None:
+        return None
+    if weighting == "school":
+        return sa.equal_school_weights(df)
+    raise ValueError(f"Unknown weighting: {weighting}")
+
+def scores_job(df, progress, ci=None, weighting=None):
+    """sa.score_all with confidence intervals, e.g. the school bootstrap."""
+    progress(0.1, "Scoring all domains")
+    return sa.score_all(df, ci=ci, weights=job_weights(df, weighting))
+
+def rasch_job(df, progress, item_sets=None):
+    """Rasch calibration of each item set: {item set: item table} plus convergence."""
+    item_sets = list(item_sets or ITEM_SETS)
+    items, converged = {}, {}
+    for i, name in enumerate(item_sets):
+        progress(i / len(item_sets), f"Calibrating {name.replace('_', ' ')} items")
+        fit = irt.rasch_analysis(df, ITEM_SETS[name], printText=False)
+        items[name], converged[name] = fit["items"], fit["converged"]
+    return {"items": items, "converged": converged}
+
+def export_job(df, progress, weighting=None):
+    """Zip archive (bytes) of CSV result tables: scores by breakdown and by school, item statistics, Rasch items."""
+    weights = job_weights(df, weighting)
+    tables = {}
+    progress(0.0, "Scoring by gender, age and grade")
+    tables["results_by_group.csv"] = sa.score_all(df, weights=weights)
+    progress(0.3, "Scoring by school")
+    tables["results_by_school.csv"] = sa.score_all(df, dimensions={"school": "school"}, weights=weights)
+    progress(0.5, "Item statistics")
+    for name, ids in ITEM_SETS.items():
+        tables[f"items_{name}.csv"] = ia.item_statistics(df, ids)
+    rasch = rasch_job(df, lambda fraction, message: progress(0.6 + 0.3 * fraction, message))
+    for name, items in rasch["items"].items():
+        tables[f"rasch_{name}.csv"] = items
+    progress(0.9, "Writing archive")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for filename, table in tables.items():
+            archive.writestr(filename, table.to_csv(index=filename.startswith("rasch_")))
+    return buffer.getvalue()
+
+# name: (function(df, progress, **params) -> result, label shown while it runs)
+JOBS = {
+    "scores": (scores_job, "Scoring with confidence intervals"),
+    "rasch": (rasch_job, "Rasch calibration"),
+    "export": (export_job, "Full results export")
+}
+
+# ---------------------------
+# Persistent Job Store
+# ---------------------------
+class JobStore:
+    """
+    Job states and results on disk, shared by every process on the machine
+    and kept across restarts: <id>.json holds the state (queued, running,
+    done or failed), progress and timestamps, and <id>.pkl the result of a
+    finished job. Files are replaced atomically, so readers never see one
+    half written. prune() removes finished and failed jobs once they are
+    older than JOB_KEEP_SECONDS, and the oldest of them while their files
+    exceed JOB_STORE_BYTES (down to 90%, as ss.ResultStore evicts).
+    """
+    def __init__(self, directory=JOB_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.directory, f"{job_id}.{ext}")
+
+    def _replace(self, path, data, mode="w"):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, mode) as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def status(self, job_id):
+        """State of a job, or None if it was never submitted."""
+        try:
+            with open(self._path(job_id, "json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def update(self, job_id, **fields):
+        """Merge fields into a job's state."""
+        status = self.status(job_id) or {"id": job_id}
+        status.update(fields)
+        self._replace(self._path(job_id, "json"), json.dumps(status))
+        return status
+
+    def save_result(self, job_id, result):
+        self._replace(self._path(job_id, "pkl"), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), "wb")
+
+    def result(self, job_id):
+        with open(self._path(job_id, "pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def remove(self, job_id):
+        for ext in ("json", "pkl"):
+            try:
+                os.remove(self._path(job_id, ext))
+            except FileNotFoundError:
+                pass
+
+    def _finished_jobs(self):
+        """(finished time, job id, bytes on disk) of every done or failed job."""
+        jobs = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            job_id = filename[:-len(".json")]
+            try:
+                status = self.status(job_id)
+                size = os.path.getsize(self._path(job_id, "json"))
+                if os.path.exists(self._path(job_id, "pkl")):
+                    size += os.path.getsize(self._path(job_id, "pkl"))
+                # Jobs found interrupted have no finish time: their state was last written then.
+                finished = status.get("finished") or os.path.getmtime(self._path(job_id, "json"))
+            except (OSError, ValueError, AttributeError):  # removed meanwhile, or not a job state
+                continue
+            if status.get("state") in ("done", "failed"):
+                jobs.append((finished, job_id, size))
+        return sorted(jobs)
+
+    def prune(self, max_age=JOB_KEEP_SECONDS, max_bytes=JOB_STORE_BYTES):
+        """Remove old finished and failed jobs (see the class docstring); returns how many."""
+        jobs = self._finished_jobs()
+        cutoff = time.time() - max_age
+        total = sum(size for _, _, size in jobs)
+        excess = total - int(max_bytes * 0.9) if total > max_bytes else 0
+        removed = 0
+        for finished, job_id, size in jobs:
+            if finished >= cutoff and excess <= 0:
+                break
+            self.remove(job_id)
+            excess -= size
+            removed += 1
+        return removed
+
+def run_job(directory, job_id, name, filepath, partitions, schools, params):
+    """Run a job in a worker process, recording its progress and result in the job store."""
+    store = JobStore(directory)
+    started = time.time()
+
+    def progress(fraction, message):
+        store.update(job_id, state="running", progress=round(float(fraction), 3), message=message)
+
+    store.update(job_id, state="running", started=started, pid=os.getpid(), progress=0.0, message="Loading records")
+    try:
+        df = job_records(filepath, partitions, schools)
+        result = JOBS[name][0](df, progress, **params)
+        store.save_result(job_id, result)
+    except Exception as exc:
+        store.update(job_id, state="failed", error=f"{type(exc).__name__}: {exc}", finished=time.time())
+        raise
+    store.update(job_id, state="done", progress=1.0, message="Done", finished=time.time(),
+                 seconds=round(time.time() - started, 3))
+
+# ---------------------------
+# Job Queue
+# ---------------------------
+class JobQueue:
+    """
+    Runs heavy analyses (JOBS) in a pool of worker processes so they never
+    block a dashboard rerun. A job is identified by its name, parameters and
+    the fingerprint of the records it reads, so submitting the same job
+    twice (from any session, or after a restart) reuses the running or
+    finished one, and a job over changed data is a new job. Callers poll
+    status() and fetch result() once the state is "done". Old finished jobs
+    are pruned from the store (see JobStore.prune) when the queue is
+    created and whenever a new job is queued.
+    """
+    def __init__(self, directory=JOB_DIRECTORY, max_workers=JOB_WORKERS):
+        self.store = JobStore(directory)
+        self.max_workers = max_workers
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.store.prune()
+
+    def job_id(self, name, filepath, partitions=None, schools=None, **params):
+        """Identifier of a job over the current data of a dataset."""
+        if name not in JOBS:
+            raise ValueError(f"Unknown job: {name}")
+        fingerprint = ss.dataset_fingerprint(filepath, JOB_COLUMNS, partitions)
+        spec = [name, fingerprint, sorted(schools) if schools else None, sorted(params.items())]
+        return hashlib.blake2b(json.dumps(spec, default=str).encode(), digest_size=16).hexdigest()
+
+    def submit(self, name, filepath, partitions=None, schools=None, **params):
+        """Queue a job unless it is already queued, running or done, and return its id."""
+        job_id = self.job_id(name, filepath, partitions, schools, **params)
+        with self._lock:
+            status = self.store.status(job_id)
+            if status is not None and (status["state"] == "done" or self._active(job_id, status)):
+                return job_id
+            self.store.update(job_id, name=name, dataset=filepath, state="queued", progress=0.0,
+                              message="Waiting for a worker", submitted=time.time(), owner=os.getpid(),
+                              pid=None, error=None)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            future = self._executor.submit(run_job, self.store.directory, job_id, name, filepath,
+                                           partitions, list(schools) if schools else None, params)
+            future.add_done_callback(lambda f: self._finished(job_id, f))
+            self._futures[job_id] = future
+            self.store.prune()
+        return job_id
+
+    def _active(self, job_id, status):
+        """Whether a queued or running job is still being worked on (not lost with a crashed or restarted server)."""
+        if status["state"] not in ("queued", "running"):
+            return False
+        if job_id in self._futures:
+            return True
+        # Submitted by another server process: alive while its worker (or, still queued, its submitter) is.
+        pid = status.get("pid") if status["state"] == "running" else status.get("owner")
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        exc = future.exception()
+        if exc is not None and (self.store.status(job_id) or {}).get("state") != "failed":
+            # The worker died before it could record the failure.
+            self.store.update(job_id, state="failed", error=f"{type(exc).__name__}: {exc}", finished=time.time())
+
+    def status(self, job_id):
+        """State of a job: id, name, state, progress (0-1), message and, once failed, error."""
+        status = self.store.status(job_id)
+        if status is None:
+            return None
+        with self._lock:
+            if status["state"] in ("queued", "running") and not self._active(job_id, status):
+                status = self.store.update(job_id, state="failed", error="Job was interrupted")
+        return status
+
+    def result(self, job_id):
+        """Result of a finished job."""
+        return self.store.result(job_id)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,807 @@
+#survey_store.py
+import hashlib
+import io
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import survey_analysis as sa
+import survey_cache as sc
+
+try:
+    import pyarrow as pa
+except ImportError:  # decode string columns through numpy instead
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # no file locks (Windows): writers are serialised within a process only
+    fcntl = None
+
+# Dimensions indexed for filtering and group totals.
+INDEX_COLUMNS = ["school", "grade", "studentGender", "studentAge"]
+
+# Columnar copies of CSV datasets are kept in this folder next to the CSV.
+COLUMNAR_DIR = ".columnar"
+
+# -------------------------
+# SHARED READ-ONLY DATASET
+# -------------------------
+class SurveyStore:
+    """
+    Immutable, column-oriented copy of a cleaned survey DataFrame, meant to be
+    built once per server process and shared by every session.
+
+    Numeric columns are held as numpy arrays with writeable=False; Arrow-backed
+    string columns are immutable already and are kept as they are. frame()
+    hands out DataFrames whose columns are zero-copy views of these buffers:
+    sessions may add or replace columns on their frame freely, but writing
+    into a shared buffer in place raises ValueError.
+
+    With copy=False the numeric buffers of df are shared rather than copied
+    (e.g. memory-mapped columns from read_columnar); df must not be
+    modified afterwards.
+
+    `fingerprint` identifies the data for cache keys (e.g. from
+    dataset_fingerprint); it is computed from the buffers on first use
+    when not given.
+    """
+    def __init__(self, df, name=None, copy=True, fingerprint=None):
+        self.name = name
+        self.index = df.index
+        self.columns = list(df.columns)
+        self._arrays = {col: self._freeze(df[col], copy) for col in self.columns}
+        self._fingerprint = fingerprint
+        self.bitmaps = BitmapIndex(df, [col for col in INDEX_COLUMNS if col in df.columns])
+
+    @staticmethod
+    def _freeze(series, copy=True):
+        if isinstance(series.dtype, np.dtype):
+            values = series.to_numpy(copy=copy)
+            values.flags.writeable = False
+            return values
+        return series.array.copy() if copy else series.array
+
+    def __len__(self):
+        return len(self.index)
+
+    def column(self, name):
+        """Read-only array of one column."""
+        return self._arrays[name]
+
+    def frame(self, columns=None):
+        """
+        DataFrame over the shared buffers (all columns, or those in `columns`).
+        No data is copied.
+        """
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({col: self._arrays[col] for col in columns}, index=self.index, copy=False)
+
+    def filter(self, **criteria):
+        """
+        DataFrame of the rows matching `criteria` (see BitmapIndex.select);
+        the whole store when no criteria are given.
+        """
+        if not criteria:
+            return self.frame()
+        return self.frame().iloc[self.bitmaps.rows(self.bitmaps.select(**criteria))]
+
+    @property
+    def fingerprint(self):
+        """Content fingerprint of the store (see sc.frame_fingerprint), computed once."""
+        if self._fingerprint is None:
+            self._fingerprint = sc.frame_fingerprint(self.frame())
+        return self._fingerprint
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the store, in bytes."""
+        return sum(values.nbytes for values in self._arrays.values())
+
+# -------------------------
+# COLUMNAR FILES
+# -------------------------
+def write_columnar(df, directory, source=None):
+    """
+    Write df as a columnar dataset: one .npy file per column plus
+    metadata.json. Numeric columns are stored as they are; other columns
+    are dictionary-encoded as int32 codes (-1 for missing) with their
+    categories kept in the metadata. `source` (a file path) records the
+    size and modification time of the file the data came from.
+
+    The fingerprint of every column and of the index, as read back (see
+    sc.column_fingerprint), is stored too, so readers never hash the data.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index = df.index.to_numpy()
+    np.save(os.path.join(directory, "index.npy"), index)
+    columns = {}
+    for i, col in enumerate(df.columns):
+        filename = f"col_{i}.npy"
+        series = df[col]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf":
+            np.save(os.path.join(directory, filename), series.to_numpy())
+            columns[col] = {"file": filename, "kind": "numeric", "dtype": str(series.dtype),
+                            "fingerprint": sc.column_fingerprint(series)}
+        else:
+            codes, categories = pd.factorize(series)
+            codes = codes.astype(np.int32)
+            np.save(os.path.join(directory, filename), codes)
+            columns[col] = {"file": filename, "kind": "codes", "dtype": str(series.dtype),
+                            "categories": [str(value) for value in categories]}
+            columns[col]["fingerprint"] = sc.column_fingerprint(pd.Series(_decode(codes, columns[col])))
+    metadata = {"n_rows": len(df), "columns": columns, "index_fingerprint": sc.column_fingerprint(pd.Index(index))}
+    if source is not None:
+        metadata["source"] = _source_stats(source)
+    with open(os.path.join(directory, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+    return metadata
+
+def read_metadata(directory):
+    """Metadata of a columnar dataset, or None if there is none."""
+    path = os.path.join(directory, "metadata.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def read_columnar(directory, columns=None):
+    """
+    Read a columnar dataset written by write_columnar, loading and decoding
+    only `columns` (all when None; unknown names are ignored). Numeric
+    columns are memory-mapped read-only, so untouched pages are never read.
+    The stored fingerprints are registered for the loaded columns.
+    """
+    metadata = read_metadata(directory)
+    if metadata is None:
+        raise FileNotFoundError(f"No columnar dataset in {directory}")
+    names = list(metadata["columns"]) if columns is None else \
+        [col for col in columns if col in metadata["columns"]]
+    index = pd.Index(np.load(os.path.join(directory, "index.npy")))
+    series = []
+    for col in names:
+        info = metadata["columns"][col]
+        values = np.load(os.path.join(directory, info["file"]), mmap_mode="r")
+        if info["kind"] != "numeric":
+            values = _decode(values, info)
+        series.append(pd.Series(values, index=index, name=col, copy=False))
+    # One block per column: building the frame from a dict may consolidate
+    # same-dtype columns into a copied 2-D block, losing the memory maps.
+    df = pd.concat(series, axis=1) if series else pd.DataFrame(index=index)
+    if "index_fingerprint" in metadata:
+        sc.remember_fingerprint(df.index, metadata["index_fingerprint"])
+    for col in names:
+        if "fingerprint" in metadata["columns"][col]:
+            sc.remember_fingerprint(df[col], metadata["columns"][col]["fingerprint"])
+    return df
+
+def _decode(codes, info):
+    """Rebuild a dictionary-encoded column in its original dtype."""
+    if pa is not None and info["dtype"] == "str":
+        codes = np.asarray(codes)
+        dictionary = pa.DictionaryArray.from_arrays(
+            pa.array(codes, mask=codes < 0), pa.array(info["categories"], pa.large_string()))
+        return pd.array(dictionary.cast(pa.large_string()), dtype="str")
+    # Code -1 (missing) picks the trailing None.
+    categories = np.array(info["categories"] + [None], dtype=object)
+    return pd.array(categories[codes], dtype=info["dtype"])
+
+def columnar_path(filepath):
+    """Folder holding the columnar copy of a CSV dataset."""
+    folder, name = os.path.split(os.path.abspath(filepath))
+    return os.path.join(folder, COLUMNAR_DIR, os.path.splitext(name)[0])
+
+# -------------------------
+# PARTITIONS
+# -------------------------
+PARTITION_COLUMN = "school"
+PARTITION_FRAGMENTS = 2   # partitions kept per value before an append merges them into one
+RETIRED_SECONDS = 60.0    # merged-away partition folders are deleted once readers are done with them
+
+_DATASET_LOCKS = {}
+_DATASET_LOCKS_GUARD = threading.Lock()
+
+@contextmanager
+def dataset_lock(directory):
+    """
+    Exclusive lock on a partitioned dataset, held while it is written:
+    a lock file next to the folder (flock) for other processes and a
+    re-entrant lock for other threads. Nested use in one thread is fine.
+    """
+    directory = os.path.abspath(directory)
+    with _DATASET_LOCKS_GUARD:
+        state = _DATASET_LOCKS.setdefault(directory, {"lock": threading.RLock(), "depth": 0, "file": None})
+    with state["lock"]:
+        if state["depth"] == 0:
+            os.makedirs(os.path.dirname(directory), exist_ok=True)
+            state["file"] = open(directory + ".lock", "a")
+            if fcntl is not None:
+                fcntl.flock(state["file"].fileno(), fcntl.LOCK_EX)
+        state["depth"] += 1
+        try:
+            yield
+        finally:
+            state["depth"] -= 1
+            if state["depth"] == 0:
+                state["file"].close()  # releases the flock
+                state["file"] = None
+
+def write_partitioned(df, directory, by=PARTITION_COLUMN, source=None):
+    """
+    Write df as one columnar dataset per value of `by` (in part_<i>
+    folders) plus partitions.json listing each partition's value, folder,
+    row count, size on disk and column fingerprints, so readers can prune
+    partitions and build cache keys before opening any column file.
+    Holds the dataset's lock (see dataset_lock) while writing.
+    """
+    with dataset_lock(directory):
+        os.makedirs(directory, exist_ok=True)
+        codes, values = pd.factorize(df[by], use_na_sentinel=False)
+        partitions = []
+        for k, value in enumerate(values):
+            partitions.append(_write_partition(df[codes == k], directory, f"part_{k}", value))
+        metadata = {"by": by, "columns": list(df.columns), "partitions": partitions,
+                    "next_index": int(df.index.max()) + 1 if len(df) else 0}
+        if source is not None:
+            metadata["source"] = _source_stats(source)
+        _write_json(os.path.join(directory, "partitions.json"), metadata)
+        # Folders of an earlier layout (including merged-away ones) are no longer listed.
+        current = {part["path"] for part in partitions}
+        for entry in os.scandir(directory):
+            if entry.is_dir() and entry.name.startswith("part_") and entry.name not in current:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        return metadata
+
+def _source_stats(filepath):
+    """Size and modification time of a CSV, recorded with the columnar copy made from it."""
+    return {"size": os.path.getsize(filepath), "mtime": os.path.getmtime(filepath)}
+
+def _write_partition(df, directory, path, value):
+    """Write one partition with write_columnar and return its partitions.json entry."""
+    part = write_columnar(df, os.path.join(directory, path))
+    nbytes = sum(entry.stat().st_size for entry in os.scandir(os.path.join(directory, path)))
+    return {"value": None if pd.isna(value) else str(value), "path": path, "n_rows": len(df), "nbytes": nbytes,
+            "index_fingerprint": part["index_fingerprint"],
+            "fingerprints": {col: info["fingerprint"] for col, info in part["columns"].items()}}
+
+def _write_json(path, data):
+    """Replace a JSON file atomically, so readers never see it half written."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _column_layout(directory, metadata):
+    """Storage kind and dtype of every column, as written for the first partition."""
+    layout = read_metadata(os.path.join(directory, metadata["partitions"][0]["path"]))["columns"]
+    for info in layout.values():
+        if "dtype" not in info:  # copies written before dtypes were recorded
+            path = os.path.join(directory, metadata["partitions"][0]["path"], info["file"])
+            info["dtype"] = str(np.load(path, mmap_mode="r").dtype)
+    return layout
+
+def conform_rows(df, directory, metadata=None):
+    """
+    New rows for a partitioned dataset: df with the stored columns (missing
+    ones empty) cast to the stored types, labelled after the stored rows.
+    """
+    metadata = metadata or read_partitions(directory)
+    layout = _column_layout(directory, metadata)
+    next_index = metadata.get("next_index")
+    if next_index is None:
+        next_index = 1 + max((int(np.load(os.path.join(directory, part["path"], "index.npy"), mmap_mode="r").max(initial=-1))
+                              for part in metadata["partitions"]), default=-1)
+    df = df.set_axis(pd.RangeIndex(next_index, next_index + len(df)))
+    data = {}
+    for col in metadata["columns"]:
+        values = df[col] if col in df.columns else pd.Series(np.nan, index=df.index)
+        if layout[col]["kind"] == "numeric":
+            dtype = np.dtype(layout[col]["dtype"])
+            values = pd.to_numeric(values, errors="coerce")
+            if dtype.kind in "iu" and values.isna().any():
+                dtype = np.dtype(float)
+            data[col] = values.astype(dtype)
+        else:
+            data[col] = values.astype(layout[col]["dtype"])
+    return pd.DataFrame(data, index=df.index)
+
+def append_partitioned(df, directory, source=None):
+    """
+    Add the rows of df to a partitioned dataset without rewriting it: rows
+    are conformed (see conform_rows) and written as new partitions (one
+    per value of the partition column, next to any existing ones for that
+    value), then partitions.json is replaced atomically. A value that would
+    get more than PARTITION_FRAGMENTS partitions has them merged into one
+    instead, so frequent small appends keep the partition count bounded;
+    the merged-away folders are deleted RETIRED_SECONDS later, after
+    readers of the previous partitions.json are done. Row labels continue
+    after the stored rows. `source` updates the recorded CSV size and
+    modification time. Holds the dataset's lock (see dataset_lock).
+    """
+    with dataset_lock(directory):
+        metadata = read_partitions(directory)
+        rows = conform_rows(df, directory, metadata)
+        next_index = rows.index.stop if len(rows) else metadata.get("next_index", 0)
+        retired = _remove_retired(directory, metadata.get("retired", []))
+
+        codes, values = pd.factorize(rows[metadata["by"]], use_na_sentinel=False)
+        number = 1 + max((int(path.split("_")[1]) for path in
+                          [part["path"] for part in metadata["partitions"]] + [path for path, _ in retired]), default=-1)
+        for k, value in enumerate(values):
+            new = rows[codes == k]
+            key = None if pd.isna(value) else str(value)
+            existing = [part for part in metadata["partitions"] if part["value"] == key]
+            if len(existing) >= PARTITION_FRAGMENTS:
+                frames = [read_columnar(os.path.join(directory, part["path"])) for part in existing]
+                new = pd.concat(frames + [new]).sort_index()
+                metadata["partitions"] = [part for part in metadata["partitions"] if part["value"] != key]
+                retired += [(part["path"], time.time()) for part in existing]
+            metadata["partitions"].append(_write_partition(new, directory, f"part_{number + k}", value))
+        metadata["retired"] = retired
+        metadata["next_index"] = next_index
+        if source is not None:
+            metadata["source"] = _source_stats(source)
+        _write_json(os.path.join(directory, "partitions.json"), metadata)
+        return metadata
+
+def _remove_retired(directory, retired):
+    """Delete the retired partition folders older than RETIRED_SECONDS and return the (path, time) others."""
+    kept = []
+    for path, retired_at in retired:
+        if time.time() - retired_at >= RETIRED_SECONDS:
+            shutil.rmtree(os.path.join(directory, path), ignore_errors=True)
+        else:
+            kept.append((path, retired_at))
+    return kept
+
+def read_partitions(directory):
+    """Partition metadata of a partitioned dataset, or None if there is none."""
+    path = os.path.join(directory, "partitions.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def partition_metadata(filepath):
+    """
+    Partition metadata of a CSV dataset's columnar copy, (re)building the
+    copy from the cleaned CSV when missing, older than the CSV or written
+    without fingerprints. While a writer holds the dataset's lock (e.g.
+    append_dataset), a copy that looks out of date is only rebuilt if it
+    still is once the lock is released.
+    """
+    directory = columnar_path(filepath)
+    metadata = read_partitions(directory)
+    if _outdated(metadata, filepath):
+        with dataset_lock(directory):
+            metadata = read_partitions(directory)
+            if _outdated(metadata, filepath):
+                metadata = write_partitioned(sa.load_data(filepath), directory, source=filepath)
+    return metadata
+
+def _outdated(metadata, filepath):
+    """Whether partition metadata is missing or was not written for the CSV as it is now."""
+    return metadata is None or metadata.get("source") != _source_stats(filepath) or \
+        any("fingerprints" not in part for part in metadata["partitions"])
+
+def partition_table(filepath):
+    """One row per partition of a CSV dataset: value, path, n_rows and nbytes."""
+    return pd.DataFrame(partition_metadata(filepath)["partitions"])
+
+def partition_entries(metadata, partitions=None):
+    """Entries of the partitions whose value is in `partitions` (all when None)."""
+    if partitions is None:
+        return metadata["partitions"]
+    return [part for part in metadata["partitions"] if part["value"] in set(partitions)]
+
+def dataset_fingerprint(filepath, columns=None, partitions=None):
+    """
+    Fingerprint of what load_columnar(filepath, columns, partitions) returns,
+    combined from the column fingerprints in partitions.json without
+    reading any data. A changed CSV (new columnar copy) gives a new value.
+    """
+    return _metadata_fingerprint(partition_metadata(filepath), columns, partitions)
+
+def _metadata_fingerprint(metadata, columns=None, partitions=None):
+    """dataset_fingerprint from given partition metadata."""
+    names = metadata["columns"] if columns is None else [col for col in columns if col in metadata["columns"]]
+    digest = hashlib.blake2b(repr(names).encode(), digest_size=16)
+    for part in partition_entries(metadata, partitions):
+        digest.update(part["index_fingerprint"].encode())
+        for col in names:
+            digest.update(part["fingerprints"][col].encode())
+    return digest.hexdigest()
+
+def load_columnar(filepath, columns=None, partitions=None):
+    """
+    Load a CSV dataset through its columnar copy, reading only `columns`
+    (e.g. from sa.column_plan) of the partitions whose value is in
+    `partitions` (all when None). Pruned partitions are never opened. Rows
+    keep their original index and order.
+    """
+    metadata = partition_metadata(filepath)
+    directory = columnar_path(filepath)
+    selected = partition_entries(metadata, partitions)
+    frames = [read_columnar(os.path.join(directory, part["path"]), columns) for part in selected]
+    if not frames:
+        names = metadata["columns"] if columns is None else [col for col in columns if col in metadata["columns"]]
+        return pd.DataFrame(columns=names)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames).sort_index()
+
+# -------------------------
+# STORED AGGREGATES
+# -------------------------
+# Columns the aggregates are computed from.
+AGGREGATE_COLUMNS = sa.column_plan("numeracy", "english_reading", "nepali_reading")
+
+# Aggregates kept next to a dataset's columnar copy: (build from records, merge).
+# Both are additive, so new records are folded in without rescoring old ones.
+AGGREGATES = {
+    "rollup": (sa.rollup_cube, sa.merge_rollups),
+    "breakdowns": (sa.breakdown_cube, sa.merge_breakdowns)
+}
+
+def aggregate_records(df, name):
+    """Aggregate `name` of records as loaded from a dataset, with school names and grades made canonical."""
+    df = df.assign(school=sa.canonical_school_names(df["school"]), grade=sa.canonical_grades(df["grade"]))
+    return AGGREGATES[name][0](df)
+
+def load_aggregate(filepath, name):
+    """
+    Aggregate `name` (see AGGREGATES) of a CSV dataset, kept next to its
+    columnar copy and rebuilt only when the stored one was computed from
+    different data (see dataset_fingerprint).
+    """
+    fingerprint = dataset_fingerprint(filepath, AGGREGATE_COLUMNS)
+    path = os.path.join(columnar_path(filepath), f"{name}.pkl")
+    if os.path.exists(path):
+        stored = pd.read_pickle(path)
+        if stored["fingerprint"] == fingerprint:
+            return stored["table"]
+    table = aggregate_records(load_columnar(filepath, AGGREGATE_COLUMNS), name)
+    save_aggregate(filepath, name, table, fingerprint)
+    return table
+
+def save_aggregate(filepath, name, table, fingerprint=None):
+    """Store an aggregate of a CSV dataset, for the data it currently holds unless `fingerprint` is given."""
+    if fingerprint is None:
+        fingerprint = dataset_fingerprint(filepath, AGGREGATE_COLUMNS)
+    path = os.path.join(columnar_path(filepath), f"{name}.pkl")
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pd.to_pickle({"fingerprint": fingerprint, "table": table}, tmp)
+    os.replace(tmp, path)
+
+def load_rollup(filepath):
+    """Project/district/school competency rollup of a dataset (see sa.rollup_cube)."""
+    return load_aggregate(filepath, "rollup")
+
+def load_breakdowns(filepath):
+    """Per-school breakdown cube of a dataset (see sa.breakdown_cube)."""
+    return load_aggregate(filepath, "breakdowns")
+
+def stored_fingerprint(filepath):
+    """
+    dataset_fingerprint of a CSV dataset's aggregate columns, read from
+    its columnar copy as it is on disk: nothing is rebuilt or written, so
+    read-only servers can use it. Raises FileNotFoundError when there is
+    no columnar copy and returns None when it is out of date (the CSV
+    changed, or a writer such as append_dataset is updating it).
+    """
+    metadata = read_partitions(columnar_path(filepath))
+    if metadata is None:
+        raise FileNotFoundError(f"No columnar copy of {filepath}")
+    if _outdated(metadata, filepath):
+        return None
+    return _metadata_fingerprint(metadata, AGGREGATE_COLUMNS)
+
+def stored_aggregate(filepath, name, fingerprint):
+    """
+    Aggregate `name` of a CSV dataset as stored, without building it.
+    Raises FileNotFoundError when it was never stored and returns None
+    when it was computed from other data than `fingerprint` (see
+    stored_fingerprint).
+    """
+    path = os.path.join(columnar_path(filepath), f"{name}.pkl")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No stored {name} aggregate for {filepath}")
+    stored = pd.read_pickle(path)
+    return stored["table"] if stored["fingerprint"] == fingerprint else None
+
+# -------------------------
+# APPENDING RECORDS
+# -------------------------
+def append_dataset(filepath, records, deduplicated=False):
+    """
+    Append raw survey records (a DataFrame keyed by the CSV's column names)
+    to a CSV dataset and fold them into its columnar copy and stored
+    aggregates incrementally: only the new records are parsed, cleaned,
+    written and scored. Records whose anon_id repeats one earlier in the
+    batch or already in the CSV are skipped, so appending the same records
+    again changes nothing. Callers that already keep the dataset's ids
+    (e.g. offline_servers.Ingestor) pass deduplicated=True to skip reading
+    the CSV's anon_id column. Returns the number of new records that
+    passed cleaning.
+
+    Runs under the dataset's lock. The columnar copy is marked out of date
+    before it is extended and the CSV is written last, so if the process
+    dies part way the copy is rebuilt from the CSV rather than trusted.
+    """
+    directory = columnar_path(filepath)
+    with dataset_lock(directory):
+        metadata = partition_metadata(filepath)
+        header = pd.read_csv(filepath, nrows=0).columns
+        if "anon_id" in header and "anon_id" in records.columns and not deduplicated:
+            ids = records["anon_id"].astype("str")
+            records = records[ids.isna() | ~ids.duplicated()]
+            stored = pd.read_csv(filepath, usecols=["anon_id"], dtype=str)["anon_id"].dropna()
+            records = records[~records["anon_id"].astype("str").isin(stored)]
+        if records.empty:
+            return 0
+        aggregates = {name: load_aggregate(filepath, name) for name in AGGREGATES}
+        text = records.reindex(columns=header).to_csv(index=False)
+        # Parsed from CSV text, so the new rows get the values load_data would give them.
+        rows = conform_rows(sa.clean_data(pd.read_csv(io.StringIO(text))), directory, metadata)
+
+        metadata["source"] = None  # matches no CSV until the records are written to it
+        _write_json(os.path.join(directory, "partitions.json"), metadata)
+        if len(rows):
+            metadata = append_partitioned(rows, directory)
+            for name, (_, merge) in AGGREGATES.items():
+                aggregates[name] = merge(aggregates[name], aggregate_records(rows[AGGREGATE_COLUMNS], name))
+        fingerprint = _metadata_fingerprint(metadata, AGGREGATE_COLUMNS)
+        for name, table in aggregates.items():
+            save_aggregate(filepath, name, table, fingerprint)
+
+        with open(filepath, "rb") as f:
+            f.seek(max(os.path.getsize(filepath) - 1, 0))
+            newline = f.read(1) not in (b"\n", b"")
+        with open(filepath, "a", newline="") as f:
+            f.write(("\n" if newline else "") + text.split("\n", 1)[1])
+        metadata["source"] = _source_stats(filepath)
+        _write_json(os.path.join(directory, "partitions.json"), metadata)
+        return len(rows)
+
+# -------------------------
+# BITMAP INVERTED INDEX
+# -------------------------
+class BitmapIndex:
+    """
+    Inverted index from each value of a dimension to a bitmap of the rows
+    holding it, packed 64 rows per uint64 word (1/8 of a boolean mask).
+
+    A filter over several dimensions is an OR of the chosen values' bitmaps
+    within each dimension and an AND across dimensions, and group totals
+    under a filter are popcounts, so no column is scanned after the index
+    is built. Rows with a missing value are in no bitmap.
+    """
+    def __init__(self, df, columns):
+        self.n_rows = len(df)
+        self.n_words = max(-(-self.n_rows // 64), 1)
+        self.values = {}
+        self.bitmaps = {}
+        for col in columns:
+            codes, uniques = pd.factorize(df[col], sort=True)
+            self.values[col] = pd.Index(uniques)
+            self.bitmaps[col] = np.stack([self._pack(codes == k) for k in range(len(uniques))]) \
+                if len(uniques) else np.zeros((0, self.n_words), dtype=np.uint64)
+
+    def _pack(self, mask):
+        packed = np.zeros(self.n_words * 8, dtype=np.uint8)
+        bits = np.packbits(mask, bitorder='little')
+        packed[:len(bits)] = bits
+        return packed.view('<u8').astype(np.uint64)
+
+    def all_rows(self):
+        """Bitmap with every row set."""
+        return self._pack(np.ones(self.n_rows, dtype=bool))
+
+    def select(self, **criteria):
+        """
+        Bitmap of the rows matching every criterion. Each keyword names an
+        indexed column and gives one value or a list of accepted values,
+        e.g. select(school=["A", "B"], studentGender="Female").
+        Unknown values match no rows.
+        """
+        selection = self.all_rows()
+        for col, accepted in criteria.items():
+            if col not in self.bitmaps:
+                raise KeyError(f"Column '{col}' is not indexed.")
+            if np.isscalar(accepted) or accepted is None:
+                accepted = [accepted]
+            positions = self.values[col].get_indexer(list(accepted))
+            positions = positions[positions >= 0]
+            selection &= np.bitwise_or.reduce(self.bitmaps[col][positions], axis=0) \
+                if len(positions) else np.zeros(self.n_words, dtype=np.uint64)
+        return selection
+
+    def count(self, selection):
+        """Number of rows in a bitmap."""
+        return int(sa.popcount(selection[None, :])[0])
+
+    def rows(self, selection):
+        """Positions of the rows in a bitmap, in order."""
+        bits = np.unpackbits(selection.astype('<u8').view(np.uint8), count=self.n_rows, bitorder='little')
+        return np.flatnonzero(bits)
+
+    def group_counts(self, col, selection=None):
+        """
+        Number of rows holding each value of an indexed column, within
+        `selection` when given. Returns a Series indexed by value, sorted.
+        """
+        bitmaps = self.bitmaps[col] if selection is None else self.bitmaps[col] & selection
+        return pd.Series(sa.popcount(bitmaps), index=self.values[col], name="count")
+
+# -------------------------
+# RESULT STORE
+# -------------------------
+RESULT_STORE_BYTES = 512 << 20  # pickled results kept before the least recently used are evicted
+ACCESS_RESOLUTION = 60.0        # seconds; reading an entry refreshes its access time at most this often
+
+class ResultStore:
+    """
+    Analysis results (tables, figures) pickled into a SQLite file, keyed by
+    strings such as sc.MemoCache builds from the data fingerprint and call
+    arguments. The file is shared by every worker process on the machine
+    and kept across restarts: SQLite's write-ahead log lets readers go on
+    while one process writes. Once the stored results exceed `max_bytes`,
+    the least recently used are evicted (down to 90%, so writes near the
+    limit do not evict every time). The total size is kept in a one-row
+    table that triggers update in the same transaction as every write, so
+    no write has to add up the sizes.
+
+    A store that cannot be opened, read or written (locked past the
+    timeout, damaged, full disk) behaves as empty: results are then
+    computed, never lost to a cache failure.
+    """
+    def __init__(self, path, max_bytes=RESULT_STORE_BYTES, timeout=10.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        try:
+            self._db = self._open(path, timeout)
+        except (sqlite3.Error, OSError) as exc:
+            warnings.warn(f"Result store {path} cannot be opened, results are not kept: {exc!r}")
+            self._db = None
+
+    @staticmethod
+    def _open(path, timeout):
+        """Connection to the store at path, its tables created if missing."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        try:
+            db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("CREATE TABLE IF NOT EXISTS results "
+                           "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+                db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed, size)")
+                db.execute("CREATE TABLE IF NOT EXISTS results_meta "
+                           "(id INTEGER PRIMARY KEY CHECK (id = 1), total INTEGER NOT NULL)")
+                # Stores written before the running total was kept are added up once.
+                db.execute("INSERT OR IGNORE INTO results_meta SELECT 1, COALESCE(SUM(size), 0) FROM results")
+                for trigger, event, change in [("results_added", "INSERT", "NEW.size"),
+                                               ("results_removed", "DELETE", "-OLD.size"),
+                                               ("results_resized", "UPDATE OF size", "NEW.size - OLD.size")]:
+                    db.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON results "
+                               f"BEGIN UPDATE results_meta SET total = total + {change}; END")
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        except BaseException:
+            db.close()
+            raise
+        return db
+
+    def get(self, key, default=None):
+        """Stored result for key, or default."""
+        if self._db is None:
+            return default
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT value, accessed FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return default
+                now = time.time()
+                if now - row[1] > ACCESS_RESOLUTION:
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            return default
+        try:
+            return pickle.loads(row[0])
+        except Exception:  # written by code that no longer unpickles: drop it
+            self.discard(key)
+            return default
+
+    def put(self, key, value):
+        """
+        Store a result, evicting the least recently used ones when over
+        max_bytes. Results that cannot be pickled are not stored.
+        """
+        if self._db is None:
+            return
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        if len(data) > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    # An upsert (not INSERT OR REPLACE, whose delete fires no trigger) keeps the total right.
+                    self._db.execute("INSERT INTO results VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                                     "value = excluded.value, size = excluded.size, accessed = excluded.accessed",
+                                     (key, data, len(data), time.time()))
+                    evicted = self._evict()
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                if evicted:
+                    self._db.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error:
+            pass
+
+    def _evict(self):
+        total = self._db.execute("SELECT total FROM results_meta").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - int(self.max_bytes * 0.9)
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM results WHERE key = ?", keys)
+        return len(keys)
+
+    def discard(self, key):
+        """Remove one result."""
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        """Remove every result."""
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute("DELETE FROM results")
+                self._db.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error:
+            pass
+
+    def info(self):
+        """Number of stored results, their total size in bytes and max_bytes."""
+        if self._db is None:
+            return {"entries": 0, "bytes": 0, "max_bytes": self.max_bytes}
+        with self._lock:
+            entries, nbytes = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM results), total FROM results_meta").fetchone()
+        return {"entries": entries, "bytes": nbytes, "max_bytes": self.max_bytes}
+
+    def close(self):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.close()
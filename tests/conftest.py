@@ -0,0 +1,23 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import survey_analysis as sa
+
+DATASET = os.path.join(ROOT, "combined_cleaned_survey_records_Dec2025_withEAST.csv")
+
+@pytest.fixture(scope="session")
+def survey_df():
+    return sa.load_data(DATASET)
+
+@pytest.fixture
+def small_dataset(tmp_path):
+    """Path of a CSV dataset holding the first 300 records of DATASET, and the remaining records."""
+    raw = pd.read_csv(DATASET, dtype=str, keep_default_na=False)
+    path = tmp_path / "survey.csv"
+    raw.iloc[:300].to_csv(path, index=False)
+    return str(path), raw.iloc[300:].reset_index(drop=True)
@@ -0,0 +1,105 @@
+import asyncio
+import http.client
+import json
+import os
+import threading
+import pandas as pd
+import pytest
+import offline_servers as osv
+import survey_store as ss
+
+def test_ingestion_log_replay(tmp_path):
+    log = osv.IngestionLog(str(tmp_path / "survey.wal"))
+    assert log.append([{"anon_id": "a"}], device="tab-1") == 1
+    assert log.append([{"anon_id": "b"}, {"anon_id": "c"}]) == 2
+    log.close()
+    with open(log.path, "a") as f:
+        f.write('{"seq": 3, "records": [{"anon_')  # torn by a crash mid-write
+    reopened = osv.IngestionLog(log.path)
+    assert reopened.replay() == [(1, [{"anon_id": "a"}]), (2, [{"anon_id": "b"}, {"anon_id": "c"}])]
+    assert reopened.append([{"anon_id": "d"}]) == 3
+    reopened.close()
+
+def test_ingestion_log_truncate(tmp_path):
+    log = osv.IngestionLog(str(tmp_path / "survey.wal"))
+    for anon_id in "abc":
+        log.append([{"anon_id": anon_id}])
+    log.truncate(2)
+    assert log.replay() == [(3, [{"anon_id": "c"}])]
+    assert log.append([{"anon_id": "d"}]) == 4
+    log.truncate(4)
+    assert log.replay() == []
+    log.close()
+
+def test_ingestor_folds_and_deduplicates(small_dataset):
+    path, new = small_dataset
+    records = new.iloc[:20].to_dict("records")
+    ingestor = osv.Ingestor(path)
+    assert ingestor.submit(records[:10])["accepted"] == 10
+    assert ingestor.submit(records[5:]) == {"accepted": 10, "duplicates": 5, "rejected": 0}
+    assert ingestor.submit([{"school": "x"}])["rejected"] == 1
+    assert ingestor.fold() == 20
+    assert ingestor.log.replay() == []
+    ingestor.stop()
+    assert len(pd.read_csv(path, usecols=["anon_id"])) == 320
+
+def test_ingestor_replays_unfolded_records(small_dataset):
+    path, new = small_dataset
+    ingestor = osv.Ingestor(path)
+    ingestor.submit(new.iloc[:10].to_dict("records"))
+    ingestor.log.close()  # dies before folding
+    restarted = osv.Ingestor(path)
+    assert restarted.status()["pending"] == 10
+    restarted.stop()
+    assert len(pd.read_csv(path, usecols=["anon_id"])) == 310
+
+def test_ingestor_requires_anon_id(small_dataset, tmp_path):
+    path, _ = small_dataset
+    pd.read_csv(path).drop(columns="anon_id").to_csv(tmp_path / "no_ids.csv", index=False)
+    with pytest.raises(ValueError, match="anon_id"):
+        osv.Ingestor(str(tmp_path / "no_ids.csv"))
+
+def test_fold_failure_is_reported(small_dataset, monkeypatch):
+    path, new = small_dataset
+    ingestor = osv.Ingestor(path)
+    server = osv.IngestionServer(("127.0.0.1", 0), ingestor)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        ingestor.submit(new.iloc[:5].to_dict("records"))
+
+        def append_dataset(filepath, records, deduplicated=False):
+            raise OSError("disk full")
+        monkeypatch.setattr(osv.ss, "append_dataset", append_dataset)
+        connection = http.client.HTTPConnection(*server.server_address)
+        connection.request("POST", "/fold")
+        response = connection.getresponse()
+        assert response.status == 500
+        assert "disk full" in json.loads(response.read())["error"]
+        assert ingestor.status()["pending"] == 5
+    finally:
+        server.shutdown()
+        server.server_close()
+        ingestor.log.close()
+
+def _get(api, target):
+    return asyncio.run(api.respond("GET", target, {}))
+
+def test_query_api_only_reads_stored_aggregates(small_dataset):
+    path, new = small_dataset
+    api = osv.QueryAPI({"survey": path})
+    assert _get(api, "/schools?dataset=survey")[0] == 404
+    assert not os.path.exists(ss.columnar_path(path))
+
+    for name in ss.AGGREGATES:
+        ss.load_aggregate(path, name)
+    status, _, body = _get(api, "/schools?dataset=survey")
+    assert status == 200 and json.loads(body)["schools"]
+
+    with open(path, "a") as f:  # CSV changed, aggregates not rebuilt yet
+        f.write(pd.read_csv(path, dtype=str, keep_default_na=False).iloc[:1].to_csv(index=False, header=False))
+    api = osv.QueryAPI({"survey": path})
+    stored = {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(ss.columnar_path(path))}
+    status, headers, _ = _get(api, "/schools?dataset=survey")
+    assert status == 503 and "Retry-After" in headers
+    assert {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(ss.columnar_path(path))} == stored
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+import survey_analysis as sa
+
+def _records(n=400, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "school": rng.choice(["A", "B", "C"], n),
+        "grade": rng.choice(["2", "3"], n),
+        "studentAge": rng.integers(7, 14, n),
+        "studentGender": rng.choice(["Female", "Male"], n)
+    }), rng
+
+def test_gender_parity_single_school_se_uses_students_as_clusters():
+    df, rng = _records()
+    df = df[df["school"] == "A"]
+    conditions = {"met": pd.Series(rng.random(len(df)) < 0.4, index=df.index)}
+    weights = rng.uniform(0.5, 2, len(df))
+    parity = sa.gender_parity(df, conditions, subgroups={"all": lambda cells: np.ones(len(cells), dtype=bool)},
+                              breakdowns=[], weights=weights)
+    results = sa.results_frame(df, conditions, dimensions={}, weights=weights)
+    assert np.isfinite(parity["se"]).all()
+    np.testing.assert_allclose(parity["se"].to_numpy(), results["se"].to_numpy())
+    assert np.isfinite(parity[["ci_lower", "ci_upper"]].to_numpy()).all()
+
+def test_gender_parity_interval_with_a_zero_rate():
+    df, rng = _records()
+    conditions = {"boys_only": (df["studentGender"] == "Male") & (rng.random(len(df)) < 0.2)}
+    parity = sa.gender_parity(df, conditions)
+    assert (parity["female_rate"] == 0).all() and (parity["gpi"] == 0).all()
+    assert np.isfinite(parity[["ci_lower", "ci_upper"]].to_numpy()).all()
+    assert ((parity["ci_lower"] > 0) & (parity["ci_lower"] < parity["ci_upper"]) & (parity["ci_upper"] < 1.5)).all()
+
+def test_plot_reading_results_accepts_legacy_dict(survey_df):
+    ids = sa.long_eng_reading_ids
+    legacy = sa.reading_analysis(survey_df, ids, printText=False)
+    plots = sa.plot_reading_results(legacy, survey_df, 800)
+    overall = {trace.name: trace.y[0] for trace in plots["fig_overall"].data}
+    for key, label in zip(["analysis_one", "analysis_two", "analysis_three", "analysis_four"],
+                          sa.READING_LABELS.values()):
+        assert np.isclose(overall[label], legacy[key]["percentage_meeting"])
+    female = next(trace for trace in plots["fig_gender"].data if trace.name == "Female")
+    assert np.allclose(female.y, [legacy["analysis_gender"]["Female"][key] for key in sa.READING_LABELS])
+    assert plots["fig_overall"].layout.width == 800
+    with pytest.raises(TypeError):
+        sa.plot_reading_results(legacy)
+    assert sa.plot_reading_results(sa.reading_analysis(survey_df, ids, printText=False, as_frame=True))["fig_grade"]
+
+def test_results_frame_matches_legacy_numeracy_dicts(survey_df):
+    legacy = sa.numeracy_analysis(survey_df, sa.numeracy_ids, printText=False)
+    table = sa.numeracy_analysis(survey_df, sa.numeracy_ids, printText=False, as_frame=True)
+    overall = table[table["dimension"] == "overall"].set_index("competency")
+    for key, competency in zip(["analysis_one", "analysis_two", "analysis_three", "analysis_four", "analysis_five"],
+                               sa.NUMERACY_LABELS):
+        assert overall.loc[competency, "count"] == legacy[key]["count_meeting"]
+        assert overall.loc[competency, "total"] == legacy[key]["total_students"]
+    for dimension in ["age", "grade"]:
+        rows = table[table["dimension"] == dimension].set_index(["competency", "group"])
+        for competency, groups in legacy[f"analysis_{dimension}"].items():
+            for group, result in groups.items():
+                assert rows.loc[(competency, group), "count"] == result["count_meeting"]
+                assert rows.loc[(competency, group), "total"] == result["total_students"]
+
+@pytest.mark.parametrize("ids,lang", [(sa.long_eng_reading_ids, "English"), (sa.long_nep_reading_ids, "Nepali")])
+def test_threshold_sweep_matches_reading_analysis(survey_df, ids, lang):
+    sweep = sa.reading_threshold_sweep(survey_df, ids, lang=lang, weights=None)
+    analysis = sa.reading_analysis(survey_df, ids, lang=lang, printText=False, as_frame=True)
+    at_90 = sa.threshold_results(sweep, 90)
+    keys = ["dimension", "group", "competency"]
+    pd.testing.assert_frame_equal(
+        at_90.set_index(keys)[["count", "total"]].sort_index(),
+        analysis.set_index(keys)[["count", "total"]].sort_index(),
+        check_dtype=False
+    )
+    # Fewer students meet a higher cutoff.
+    overall = sweep[(sweep["dimension"] == "overall") & (sweep["competency"] == "read_words")]
+    assert overall.sort_values("threshold")["count"].is_monotonic_decreasing
+
+def _responses(n_students=300, n_items=70, seed=3):
+    rng = np.random.default_rng(seed)
+    ids = [f"Q{k}" for k in range(n_items)]
+    answers = rng.choice(np.array(["Correct", "Incorrect", None], dtype=object), (n_students, n_items), p=[0.6, 0.3, 0.1])
+    return pd.DataFrame(answers, columns=ids, index=np.arange(100, 100 + n_students)), ids
+
+def test_response_bits_match_pandas():
+    df, ids = _responses()
+    bits = sa.ResponseBits(df, ids)
+    assert bits.correct.shape == (len(df), 2)  # 70 items span two words
+    for subset in [ids[:3], ids[60:70], ids[::7], ids]:
+        correct = (df[subset] == "Correct")
+        np.testing.assert_array_equal(bits.all_correct(subset), correct.all(axis=1).to_numpy())
+        np.testing.assert_array_equal(bits.correct_count(subset), correct.sum(axis=1).to_numpy())
+        np.testing.assert_array_equal(bits.answered_count(subset), df[subset].notna().sum(axis=1).to_numpy())
+        expected = (correct.sum(axis=1) / df[subset].notna().sum(axis=1)).to_numpy()
+        np.testing.assert_allclose(bits.proportion_correct(subset), expected, equal_nan=True)
+
+@pytest.mark.parametrize("bitwise_count", [True, False])
+def test_popcount_counts_every_bit(monkeypatch, bitwise_count):
+    if not bitwise_count:  # numpy < 2.0: byte lookup table
+        monkeypatch.delattr(np, "bitwise_count", raising=False)
+    words = np.array([[0, 1, 2**64 - 1], [2**63, 3, 0]], dtype=np.uint64)
+    np.testing.assert_array_equal(sa.popcount(words), [65, 3])
+
+@pytest.mark.parametrize("ids,lang", [(sa.long_eng_reading_ids, "English"), (sa.long_nep_reading_ids, "Nepali")])
+def test_reading_dicts_score_each_school_on_its_story(survey_df, ids, lang):
+    legacy = sa.reading_analysis(survey_df, ids, lang=lang, printText=False)
+    table = sa.reading_analysis(survey_df, ids, lang=lang, printText=False, as_frame=True)
+    overall = table[table["dimension"] == "overall"].set_index("competency")["count"]
+    for key, competency in zip(["analysis_one", "analysis_two", "analysis_three", "analysis_four"], sa.READING_LABELS):
+        assert legacy[key]["count_meeting"] == overall[competency]
+    gender = table[table["dimension"] == "gender"].set_index(["group", "competency"])["count"]
+    for name, result in legacy["analysis_one"]["gender_results"].items():
+        assert result["count"] == gender[(name, "read_words")]
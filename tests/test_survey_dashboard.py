@@ -0,0 +1,23 @@
+import os
+import survey_cache as sc
+import survey_dashboard as sd
+import survey_store as ss
+
+def test_warm_up_fills_the_result_store_the_dashboard_reads(small_dataset, tmp_path):
+    path, _ = small_dataset
+    results = str(tmp_path / "results.sqlite")
+    try:
+        sc.enable_memoization(store=ss.ResultStore(results))
+        sd.warm_up(path)
+        assert os.path.exists(os.path.join(ss.columnar_path(path), "rollup.pkl"))
+        # A new server process (empty memo cache) finds the default view in the store.
+        sc.disable_memoization()
+        sc.enable_memoization(store=ss.ResultStore(results))
+        before = sc.memo_info()
+        sd.warm_up_view(sd.load_frame(path))
+        after = sc.memo_info()
+    finally:
+        sc.disable_memoization()
+    computed = after["misses"] - before["misses"]
+    assert computed > 0
+    assert after["stored_hits"] - before["stored_hits"] == computed
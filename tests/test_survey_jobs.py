@@ -0,0 +1,27 @@
+import os
+import time
+import survey_jobs as sj
+
+def test_job_store_prunes_old_and_excess_finished_jobs(tmp_path):
+    store = sj.JobStore(str(tmp_path))
+    now = time.time()
+    store.update("old", state="done", finished=now - sj.JOB_KEEP_SECONDS - 60)
+    store.save_result("old", b"x" * 1000)
+    store.update("interrupted", state="failed", error="Job was interrupted")
+    stale = now - sj.JOB_KEEP_SECONDS - 60
+    os.utime(store._path("interrupted", "json"), (stale, stale))
+    store.update("running", state="running", started=now - sj.JOB_KEEP_SECONDS - 60)
+    for i in range(3):
+        store.update(f"recent{i}", state="done", finished=now - 30 + i)
+        store.save_result(f"recent{i}", b"x" * 1000)
+
+    assert store.prune() == 2
+    assert store.status("old") is None and not os.path.exists(store._path("old", "pkl"))
+    assert store.status("interrupted") is None
+    assert store.status("running") is not None
+
+    # Over the size limit, the oldest finished jobs go first.
+    assert store.prune(max_bytes=2000) == 2
+    assert [store.status(f"recent{i}") is not None for i in range(3)] == [False, False, True]
+    assert store.result("recent2") == b"x" * 1000
+    assert store.status("running") is not None
@@ -0,0 +1,166 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import survey_analysis as sa
+import survey_cache as sc
+import survey_store as ss
+
+def _memory_map(values):
+    """The np.memmap an array's data lives in, if any."""
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return values
+        values = values.base
+    return None
+
+def test_read_columnar_round_trip(survey_df, tmp_path):
+    ss.write_columnar(survey_df, tmp_path)
+    df = ss.read_columnar(tmp_path)
+    assert df.equals(survey_df)
+    assert sc.frame_fingerprint(df) == sc.frame_fingerprint(survey_df)
+
+def test_read_columnar_keeps_memory_maps(survey_df, tmp_path):
+    ss.write_columnar(survey_df, tmp_path)
+    metadata = ss.read_metadata(tmp_path)
+    numeric = [col for col, info in metadata["columns"].items() if info["kind"] == "numeric"]
+    df = ss.read_columnar(tmp_path, numeric)
+    assert numeric
+    for col in numeric:
+        values = df[col].to_numpy()
+        mapped = _memory_map(values)
+        assert mapped is not None and np.shares_memory(values, mapped)
+        assert mapped.filename == str(tmp_path / metadata["columns"][col]["file"])
+
+def test_append_dataset_matches_rebuild(small_dataset):
+    path, new = small_dataset
+    ss.load_rollup(path)
+    ss.append_dataset(path, new.iloc[:200])
+    rebuilt = sa.load_data(path)
+    assert len(ss.load_columnar(path)) == len(rebuilt)
+    pd.testing.assert_frame_equal(ss.load_rollup(path), ss.aggregate_records(rebuilt, "rollup"))
+
+def test_append_dataset_is_idempotent(small_dataset):
+    path, new = small_dataset
+    first = ss.append_dataset(path, new.iloc[:100])
+    csv_size = os.path.getsize(path)
+    metadata = ss.partition_metadata(path)
+    rollup = ss.load_rollup(path)
+    assert first > 0
+    assert ss.append_dataset(path, new.iloc[:100]) == 0
+    assert os.path.getsize(path) == csv_size
+    assert ss.partition_metadata(path) == metadata
+    pd.testing.assert_frame_equal(ss.load_rollup(path), rollup)
+    # Only the records not yet in the CSV are added.
+    stored = pd.read_csv(path, usecols=["anon_id"], dtype=str)["anon_id"]
+    added = new.iloc[50:150]
+    ss.append_dataset(path, added)
+    assert len(pd.read_csv(path, usecols=["anon_id"])) == len(stored) + (~added["anon_id"].isin(stored)).sum()
+
+def test_interrupted_append_is_rebuilt_from_csv(small_dataset):
+    path, new = small_dataset
+    metadata = ss.partition_metadata(path)
+    # As left by an append that died before writing the CSV: partitions marked out of date.
+    metadata["source"] = None
+    ss._write_json(os.path.join(ss.columnar_path(path), "partitions.json"), metadata)
+    assert ss.partition_metadata(path)["source"] == ss._source_stats(path)
+    assert len(ss.load_columnar(path)) == len(sa.load_data(path))
+
+def _stored_sizes(store):
+    return store._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+def test_result_store_round_trip(tmp_path):
+    store = ss.ResultStore(str(tmp_path / "results.sqlite"))
+    table = pd.DataFrame({"a": [1, 2]})
+    store.put("table", table)
+    pd.testing.assert_frame_equal(store.get("table"), table)
+    assert store.get("missing", "default") == "default"
+    store.put("table", "replaced")
+    assert store.get("table") == "replaced"
+    store.put("other", list(range(100)))
+    assert store.info()["entries"] == 2 and store.info()["bytes"] == _stored_sizes(store)
+    store.discard("other")
+    assert store.info()["bytes"] == _stored_sizes(store)
+    store.clear()
+    assert store.info() == {"entries": 0, "bytes": 0, "max_bytes": store.max_bytes}
+    store.close()
+
+def test_result_store_evicts_least_recently_used(tmp_path, monkeypatch):
+    store = ss.ResultStore(str(tmp_path / "results.sqlite"), max_bytes=10_000)
+    clock = iter(range(1_000_000))
+    monkeypatch.setattr(ss.time, "time", lambda: float(next(clock)) * 1000)
+    for k in range(4):
+        store.put(f"r{k}", b"x" * 2_000)
+    assert store.get("r0") is not None  # refreshes r0
+    store.put("r4", b"x" * 2_000)
+    store.put("r5", b"x" * 2_000)
+    assert store.get("r1") is None and store.get("r0") is not None
+    info = store.info()
+    assert info["bytes"] <= store.max_bytes and info["bytes"] == _stored_sizes(store)
+    store.put("huge", b"x" * 20_000)  # larger than the store: not kept
+    assert store.get("huge") is None
+    store.close()
+
+def test_result_store_totals_an_existing_file(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    store = ss.ResultStore(path)
+    store.put("a", b"x" * 500)
+    store._db.execute("DROP TABLE results_meta")  # as written before the running total was kept
+    store.close()
+    reopened = ss.ResultStore(path)
+    assert reopened.info()["bytes"] == _stored_sizes(reopened) > 500
+    reopened.close()
+
+def test_result_store_skips_results_it_cannot_pickle(tmp_path):
+    store = ss.ResultStore(str(tmp_path / "results.sqlite"))
+    store.put("lambda", lambda: None)
+    store.put("lock", threading.Lock())
+    assert store.get("lambda") is None and store.get("lock") is None
+    assert store.info()["entries"] == 0
+    store.close()
+
+def test_damaged_result_store_behaves_as_empty(tmp_path):
+    path = tmp_path / "results.sqlite"
+    path.write_bytes(b"not a database" * 100)
+    with pytest.warns(UserWarning, match="cannot be opened"):
+        store = ss.ResultStore(str(path))
+    store.put("table", pd.DataFrame({"a": [1]}))
+    assert store.get("table", "default") == "default"
+    store.discard("table")
+    store.clear()
+    assert store.info()["entries"] == 0
+    store.close()
+
+def test_read_columnar_registers_stored_fingerprints(survey_df, tmp_path, monkeypatch):
+    expected = sc.frame_fingerprint(survey_df)
+    ss.write_columnar(survey_df, tmp_path)
+    df = ss.read_columnar(tmp_path)
+    hashed = []
+    value_chunks = sc._value_chunks
+    monkeypatch.setattr(sc, "_value_chunks", lambda *args, **kwargs: hashed.append(args) or value_chunks(*args, **kwargs))
+    assert sc.frame_fingerprint(df) == expected
+    assert not hashed  # every column's fingerprint came from the metadata
+
+def test_small_appends_keep_partitions_bounded(small_dataset, monkeypatch):
+    path, new = small_dataset
+    monkeypatch.setattr(ss, "RETIRED_SECONDS", 0.0)
+    ss.load_rollup(path)
+    for start in range(0, 200, 10):
+        ss.append_dataset(path, new.iloc[start:start + 10])
+    metadata = ss.partition_metadata(path)
+    per_value = pd.Series([part["value"] for part in metadata["partitions"]]).value_counts()
+    assert per_value.max() <= ss.PARTITION_FRAGMENTS
+    directory = ss.columnar_path(path)
+    folders = {entry.name for entry in os.scandir(directory) if entry.is_dir()}
+    assert folders - {part["path"] for part in metadata["partitions"]} <= {path for path, _ in metadata["retired"]}
+    rebuilt = sa.load_data(path)
+    assert ss.load_columnar(path).astype(str).reset_index(drop=True).equals(rebuilt.astype(str).reset_index(drop=True))
+    pd.testing.assert_frame_equal(ss.load_rollup(path), ss.aggregate_records(rebuilt, "rollup"))
+
+def test_append_dataset_drops_repeated_ids_within_a_batch(small_dataset):
+    path, new = small_dataset
+    batch = pd.concat([new.iloc[:5], new.iloc[:5]])
+    before = len(pd.read_csv(path, usecols=["anon_id"]))
+    ss.append_dataset(path, batch)
+    assert len(pd.read_csv(path, usecols=["anon_id"])) == before + new.iloc[:5]["anon_id"].nunique()